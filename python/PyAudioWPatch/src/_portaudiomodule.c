@@ -25,7 +25,9 @@
  */
 
 #include <assert.h>
+#include <stdint.h>
 #include <stdio.h>
+#include <string.h>
 #define PY_SSIZE_T_CLEAN
 #include "Python.h"
 #include "portaudio.h"
@@ -33,6 +35,8 @@
 
 #ifdef _WIN32
 #include "pa_win_wasapi.h"
+#define COBJMACROS
+#include <mmdeviceapi.h>
 #endif
 
 //Due to the way the loopback mode is checked -> the flag must be of type int
@@ -44,6 +48,10 @@
 #include "pa_mac_core.h"
 #endif
 
+#ifndef _WIN32
+#include <time.h>
+#endif
+
 #define DEFAULT_FRAMES_PER_BUFFER paFramesPerBufferUnspecified
 /* #define VERBOSE */
 
@@ -63,6 +71,7 @@
  *     - Stream Open/Close
  *     - Stream Start/Stop/Info
  *     - Stream Read/Write
+ *     - Sample Conversion
  * IV. Python Module Init
  *     - PaHostApiTypeId enum constants
  *
@@ -114,6 +123,12 @@ static PyMethodDef paMethods[] = {
     {"get_device_info", pa_get_device_info, METH_VARARGS,
      "get device information"},
 
+    {"update_device_list", pa_update_device_list, METH_VARARGS,
+     "refresh the WASAPI device list in place"},
+
+    {"get_default_endpoint_id", pa_get_default_endpoint_id, METH_VARARGS,
+     "get the endpoint ID of the current default WASAPI device"},
+
     /* stream open/close */
     {"open", (PyCFunction)pa_open, METH_VARARGS | METH_KEYWORDS,
      "open port audio stream"},
@@ -136,10 +151,16 @@ static PyMethodDef paMethods[] = {
      "returns stream time"},
     {"get_stream_cpu_load", pa_get_stream_cpu_load, METH_VARARGS,
      "returns stream CPU load -- always 0 for blocking mode"},
+    {"set_callback_stats", pa_set_callback_stats, METH_VARARGS,
+     "enables or disables callback timing statistics"},
+    {"get_callback_stats", pa_get_callback_stats, METH_VARARGS,
+     "returns callback timing statistics -- None for blocking mode"},
 
     /* stream read/write */
     {"write_stream", pa_write_stream, METH_VARARGS, "write to stream"},
     {"read_stream", pa_read_stream, METH_VARARGS, "read from stream"},
+    {"read_stream_into", pa_read_stream_into, METH_VARARGS,
+     "read from stream into a writable buffer"},
 
     {"get_stream_write_available", pa_get_stream_write_available, METH_VARARGS,
      "get buffer available for writing"},
@@ -147,6 +168,20 @@ static PyMethodDef paMethods[] = {
     {"get_stream_read_available", pa_get_stream_read_available, METH_VARARGS,
      "get buffer available for reading"},
 
+    /* sample conversion */
+    {"int24_to_int32", pa_int24_to_int32, METH_VARARGS,
+     "convert packed 24 bit samples to 32 bit int samples"},
+    {"int24_to_float32", pa_int24_to_float32, METH_VARARGS,
+     "convert packed 24 bit samples to 32 bit float samples"},
+    {"int32_to_int24", pa_int32_to_int24, METH_VARARGS,
+     "convert 32 bit int samples to packed 24 bit samples"},
+    {"float32_to_int24", pa_float32_to_int24, METH_VARARGS,
+     "convert 32 bit float samples to packed 24 bit samples"},
+    {"int16_to_float32", pa_int16_to_float32, METH_VARARGS,
+     "convert 16 bit int samples to 32 bit float samples"},
+    {"float32_to_int16", pa_float32_to_int16, METH_VARARGS,
+     "convert 32 bit float samples to 16 bit int samples"},
+
     {NULL, NULL, 0, NULL}};
 
 /************************************************************
@@ -166,6 +201,10 @@ typedef struct {
   
   /*WASAPI loopback mode flag*/
   LoopBackFlag loopBack;
+
+  /*WASAPI endpoint ID (str), shared by a render device and its loopback;
+    None for other host APIs*/
+  PyObject *endpointId;
   // clang-format on
 } _pyAudio_paDeviceInfo;
 
@@ -283,6 +322,17 @@ static PyObject *_pyAudio_paDeviceInfo_get_isLoopback(
   }
 }
 
+static PyObject *_pyAudio_paDeviceInfo_get_endpointId(
+    _pyAudio_paDeviceInfo *self, void *closure) {
+  if (!self->devInfo) {
+    PyErr_SetString(PyExc_AttributeError, "No Device Info available");
+    return NULL;
+  }
+
+  Py_INCREF(self->endpointId);
+  return self->endpointId;
+}
+
 static int _pyAudio_paDeviceInfo_antiset(_pyAudio_paDeviceInfo *self,
                                          PyObject *value, void *closure) {
   /* read-only: do not allow users to change values */
@@ -330,10 +380,15 @@ static PyGetSetDef _pyAudio_paDeviceInfo_getseters[] = {
     {"isLoopbackDevice", (getter)_pyAudio_paDeviceInfo_get_isLoopback,
      (setter)_pyAudio_paDeviceInfo_antiset, "is loopback device", NULL},
 
+    {"endpointId", (getter)_pyAudio_paDeviceInfo_get_endpointId,
+     (setter)_pyAudio_paDeviceInfo_antiset, "WASAPI endpoint ID", NULL},
+
     {NULL}};
 
 static void _pyAudio_paDeviceInfo_dealloc(_pyAudio_paDeviceInfo *self) {
   self->devInfo = NULL;
+  Py_XDECREF(self->endpointId);
+  self->endpointId = NULL;
   Py_TYPE(self)->tp_free((PyObject *)self);
 }
 
@@ -769,10 +824,30 @@ static PyTypeObject _pyAudio_MacOSX_hostApiSpecificStreamInfoType = {
  * Stream Wrapper Python Object
  *************************************************************/
 
+/* Bucket i counts durations in [2^(i-1), 2^i) microseconds (bucket 0: under
+ * 1 us); the last bucket is open-ended. */
+#define CALLBACK_STATS_BUCKETS 24
+
+typedef struct {
+  uint64_t count;
+  uint64_t total_ns;
+  uint64_t max_ns;
+  uint64_t buckets[CALLBACK_STATS_BUCKETS];
+} PyAudioTimingHistogram;
+
 typedef struct {
   PyObject *callback;
   long main_thread_id;
   unsigned int frame_size;
+
+  /* Callback timing statistics. Only the callback thread updates the
+   * histograms, and it does so while holding the GIL, so readers (which hold
+   * the GIL too) see consistent values without a lock of their own. */
+  volatile int stats_enabled;
+  uint64_t last_call_ns;
+  PyAudioTimingHistogram gil_wait;
+  PyAudioTimingHistogram callback_time;
+  PyAudioTimingHistogram interval;
 } PyAudioCallbackContext;
 
 typedef struct {
@@ -1243,6 +1318,40 @@ static PyObject *pa_get_default_output_device(PyObject *self, PyObject *args) {
   return PyLong_FromLong(index);
 }
 
+#ifdef PA_WIN_WASAPI_H
+/* Endpoint ID of a WASAPI device (IMMDevice::GetId), or None */
+static PyObject *_get_wasapi_endpoint_id(PaDeviceIndex index) {
+#ifndef PA_WINRT
+  IMMDevice *device = NULL;
+  LPWSTR id = NULL;
+  PyObject *result;
+  HRESULT hr;
+
+  if (PaWasapi_GetIMMDevice(index, (void **)&device) != paNoError ||
+      device == NULL) {
+    Py_RETURN_NONE;
+  }
+
+  // clang-format off
+  Py_BEGIN_ALLOW_THREADS
+  hr = IMMDevice_GetId(device, &id);
+  Py_END_ALLOW_THREADS
+  // clang-format on
+
+  if (FAILED(hr) || id == NULL) {
+    Py_RETURN_NONE;
+  }
+
+  result = PyUnicode_FromWideChar(id, -1);
+  CoTaskMemFree(id);
+  return result;
+#else
+  (void)index;
+  Py_RETURN_NONE;
+#endif
+}
+#endif
+
 static PyObject *pa_get_device_info(PyObject *self, PyObject *args) {
   PaDeviceIndex index;
   PaDeviceInfo *_info;
@@ -1264,24 +1373,180 @@ static PyObject *pa_get_device_info(PyObject *self, PyObject *args) {
 #ifdef PA_WIN_WASAPI_H
   const PaHostApiInfo* currentHostApi = Pa_GetHostApiInfo(py_info->devInfo->hostApi);
   py_info->loopBack = currentHostApi->type == paWASAPI ? PaWasapi_IsLoopback(index) : 0;
+  py_info->endpointId = currentHostApi->type == paWASAPI
+                            ? _get_wasapi_endpoint_id(index)
+                            : (Py_INCREF(Py_None), Py_None);
 #else
   py_info->loopBack = 0;
+  Py_INCREF(Py_None);
+  py_info->endpointId = Py_None;
 #endif
+  if (py_info->endpointId == NULL) {
+    Py_DECREF(py_info);
+    return NULL;
+  }
   return (PyObject *)py_info;
 }
 
+static PyObject *pa_update_device_list(PyObject *self, PyObject *args) {
+#ifdef PA_WIN_WASAPI_H
+  int err;
+
+  // clang-format off
+  Py_BEGIN_ALLOW_THREADS
+  err = PaWasapi_UpdateDeviceList();
+  Py_END_ALLOW_THREADS
+  // clang-format on
+
+  if (err == paNoError) {
+    Py_RETURN_TRUE;
+  }
+
+  // paInternalError: PortAudio was built without
+  // PA_WASAPI_MAX_CONST_DEVICE_COUNT, the caller has to reinitialize instead
+  if (err != paInternalError) {
+    PyErr_SetObject(PyExc_IOError,
+                    Py_BuildValue("(i,s)", err, Pa_GetErrorText(err)));
+    return NULL;
+  }
+#endif
+
+  Py_RETURN_FALSE;
+}
+
+#if defined(PA_WIN_WASAPI_H) && !defined(PA_WINRT)
+/* {BCDE0395-E52F-467C-8E3D-C4579291692E} */
+static const CLSID _CLSID_MMDeviceEnumerator = {
+    0xBCDE0395, 0xE52F, 0x467C, {0x8E, 0x3D, 0xC4, 0x57, 0x92, 0x91, 0x69, 0x2E}};
+/* {A95664D2-9614-4F35-A746-DE8DB63617E6} */
+static const IID _IID_IMMDeviceEnumerator = {
+    0xA95664D2, 0x9614, 0x4F35, {0xA7, 0x46, 0xDE, 0x8D, 0xB6, 0x36, 0x17, 0xE6}};
+#endif
+
+/* Asks Windows (not PortAudio's device list, which is only refreshed by
+ * update_device_list) for the current default endpoint, so it is safe to
+ * poll while streams are open. */
+static PyObject *pa_get_default_endpoint_id(PyObject *self, PyObject *args) {
+  int output;
+
+  if (!PyArg_ParseTuple(args, "p", &output)) {
+    return NULL;
+  }
+
+#if defined(PA_WIN_WASAPI_H) && !defined(PA_WINRT)
+  IMMDeviceEnumerator *enumerator = NULL;
+  IMMDevice *device = NULL;
+  LPWSTR id = NULL;
+  PyObject *result;
+  HRESULT init, hr;
+
+  // clang-format off
+  Py_BEGIN_ALLOW_THREADS
+  // RPC_E_CHANGED_MODE: COM is already initialized as STA, which works too
+  init = CoInitializeEx(NULL, COINIT_MULTITHREADED);
+  hr = CoCreateInstance(&_CLSID_MMDeviceEnumerator, NULL, CLSCTX_ALL,
+                        &_IID_IMMDeviceEnumerator, (void **)&enumerator);
+  if (SUCCEEDED(hr)) {
+    hr = IMMDeviceEnumerator_GetDefaultAudioEndpoint(
+        enumerator, output ? eRender : eCapture, eMultimedia, &device);
+    IMMDeviceEnumerator_Release(enumerator);
+  }
+  if (SUCCEEDED(hr)) {
+    hr = IMMDevice_GetId(device, &id);
+    IMMDevice_Release(device);
+  }
+  Py_END_ALLOW_THREADS
+  // clang-format on
+
+  // no default device (E_NOTFOUND) or no COM: the caller cannot tell
+  if (FAILED(hr) || id == NULL) {
+    result = Py_None;
+    Py_INCREF(result);
+  } else {
+    result = PyUnicode_FromWideChar(id, -1);
+    CoTaskMemFree(id);
+  }
+  if (SUCCEEDED(init)) {
+    CoUninitialize();
+  }
+  return result;
+#else
+  (void)output;
+  Py_RETURN_NONE;
+#endif
+}
+
 /*************************************************************
  * Stream Open / Close / Supported
  *************************************************************/
 
+static uint64_t _monotonic_ns(void) {
+#ifdef _WIN32
+  static LARGE_INTEGER frequency;
+  LARGE_INTEGER counter;
+  if (frequency.QuadPart == 0) {
+    QueryPerformanceFrequency(&frequency);
+  }
+  QueryPerformanceCounter(&counter);
+  // split to avoid overflowing the multiplication
+  return (uint64_t)(counter.QuadPart / frequency.QuadPart) * 1000000000ULL +
+         (uint64_t)(counter.QuadPart % frequency.QuadPart) * 1000000000ULL /
+             (uint64_t)frequency.QuadPart;
+#else
+  struct timespec now;
+  clock_gettime(CLOCK_MONOTONIC, &now);
+  return (uint64_t)now.tv_sec * 1000000000ULL + (uint64_t)now.tv_nsec;
+#endif
+}
+
+static void _timing_histogram_add(PyAudioTimingHistogram *histogram,
+                                  uint64_t ns) {
+  uint64_t us = ns / 1000;
+  int bucket = 0;
+  while (us && bucket < CALLBACK_STATS_BUCKETS - 1) {
+    us >>= 1;
+    bucket++;
+  }
+
+  histogram->count++;
+  histogram->total_ns += ns;
+  if (ns > histogram->max_ns) {
+    histogram->max_ns = ns;
+  }
+  histogram->buckets[bucket]++;
+}
+
+static void _reset_callback_stats(PyAudioCallbackContext *context) {
+  context->last_call_ns = 0;
+  memset(&context->gil_wait, 0, sizeof(PyAudioTimingHistogram));
+  memset(&context->callback_time, 0, sizeof(PyAudioTimingHistogram));
+  memset(&context->interval, 0, sizeof(PyAudioTimingHistogram));
+}
+
 int _stream_callback_cfunction(const void *input, void *output,
                                unsigned long frameCount,
                                const PaStreamCallbackTimeInfo *timeInfo,
                                PaStreamCallbackFlags statusFlags,
                                void *userData) {
   int return_val = paAbort;
+  PyAudioCallbackContext *context = (PyAudioCallbackContext *)userData;
+  // A single flag test when statistics are off; the flag is sampled once so
+  // an invocation is either timed completely or not at all.
+  int timed = context->stats_enabled;
+  uint64_t entered_ns = timed ? _monotonic_ns() : 0;
+  uint64_t call_ns = 0;
   PyGILState_STATE _state = PyGILState_Ensure();
 
+  if (timed) {
+    uint64_t acquired_ns = _monotonic_ns();
+    _timing_histogram_add(&context->gil_wait, acquired_ns - entered_ns);
+    if (context->last_call_ns) {
+      _timing_histogram_add(&context->interval,
+                            entered_ns - context->last_call_ns);
+    }
+    context->last_call_ns = entered_ns;
+  }
+
 #ifdef VERBOSE
   if (statusFlags != 0) {
     printf("Status flag set: ");
@@ -1303,7 +1568,6 @@ int _stream_callback_cfunction(const void *input, void *output,
   }
 #endif
 
-  PyAudioCallbackContext *context = (PyAudioCallbackContext *)userData;
   PyObject *py_callback = context->callback;
   unsigned int bytes_per_frame = context->frame_size;
   long main_thread_id = context->main_thread_id;
@@ -1329,10 +1593,18 @@ int _stream_callback_cfunction(const void *input, void *output,
         PyBytes_FromStringAndSize(input, bytes_per_frame * frameCount);
   }
 
+  if (timed) {
+    call_ns = _monotonic_ns();
+  }
+
   py_result =
       PyObject_CallFunctionObjArgs(py_callback, py_input_data, py_frame_count,
                                    py_time_info, py_status_flags, NULL);
 
+  if (timed) {
+    _timing_histogram_add(&context->callback_time, _monotonic_ns() - call_ns);
+  }
+
   if (py_result == NULL) {
 #ifdef VERBOSE
     fprintf(stderr, "An error occured while using the portaudio stream\n");
@@ -1633,6 +1905,7 @@ static PyObject *pa_open(PyObject *self, PyObject *args, PyObject *kwargs) {
   if (stream_callback) {
     Py_INCREF(stream_callback);
     context = (PyAudioCallbackContext *)malloc(sizeof(PyAudioCallbackContext));
+    memset(context, 0, sizeof(PyAudioCallbackContext));
     context->callback = (PyObject *)stream_callback;
     context->main_thread_id = PyThreadState_Get()->thread_id;
     context->frame_size = Pa_GetSampleSize(format) * channels;
@@ -1781,9 +2054,14 @@ static PyObject *pa_is_format_supported(PyObject *self, PyObject *args,
     outputParams.hostApiSpecificStreamInfo = NULL;
   }
 
+  // the driver round trip may take a while; let other threads probe meanwhile
+  // clang-format off
+  Py_BEGIN_ALLOW_THREADS
   error = Pa_IsFormatSupported((input_device < 0) ? NULL : &inputParams,
                                (output_device < 0) ? NULL : &outputParams,
                                sample_rate);
+  Py_END_ALLOW_THREADS
+  // clang-format on
 
   if (error == paFormatIsSupported) {
     Py_INCREF(Py_True);
@@ -2071,6 +2349,126 @@ static PyObject *pa_get_stream_cpu_load(PyObject *self, PyObject *args) {
   return PyFloat_FromDouble(cpuload);
 }
 
+static PyObject *pa_set_callback_stats(PyObject *self, PyObject *args) {
+  int enabled;
+  PyObject *stream_arg;
+  _pyAudio_Stream *streamObject;
+  PyAudioCallbackContext *context;
+
+  if (!PyArg_ParseTuple(args, "O!p", &_pyAudio_StreamType, &stream_arg,
+                        &enabled)) {
+    return NULL;
+  }
+
+  streamObject = (_pyAudio_Stream *)stream_arg;
+
+  if (!_is_open(streamObject)) {
+    PyErr_SetObject(PyExc_IOError,
+                    Py_BuildValue("(i,s)", paBadStreamPtr, "Stream closed"));
+    return NULL;
+  }
+
+  context = streamObject->callbackContext;
+  if (context == NULL) {
+    PyErr_SetString(PyExc_ValueError,
+                    "Callback statistics require a callback stream");
+    return NULL;
+  }
+
+  // Statistics start from scratch each time they are switched on. The
+  // callback only writes them with the GIL held, which we hold here.
+  if (enabled && !context->stats_enabled) {
+    _reset_callback_stats(context);
+  }
+  context->stats_enabled = enabled;
+
+  Py_RETURN_NONE;
+}
+
+static PyObject *_timing_histogram_to_dict(PyAudioTimingHistogram *histogram) {
+  int i;
+  PyObject *bucket;
+  PyObject *buckets = PyTuple_New(CALLBACK_STATS_BUCKETS);
+  if (buckets == NULL) {
+    return NULL;
+  }
+
+  for (i = 0; i < CALLBACK_STATS_BUCKETS; i++) {
+    bucket = PyLong_FromUnsignedLongLong(histogram->buckets[i]);
+    if (bucket == NULL) {
+      Py_DECREF(buckets);
+      return NULL;
+    }
+    PyTuple_SET_ITEM(buckets, i, bucket);
+  }
+
+  // clang-format off
+  return Py_BuildValue("{s:K,s:d,s:d,s:N}",
+                       "count", (unsigned long long)histogram->count,
+                       "mean",
+                       histogram->count
+                           ? histogram->total_ns / 1e9 / histogram->count
+                           : 0.0,
+                       "max", histogram->max_ns / 1e9,
+                       "buckets", buckets);
+  // clang-format on
+}
+
+static PyObject *pa_get_callback_stats(PyObject *self, PyObject *args) {
+  int reset = 0;
+  PyObject *stream_arg;
+  PyObject *gil_wait = NULL, *callback_time = NULL, *interval = NULL;
+  _pyAudio_Stream *streamObject;
+  PyAudioCallbackContext *context;
+
+  if (!PyArg_ParseTuple(args, "O!|p", &_pyAudio_StreamType, &stream_arg,
+                        &reset)) {
+    return NULL;
+  }
+
+  streamObject = (_pyAudio_Stream *)stream_arg;
+
+  if (!_is_open(streamObject)) {
+    PyErr_SetObject(PyExc_IOError,
+                    Py_BuildValue("(i,s)", paBadStreamPtr, "Stream closed"));
+    return NULL;
+  }
+
+  context = streamObject->callbackContext;
+  if (context == NULL) {
+    Py_RETURN_NONE;
+  }
+
+  // The GIL keeps the callback from updating the histograms mid-copy.
+  // Stop at the first failure: no further calls with an exception set.
+  gil_wait = _timing_histogram_to_dict(&context->gil_wait);
+  if (gil_wait == NULL) {
+    return NULL;
+  }
+  callback_time = _timing_histogram_to_dict(&context->callback_time);
+  if (callback_time == NULL) {
+    Py_XDECREF(gil_wait);
+    return NULL;
+  }
+  interval = _timing_histogram_to_dict(&context->interval);
+  if (interval == NULL) {
+    Py_XDECREF(gil_wait);
+    Py_XDECREF(callback_time);
+    return NULL;
+  }
+  if (reset) {
+    _reset_callback_stats(context);
+  }
+
+  // clang-format off
+  return Py_BuildValue("{s:O,s:N,s:N,s:N}",
+                       "enabled", context->stats_enabled ? Py_True : Py_False,
+                       "gil_wait", gil_wait,
+                       "callback", callback_time,
+                       "interval", interval);
+  // clang-format on
+}
+
 /*************************************************************
  * Stream Read/Write
  *************************************************************/
@@ -2227,6 +2625,82 @@ error:
   return NULL;
 }
 
+static PyObject *pa_read_stream_into(PyObject *self, PyObject *args) {
+  int err;
+  int total_frames;
+  int frame_size;
+  int should_raise_exception = 0;
+  Py_buffer view;
+
+  PyObject *stream_arg;
+  _pyAudio_Stream *streamObject;
+  PaStreamParameters *inputParameters;
+
+  // clang-format off
+  if (!PyArg_ParseTuple(args, "O!w*i|i",
+                        &_pyAudio_StreamType,
+                        &stream_arg,
+                        &view,
+                        &total_frames,
+                        &should_raise_exception)) {
+    return NULL;
+  }
+  // clang-format on
+
+  streamObject = (_pyAudio_Stream *)stream_arg;
+
+  if (!_is_open(streamObject)) {
+    PyBuffer_Release(&view);
+    PyErr_SetObject(PyExc_IOError,
+                    Py_BuildValue("(i,s)", paBadStreamPtr, "Stream closed"));
+    return NULL;
+  }
+
+  inputParameters = streamObject->inputParameters;
+  frame_size = (inputParameters->channelCount) *
+               (Pa_GetSampleSize(inputParameters->sampleFormat));
+
+  if (total_frames < 0 || (Py_ssize_t)total_frames * frame_size > view.len) {
+    PyBuffer_Release(&view);
+    PyErr_SetString(PyExc_ValueError,
+                    "Invalid number of frames (buffer too small)");
+    return NULL;
+  }
+
+  // clang-format off
+  Py_BEGIN_ALLOW_THREADS
+  err = Pa_ReadStream(streamObject->stream, view.buf, total_frames);
+  Py_END_ALLOW_THREADS
+  // clang-format on
+
+  PyBuffer_Release(&view);
+
+  if (err != paNoError) {
+    if (err == paInputOverflowed) {
+      if (should_raise_exception) {
+        goto error;
+      }
+    } else {
+      goto error;
+    }
+  }
+
+  return PyLong_FromLong(total_frames);
+
+error:
+  _cleanup_Stream_object(streamObject);
+  PyErr_SetObject(PyExc_IOError,
+                  Py_BuildValue("(i,s)", err, Pa_GetErrorText(err)));
+
+#ifdef VERBOSE
+  fprintf(stderr, "An error occured while using the portaudio stream\n");
+  fprintf(stderr, "Error number: %d\n", err);
+  fprintf(stderr, "Error message: %s\n", Pa_GetErrorText(err));
+#endif
+
+  return NULL;
+}
+
 static PyObject *pa_get_stream_write_available(PyObject *self, PyObject *args) {
   signed long frames;
   PyObject *stream_arg;
@@ -2279,6 +2753,198 @@ static PyObject *pa_get_stream_read_available(PyObject *self, PyObject *args) {
   return PyLong_FromLong(frames);
 }
 
+/*************************************************************
+ * Sample Conversion
+ *************************************************************/
+
+/* Packed 24 bit samples are always little-endian (as in WAV files);
+ * 16/32 bit int and float samples use the native byte order. */
+
+typedef void (*_sample_converter)(const unsigned char *src,
+                                  unsigned char *dst, Py_ssize_t count,
+                                  int flags);
+
+static void _int24_to_int32(const unsigned char *src, unsigned char *dst,
+                            Py_ssize_t count, int flags) {
+  Py_ssize_t i;
+  int32_t sample;
+
+  for (i = 0; i < count; i++, src += 3, dst += 4) {
+    /* left-justify, so the result is a full scale 32 bit sample */
+    sample = (int32_t)(((uint32_t)src[0] << 8) | ((uint32_t)src[1] << 16) |
+                       ((uint32_t)src[2] << 24));
+    memcpy(dst, &sample, 4);
+  }
+}
+
+static void _int24_to_float32(const unsigned char *src, unsigned char *dst,
+                              Py_ssize_t count, int flags) {
+  Py_ssize_t i;
+  int32_t sample;
+  float value;
+
+  for (i = 0; i < count; i++, src += 3, dst += 4) {
+    sample = (int32_t)(((uint32_t)src[0] << 8) | ((uint32_t)src[1] << 16) |
+                       ((uint32_t)src[2] << 24));
+    value = (float)(sample >> 8) * (1.0f / 8388608.0f);
+    memcpy(dst, &value, 4);
+  }
+}
+
+static void _int32_to_int24(const unsigned char *src, unsigned char *dst,
+                            Py_ssize_t count, int flags) {
+  Py_ssize_t i;
+  uint32_t sample;
+
+  for (i = 0; i < count; i++, src += 4, dst += 3) {
+    memcpy(&sample, src, 4);
+    dst[0] = (unsigned char)(sample >> 8);
+    dst[1] = (unsigned char)(sample >> 16);
+    dst[2] = (unsigned char)(sample >> 24);
+  }
+}
+
+static void _float32_to_int24(const unsigned char *src, unsigned char *dst,
+                              Py_ssize_t count, int flags) {
+  Py_ssize_t i;
+  float value;
+  int32_t sample;
+
+  for (i = 0; i < count; i++, src += 4, dst += 3) {
+    memcpy(&value, src, 4);
+    value = value * 8388608.0f + 0.5f;
+    /* clip (NaN compares false and ends up as 0) */
+    if (value >= 8388607.0f) {
+      sample = 8388607;
+    } else if (value <= -8388608.0f) {
+      sample = -8388608;
+    } else if (value == value) {
+      sample = (int32_t)value - (value < (int32_t)value);
+    } else {
+      sample = 0;
+    }
+    dst[0] = (unsigned char)(sample);
+    dst[1] = (unsigned char)(sample >> 8);
+    dst[2] = (unsigned char)(sample >> 16);
+  }
+}
+
+static void _int16_to_float32(const unsigned char *src, unsigned char *dst,
+                              Py_ssize_t count, int flags) {
+  Py_ssize_t i;
+  int16_t sample;
+  float value;
+
+  for (i = 0; i < count; i++, src += 2, dst += 4) {
+    memcpy(&sample, src, 2);
+    value = (float)sample * (1.0f / 32768.0f);
+    memcpy(dst, &value, 4);
+  }
+}
+
+static void _float32_to_int16(const unsigned char *src, unsigned char *dst,
+                              Py_ssize_t count, int flags) {
+  static uint32_t seed = 0x9e3779b9;
+  Py_ssize_t i;
+  uint32_t state;
+  float value;
+  int32_t rounded;
+  int16_t sample;
+
+  /* every call continues from a different point of the xorshift sequence */
+  state = (seed += 0x6d2b79f5) | 1;
+
+  for (i = 0; i < count; i++, src += 4, dst += 2) {
+    memcpy(&value, src, 4);
+    value = value * 32768.0f + 0.5f;
+
+    if (flags) {
+      /* triangular (TPDF) dither, +/- 1 LSB */
+      state ^= state << 13;
+      state ^= state >> 17;
+      state ^= state << 5;
+      value += ((float)(state & 0xffff) - (float)(state >> 16)) *
+               (1.0f / 65536.0f);
+    }
+
+    if (value >= 32767.0f) {
+      sample = 32767;
+    } else if (value <= -32768.0f) {
+      sample = -32768;
+    } else if (value == value) {
+      rounded = (int32_t)value;
+      sample = (int16_t)(rounded - (value < rounded));
+    } else {
+      sample = 0;
+    }
+    memcpy(dst, &sample, 2);
+  }
+}
+
+static PyObject *_convert_samples(Py_buffer *view, int in_width,
+                                  int out_width, _sample_converter converter,
+                                  int flags) {
+  Py_ssize_t count;
+  PyObject *rv;
+
+  if (view->len % in_width != 0) {
+    PyErr_Format(PyExc_ValueError,
+                 "Buffer size (%zd) is not a multiple of the sample size (%d)",
+                 view->len, in_width);
+    return NULL;
+  }
+
+  count = view->len / in_width;
+  rv = PyBytes_FromStringAndSize(NULL, count * out_width);
+
+  if (rv == NULL) {
+    return NULL;
+  }
+
+  // clang-format off
+  Py_BEGIN_ALLOW_THREADS
+  converter((const unsigned char *)view->buf,
+            (unsigned char *)PyBytes_AS_STRING(rv), count, flags);
+  Py_END_ALLOW_THREADS
+  // clang-format on
+
+  return rv;
+}
+
+#define SAMPLE_CONVERSION_METHOD(name, in_width, out_width)            \
+  static PyObject *pa_##name(PyObject *self, PyObject *args) {         \
+    Py_buffer view;                                                    \
+    PyObject *rv;                                                      \
+                                                                       \
+    if (!PyArg_ParseTuple(args, "y*", &view)) {                        \
+      return NULL;                                                     \
+    }                                                                  \
+                                                                       \
+    rv = _convert_samples(&view, in_width, out_width, _##name, 0);     \
+    PyBuffer_Release(&view);                                           \
+    return rv;                                                         \
+  }
+
+SAMPLE_CONVERSION_METHOD(int24_to_int32, 3, 4)
+SAMPLE_CONVERSION_METHOD(int24_to_float32, 3, 4)
+SAMPLE_CONVERSION_METHOD(int32_to_int24, 4, 3)
+SAMPLE_CONVERSION_METHOD(float32_to_int24, 4, 3)
+SAMPLE_CONVERSION_METHOD(int16_to_float32, 2, 4)
+
+static PyObject *pa_float32_to_int16(PyObject *self, PyObject *args) {
+  Py_buffer view;
+  PyObject *rv;
+  int dither = 1;
+
+  if (!PyArg_ParseTuple(args, "y*|p", &view, &dither)) {
+    return NULL;
+  }
+
+  rv = _convert_samples(&view, 4, 2, _float32_to_int16, dither);
+  PyBuffer_Release(&view);
+  return rv;
+}
+
 /************************************************************
  *
  * IV. Python Module Init
@@ -72,6 +72,12 @@ pa_get_default_output_device(PyObject *self, PyObject *args);
 static PyObject *
 pa_get_device_info(PyObject *self, PyObject *args);
 
+static PyObject *
+pa_update_device_list(PyObject *self, PyObject *args);
+
+static PyObject *
+pa_get_default_endpoint_id(PyObject *self, PyObject *args);
+
 /* stream open/close */
 
 static PyObject *
@@ -110,6 +116,12 @@ pa_get_stream_time(PyObject *self, PyObject *args);
 static PyObject *
 pa_get_stream_cpu_load(PyObject *self, PyObject *args);
 
+static PyObject *
+pa_set_callback_stats(PyObject *self, PyObject *args);
+
+static PyObject *
+pa_get_callback_stats(PyObject *self, PyObject *args);
+
 /* stream write/read */
 
 static PyObject *
@@ -118,10 +130,33 @@ pa_write_stream(PyObject *self, PyObject *args);
 static PyObject *
 pa_read_stream(PyObject *self, PyObject *args);
 
+static PyObject *
+pa_read_stream_into(PyObject *self, PyObject *args);
+
 static PyObject *
 pa_get_stream_write_available(PyObject *self, PyObject *args);
 
 static PyObject *
 pa_get_stream_read_available(PyObject *self, PyObject *args);
 
+/* sample conversion */
+
+static PyObject *
+pa_int24_to_int32(PyObject *self, PyObject *args);
+
+static PyObject *
+pa_int24_to_float32(PyObject *self, PyObject *args);
+
+static PyObject *
+pa_int32_to_int24(PyObject *self, PyObject *args);
+
+static PyObject *
+pa_float32_to_int24(PyObject *self, PyObject *args);
+
+static PyObject *
+pa_int16_to_float32(PyObject *self, PyObject *args);
+
+static PyObject *
+pa_float32_to_int16(PyObject *self, PyObject *args);
+
 #endif
@@ -52,7 +52,7 @@ Overview
 --------
 
 **Classes**
-  :py:class:`PyAudio`, :py:class:`Stream`
+  :py:class:`PyAudio`, :py:class:`Stream`, :py:class:`DeviceInfo`
 
 .. only:: pamac
 
@@ -62,6 +62,11 @@ Overview
 **Stream Conversion Convenience Functions**
   :py:func:`get_sample_size`, :py:func:`get_format_from_width`
 
+**Sample Conversion Functions (WPatch)**
+  :py:func:`int24_to_int32`, :py:func:`int24_to_float32`,
+  :py:func:`int32_to_int24`, :py:func:`float32_to_int24`,
+  :py:func:`int16_to_float32`, :py:func:`float32_to_int16`
+
 **PortAudio version**
   :py:func:`get_portaudio_version`, :py:func:`get_portaudio_version_text`
 
@@ -126,6 +131,9 @@ __version__ = "0.2.12.7"
 __docformat__ = "restructuredtext en"
 
 import locale
+import threading
+from collections.abc import Mapping
+from concurrent.futures import Future
 
 # attempt to import PortAudio
 try:
@@ -256,6 +264,89 @@ def get_format_from_width(width, unsigned=True):
     else:
         raise ValueError("Invalid width: %d" % width)
 
+############################################################
+# Sample Conversion (WPatch)
+############################################################
+
+# Note: packed 24 bit samples (paInt24) are little-endian, 16/32 bit
+# samples use the native byte order (as delivered by PortAudio).
+
+def int24_to_int32(data):
+    """
+    Converts packed 24 bit samples to left-justified 32 bit int
+    samples (:py:data:`paInt24` to :py:data:`paInt32`).
+
+    :param data: A bytes-like object of packed 3 byte samples.
+    :raises ValueError: if the size of `data` is not a multiple of 3.
+    :rtype: bytes
+    """
+
+    return pa.int24_to_int32(data)
+
+def int24_to_float32(data):
+    """
+    Converts packed 24 bit samples to 32 bit float samples in range
+    [-1.0, 1.0) (:py:data:`paInt24` to :py:data:`paFloat32`).
+
+    :param data: A bytes-like object of packed 3 byte samples.
+    :raises ValueError: if the size of `data` is not a multiple of 3.
+    :rtype: bytes
+    """
+
+    return pa.int24_to_float32(data)
+
+def int32_to_int24(data):
+    """
+    Converts 32 bit int samples to packed 24 bit samples, dropping
+    the least significant byte (:py:data:`paInt32` to :py:data:`paInt24`).
+
+    :param data: A bytes-like object of 4 byte samples.
+    :raises ValueError: if the size of `data` is not a multiple of 4.
+    :rtype: bytes
+    """
+
+    return pa.int32_to_int24(data)
+
+def float32_to_int24(data):
+    """
+    Converts 32 bit float samples to packed 24 bit samples. Values
+    outside of [-1.0, 1.0) are clipped (:py:data:`paFloat32` to
+    :py:data:`paInt24`).
+
+    :param data: A bytes-like object of 4 byte float samples.
+    :raises ValueError: if the size of `data` is not a multiple of 4.
+    :rtype: bytes
+    """
+
+    return pa.float32_to_int24(data)
+
+def int16_to_float32(data):
+    """
+    Converts 16 bit int samples to 32 bit float samples in range
+    [-1.0, 1.0) (:py:data:`paInt16` to :py:data:`paFloat32`).
+
+    :param data: A bytes-like object of 2 byte samples.
+    :raises ValueError: if the size of `data` is not a multiple of 2.
+    :rtype: bytes
+    """
+
+    return pa.int16_to_float32(data)
+
+def float32_to_int16(data, dither=True):
+    """
+    Converts 32 bit float samples to 16 bit int samples. Values
+    outside of [-1.0, 1.0) are clipped (:py:data:`paFloat32` to
+    :py:data:`paInt16`).
+
+    :param data: A bytes-like object of 4 byte float samples.
+    :param dither: Add triangular (TPDF) dither of +/- 1 LSB before
+        rounding. Defaults to ``True``.
+    :raises ValueError: if the size of `data` is not a multiple of 4.
+    :rtype: bytes
+    """
+
+    return pa.float32_to_int16(data, dither)
+
 
 ############################################################
 # Versioning
@@ -295,15 +386,16 @@ class Stream:
 
     **Stream Info**
       :py:func:`get_input_latency`, :py:func:`get_output_latency`,
-      :py:func:`get_time`, :py:func:`get_cpu_load`
+      :py:func:`get_time`, :py:func:`get_cpu_load`,
+      :py:func:`enable_callback_stats`, :py:func:`get_callback_stats`
 
     **Stream Management**
       :py:func:`start_stream`, :py:func:`stop_stream`, :py:func:`is_active`,
       :py:func:`is_stopped`
 
     **Input Output**
-      :py:func:`write`, :py:func:`read`, :py:func:`get_read_available`,
-      :py:func:`get_write_available`
+      :py:func:`write`, :py:func:`read`, :py:func:`readinto`,
+      :py:func:`get_read_available`, :py:func:`get_write_available`
     """
 
     def __init__(self,
@@ -516,6 +608,48 @@ class Stream:
         """
 
         return pa.get_stream_cpu_load(self._stream)
+
+    def enable_callback_stats(self, enabled=True):
+        """
+        Turn the callback timing statistics on or off.  Turning them
+        on starts from empty histograms.  Only available for
+        *non-blocking* (callback) streams.
+
+        While disabled, the callback pays a single flag test.
+
+        :param enabled: Whether to time the callback invocations.
+            Defaults to ``True``.
+        :raises ValueError: if the stream has no callback
+        """
+
+        pa.set_callback_stats(self._stream, enabled)
+
+    def get_callback_stats(self, reset=False):
+        """
+        Return the callback timing statistics, measured in the native
+        callback of a *non-blocking* stream (see
+        :py:func:`enable_callback_stats`).
+
+        The returned dictionary has an ``enabled`` flag and three
+        timings per invocation:
+
+        * ``gil_wait``: time spent acquiring the GIL before the
+          callback could run,
+        * ``callback``: time spent in the Python callback,
+        * ``interval``: time since the previous invocation.
+
+        Each timing is a dictionary with ``count``, ``mean`` and
+        ``max`` (in seconds) and ``buckets``, a histogram tuple where
+        bucket *i* counts durations of at least 2**(i-1) and less than
+        2**i microseconds (bucket 0 counts durations under one
+        microsecond, the last one is open-ended).
+
+        :param reset: Clear the histograms after reading them.
+            Defaults to ``False``.
+        :rtype: dict, or ``None`` for a *blocking* stream
+        """
+
+        return pa.get_callback_stats(self._stream, reset)
         
     ############################################################
     # Context Mangment (WPatch)
@@ -639,6 +773,38 @@ class Stream:
 
         return pa.read_stream(self._stream, num_frames, exception_on_overflow)
 
+    def readinto(self, buffer, num_frames=None, exception_on_overflow=True):
+        """
+        Read samples from the stream directly into a writable buffer
+        (``bytearray``, ``memoryview``, ``mmap``, numpy array, ...),
+        without allocating a new bytes object.  Do not call when using
+        *non-blocking* mode.
+
+        :param buffer: A writable bytes-like object.
+        :param num_frames: The number of frames to read.
+           Defaults to None, in which case as many frames as fit
+           into `buffer` are read.
+        :param exception_on_overflow:
+           Specifies whether an IOError exception should be thrown
+           (or silently ignored) on input buffer overflow. Defaults
+           to True.
+        :raises IOError: if stream is not an input stream
+          or if the read operation was unsuccessful.
+        :raises ValueError: if `buffer` is too small for `num_frames`.
+        :rtype: integer (number of frames read)
+        """
+
+        if not self._is_input:
+            raise IOError("Not input stream",
+                          paCanNotReadFromAnOutputOnlyStream)
+
+        if num_frames is None:
+            width = get_sample_size(self._format)
+            num_frames = memoryview(buffer).nbytes // (self._channels * width)
+
+        return pa.read_stream_into(self._stream, buffer, num_frames,
+                                   exception_on_overflow)
+
     def get_read_available(self):
         """
         Return the number of frames that can be read without waiting.
@@ -662,6 +828,69 @@ class Stream:
 
 
 
+############################################################
+# Device Info (WPatch)
+############################################################
+
+class DeviceInfo(dict):
+    """
+    Device info dictionary mirroring PortAudio's ``PaDeviceInfo``
+    (WPatch).
+
+    A ``dict`` like the former device info dictionaries (it can be
+    merged, copied and serialized to JSON), but read-only: instances are
+    cached and shared by every caller, so changing one raises
+    ``TypeError``. Copy it with ``dict(info)`` to get a mutable
+    dictionary. The fields can also be read as attributes:
+    ``info.name`` and ``info['name']`` are the same.
+
+    ``endpointId`` is the WASAPI endpoint ID (``None`` for other host
+    APIs). A render device and its loopback analogue share it.
+    """
+
+    __slots__ = ()
+
+    FIELDS = ('structVersion', 'name', 'hostApi',
+              'maxInputChannels', 'maxOutputChannels',
+              'defaultLowInputLatency', 'defaultLowOutputLatency',
+              'defaultHighInputLatency', 'defaultHighOutputLatency',
+              'defaultSampleRate', 'isLoopbackDevice', 'endpointId')
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("DeviceInfo is read-only; copy it with dict(info)")
+
+    __setitem__ = __delitem__ = _read_only
+    update = pop = popitem = setdefault = clear = _read_only
+    __ior__ = _read_only
+
+    def __reduce__(self):
+        return (DeviceInfo, (dict(self),))
+
+    def __repr__(self):
+        return "DeviceInfo(%s)" % dict.__repr__(self)
+
+
+# DeviceInfo instances by device index, and WASAPI loopback devices by
+# endpoint ID (None until built, since a system may have no loopback
+# devices); PortAudio's device list only changes when it is
+# (re)initialized or refreshed, which clears both. DeviceInfo is
+# read-only, so callers share the cached instances.
+_device_info_cache = {}
+_loopback_by_endpoint = None
+
+
+def _clear_device_info_cache():
+    global _loopback_by_endpoint
+    _device_info_cache.clear()
+    _loopback_by_endpoint = None
+
+
 ############################################################
 # Main Export
 ############################################################
@@ -678,6 +907,9 @@ class PyAudio:
 
     Use this class to open and close streams.
 
+    **Initialization (WPatch)**
+      :py:func:`initialize_async`
+
     **Stream Management**
       :py:func:`open`, :py:func:`close`
 
@@ -694,10 +926,13 @@ class PyAudio:
       :py:func:`get_device_info_by_index`
       
     **Device API (WPatch)**
+      :py:class:`DeviceInfo`,
       :py:func:`get_host_api_info_generator`,
       :py:func:`get_device_info_generator`,
       :py:func:`get_device_info_generator_by_host_api`,
       :py:func:`get_loopback_device_info_generator`,
+      :py:func:`update_device_list`,
+      :py:func:`get_wasapi_loopback_map`,
       :py:func:`print_detailed_system_info`
 
     **Stream Format Conversion**
@@ -714,8 +949,36 @@ class PyAudio:
         """Initialize PortAudio."""
 
         pa.initialize()
+        _clear_device_info_cache()
         self._streams = set()
 
+    @classmethod
+    def initialize_async(cls):
+        """
+        Initialize PortAudio in a background thread (WPatch).
+
+        PortAudio enumerates every host API and device while initializing,
+        which may take a while with some drivers. Call this as early as
+        possible and take the result when the instance is needed.
+
+        :returns: A :py:class:`concurrent.futures.Future` resolving to a
+          :py:class:`PyAudio` instance (or raising the initialization error)
+        """
+
+        future = Future()
+
+        def initialize():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(cls())
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=initialize, name="PyAudio.initialize_async",
+                         daemon=True).start()
+        return future
+
     def terminate(self):
         """
         Terminate PortAudio.
@@ -729,6 +992,7 @@ class PyAudio:
 
         self._streams = set()
 
+        _clear_device_info_cache()
         pa.terminate()
         
     ############################################################
@@ -895,7 +1159,7 @@ class PyAudio:
         :param host_api_index: The Host API index number
         :param host_api_device_index: The n'th device of the host API
         :raises IOError: for invalid indices
-        :rtype: dict
+        :rtype: DeviceInfo
         """
 
         long_method_name = pa.host_api_device_index_to_device_index
@@ -994,7 +1258,7 @@ class PyAudio:
         of PortAudio's ``PaDeviceInfo`` structure.
 
         :raises IOError: No default input device available.
-        :rtype: dict
+        :rtype: DeviceInfo
         """
 
         device_index = pa.get_default_input_device()
@@ -1007,7 +1271,7 @@ class PyAudio:
         of PortAudio's ``PaDeviceInfo`` structure.
 
         :raises IOError: No default output device available.
-        :rtype: dict
+        :rtype: DeviceInfo
         """
 
         device_index = pa.get_default_output_device()
@@ -1016,68 +1280,75 @@ class PyAudio:
     def get_device_info_by_index(self, device_index):
         """
         Return the Device parameters for device specified in
-        `device_index` as a dictionary. The keys of the dictionary
+        `device_index` as a :py:class:`DeviceInfo`. Its fields
         mirror the data fields of PortAudio's ``PaDeviceInfo``
-        structure.
+        structure and can also be read as attributes.
+
+        The fields are cached until the device list changes; every call
+        returns the same read-only instance.
 
         :param device_index: The device index
         :raises IOError: Invalid `device_index`.
-        :rtype: dict
+        :rtype: DeviceInfo
         """
 
-        return self._make_device_info_dictionary(
-            device_index,
-            pa.get_device_info(device_index)
-            )
+        device_info = _device_info_cache.get(device_index)
+        if device_info is None:
+            device_info = self._make_device_info(
+                device_index,
+                pa.get_device_info(device_index)
+                )
+            _device_info_cache[device_index] = device_info
+        return device_info
 
-    def _make_device_info_dictionary(self, index, device_info):
+    def _make_device_info(self, index, device_info):
         """
-        Internal method to create Device Info dictionary that mirrors
+        Internal method to create the :py:class:`DeviceInfo` that mirrors
         PortAudio's ``PaDeviceInfo`` structure.
 
-        :rtype: dict
+        :rtype: DeviceInfo
         """
 
-        device_name = device_info.name
-        
-        # ~Now the name decoding 'happens' in the C module
-        # 
-        # Attempt to decode device_name
-        # os_encoding = locale.getpreferredencoding(do_setlocale=False)
-        # for codec in [os_encoding, "utf-8"]:
-        #     try:
-        #         device_name = device_name.decode(codec)
-        #         break
-        #     except:
-        #         pass
-
-        # If we fail to decode, we return the raw bytes and let the caller
-        # deal with the encoding.
-        return {'index' : index,
-                'structVersion' : device_info.structVersion,
-                'name' : device_name,
-                'hostApi' : device_info.hostApi,
-                'maxInputChannels' : device_info.maxInputChannels,
-                'maxOutputChannels' : device_info.maxOutputChannels,
-                'defaultLowInputLatency' :
-                device_info.defaultLowInputLatency,
-                'defaultLowOutputLatency' :
-                device_info.defaultLowOutputLatency,
-                'defaultHighInputLatency' :
-                device_info.defaultHighInputLatency,
-                'defaultHighOutputLatency' :
-                device_info.defaultHighOutputLatency,
-                'defaultSampleRate' :
-                device_info.defaultSampleRate,
-                'isLoopbackDevice' :
-                device_info.isLoopbackDevice
-                }
+        # The device name is decoded in the C module
+        info = {'index': index}
+        for field in DeviceInfo.FIELDS:
+            info[field] = getattr(device_info, field)
+        return DeviceInfo(info)
 
 
     ############################################################
     # WPatch section
     ############################################################
 
+    def update_device_list(self):
+        """
+        Refresh the device list after devices were plugged in or removed,
+        or the default device changed.
+
+        The WASAPI device list is refreshed in place when PortAudio supports
+        it (built with ``PA_WASAPI_MAX_CONST_DEVICE_COUNT``); otherwise
+        PortAudio is terminated and initialized again, which is only possible
+        while no stream is open. Device indexes may change either way.
+
+        :raises IOError: PortAudio has to be reinitialized but streams are open
+        :returns: ``True`` if the list was refreshed in place, ``False`` if
+          PortAudio was reinitialized
+        :rtype: bool
+        """
+
+        if pa.update_device_list():
+            _clear_device_info_cache()
+            return True
+
+        if self._streams:
+            raise IOError("Cannot reinitialize PortAudio with open streams",
+                          paInternalError)
+
+        _clear_device_info_cache()
+        pa.terminate()
+        pa.initialize()
+        return False
+
     def get_host_api_info_generator(self):
         """
         Returns a generator of Host APIs parameters dict.
@@ -1099,7 +1370,7 @@ class PyAudio:
         (as returned by a :py:func:`get_device_info_by_index`).
         The number of generations depends on the number of devices.
         
-        :rtype: Iterator[dict]
+        :rtype: Iterator[DeviceInfo]
         """
         
         for device_index in range(0, pa.get_device_count()):
@@ -1116,7 +1387,7 @@ class PyAudio:
         :param host_api_type: The type of Host API, according to which devices will be given
         :raises IOError: for invalid `host_api_index`
         :raises IOError: for invalid `host_api_type`
-        :rtype: Iterator[dict]
+        :rtype: Iterator[DeviceInfo]
         """
         
         if host_api_type is not None:
@@ -1136,7 +1407,7 @@ class PyAudio:
         WASAPI loopback devices info dicts will be given.
         Not all WASAPI, only loopback devices.
 
-        :rtype: Iterator[dict]
+        :rtype: Iterator[DeviceInfo]
         """
 
         for device_info in self.get_device_info_generator_by_host_api(
@@ -1188,7 +1459,7 @@ class PyAudio:
     # WPatch section > Additional life improvements
     ############################################################
 
-    def get_default_wasapi_device(self, *, d_out: bool = False, d_in: bool = False) -> dict:
+    def get_default_wasapi_device(self, *, d_out: bool = False, d_in: bool = False) -> DeviceInfo:
         """
         Return "info dict" of default (out/in)put device of WASAPI driver
 
@@ -1210,9 +1481,31 @@ class PyAudio:
                                                  else "defaultInputDevice"
                                              ])
 
-    def get_wasapi_loopback_analogue_by_dict(self, info_dict: dict) -> dict:
+    def get_default_wasapi_endpoint_id(self, *, d_out: bool = False, d_in: bool = False):
         """
-        Try to find loopback analogue for WASAPI speaker which `info_dict` was passed
+        Return the endpoint ID of the current default WASAPI (out/in)put device
+
+        Unlike :py:meth:`get_default_wasapi_device` this asks Windows rather
+        than PortAudio's device list, so it follows default device changes
+        without :py:meth:`update_device_list` and may be polled while
+        streams are open. Compare it with the ``endpointId`` of a
+        :py:class:`DeviceInfo`; loopback devices share it with their render
+        device.
+
+        :param d_out: Get default output device(higher priority than `d_in`)
+        :param d_in: Get default input device(rather, the semantic parameter)
+        :return: The endpoint ID, or ``None`` if there is no default device
+          or endpoint IDs are unavailable (WinRT and non-Windows builds)
+        :rtype: str or None
+        """
+
+        return pa.get_default_endpoint_id(bool(d_out))
+
+    def get_wasapi_loopback_analogue_by_dict(self, info_dict: Mapping) -> Mapping:
+        """
+        Try to find loopback analogue for WASAPI speaker which `info_dict` was passed.
+        Devices are paired by their endpoint ID (a dict lookup); for info without
+        an endpoint ID the loopback device names are searched instead.
 
         :param info_dict: Dict-like info about device(retrieved from other PyAudio functions)
         :raises LookupError: If no analogue is found
@@ -1226,6 +1519,15 @@ class PyAudio:
             if info_dict["maxOutputChannels"] < 1:
                 raise ValueError("`info_dict` must represent an output device")
 
+            endpoint_id = info_dict.get("endpointId")
+            if endpoint_id is not None:
+                loopback = self._get_loopback_map().get(endpoint_id)
+                if loopback is None:
+                    raise LookupError("No analogue is found for passed device"
+                                      f"(index='{info_dict['index']}' name='{info_dict['name']}')")
+                return loopback
+
+            # No endpoint ID (e.g. WinRT builds): fall back to name matching
             for loopback in self.get_loopback_device_info_generator():
                 """
                 Try to find loopback device with same name(and [Loopback suffix]).
@@ -1241,7 +1543,35 @@ class PyAudio:
         else:
             return info_dict
 
-    def get_wasapi_loopback_analogue_by_index(self, index: int) -> dict:
+    def _get_loopback_map(self):
+        """
+        Internal method returning the cached map of WASAPI loopback
+        devices by endpoint ID.
+
+        :rtype: dict
+        """
+
+        global _loopback_by_endpoint
+        if _loopback_by_endpoint is None:
+            _loopback_by_endpoint = {
+                loopback.endpointId: loopback
+                for loopback in self.get_loopback_device_info_generator()
+                if loopback.endpointId is not None}
+        return _loopback_by_endpoint
+
+    def get_wasapi_loopback_map(self) -> dict:
+        """
+        Return the WASAPI loopback devices keyed by the endpoint ID they
+        share with their render device: ``map[speakers['endpointId']]``
+        is the loopback analogue of ``speakers``.
+
+        :raises OSError: If WASAPI driver is unavailable
+        :return: dict of endpoint ID -> loopback :py:class:`DeviceInfo`
+        """
+
+        return dict(self._get_loopback_map())
+
+    def get_wasapi_loopback_analogue_by_index(self, index: int) -> DeviceInfo:
         """
         Try to find loopback analogue for WASAPI speaker which `index` was passed
 
@@ -1253,7 +1583,7 @@ class PyAudio:
 
         return self.get_wasapi_loopback_analogue_by_dict(self.get_device_info_by_index(index))
 
-    def get_default_wasapi_loopback(self) -> dict:
+    def get_default_wasapi_loopback(self) -> DeviceInfo:
         """
         Try to find loopback analogue for default WASAPI speaker
 
@@ -0,0 +1,60 @@
+import struct
+import unittest
+
+import numpy
+
+import pyaudiowpatch as pyaudio
+
+
+def pack_int24(samples):
+    return b''.join(struct.pack('<i', s)[:3] for s in samples)
+
+
+class SampleConversionTests(unittest.TestCase):
+    INT24_SAMPLES = [0, 1, -1, 8388607, -8388608, 123456, -654321]
+
+    def test_int24_to_int32(self):
+        data = pyaudio.int24_to_int32(pack_int24(self.INT24_SAMPLES))
+        result = numpy.frombuffer(data, dtype='<i4')
+        self.assertEqual(list(result >> 8), self.INT24_SAMPLES)
+
+    def test_int24_to_float32(self):
+        data = pyaudio.int24_to_float32(pack_int24(self.INT24_SAMPLES))
+        result = numpy.frombuffer(data, dtype=numpy.float32)
+        expected = numpy.array(self.INT24_SAMPLES) / 8388608.0
+        numpy.testing.assert_allclose(result, expected, rtol=1e-7)
+
+    def test_int24_roundtrip(self):
+        packed = pack_int24(self.INT24_SAMPLES)
+        self.assertEqual(
+            pyaudio.int32_to_int24(pyaudio.int24_to_int32(packed)), packed)
+        self.assertEqual(
+            pyaudio.float32_to_int24(pyaudio.int24_to_float32(packed)), packed)
+
+    def test_float32_to_int24_clips(self):
+        data = numpy.array([2.0, -2.0, 1.0, -1.0], dtype=numpy.float32)
+        packed = pyaudio.float32_to_int24(data)
+        result = numpy.frombuffer(pyaudio.int24_to_int32(packed), '<i4') >> 8
+        self.assertEqual(list(result), [8388607, -8388608, 8388607, -8388608])
+
+    def test_int16_roundtrip(self):
+        samples = numpy.array([0, 1, -1, 32767, -32768, 1234], dtype=numpy.int16)
+        floats = pyaudio.int16_to_float32(samples.tobytes())
+        numpy.testing.assert_array_equal(
+            numpy.frombuffer(floats, dtype=numpy.float32), samples / 32768.0)
+        self.assertEqual(pyaudio.float32_to_int16(floats, dither=False),
+                         samples.tobytes())
+
+    def test_float32_to_int16_dither(self):
+        floats = numpy.full(100000, 0.25, dtype=numpy.float32)
+        result = numpy.frombuffer(pyaudio.float32_to_int16(floats),
+                                  dtype=numpy.int16)
+        # TPDF dither stays within +/- 1 LSB and is zero-mean.
+        self.assertLessEqual(numpy.abs(result.astype(int) - 8192).max(), 1)
+        self.assertAlmostEqual(result.mean(), 8192, delta=0.01)
+
+    def test_invalid_buffer_size(self):
+        with self.assertRaises(ValueError):
+            pyaudio.int24_to_int32(b'\x00' * 4)
+        with self.assertRaises(ValueError):
+            pyaudio.float32_to_int16(b'\x00' * 3)
@@ -0,0 +1,111 @@
+import copy
+import json
+import pickle
+import types
+import unittest
+from unittest import mock
+
+import pyaudiowpatch as pyaudio
+
+
+FIELDS = {
+    'structVersion': 2,
+    'name': 'Speakers [Loopback]',
+    'hostApi': 3,
+    'maxInputChannels': 2,
+    'maxOutputChannels': 0,
+    'defaultLowInputLatency': 0.003,
+    'defaultLowOutputLatency': 0.0,
+    'defaultHighInputLatency': 0.01,
+    'defaultHighOutputLatency': 0.0,
+    'defaultSampleRate': 48000.0,
+    'isLoopbackDevice': True,
+    'endpointId': '{0.0.0.00000000}.{2b1a0f4e-5c6d-4e7f-8a9b-0c1d2e3f4a5b}',
+}
+
+
+class DeviceInfoTests(unittest.TestCase):
+    def setUp(self):
+        self.info = pyaudio.DeviceInfo(FIELDS, index=7)
+
+    def test_dict_compatible(self):
+        self.assertIsInstance(self.info, dict)
+        self.assertEqual(self.info['index'], 7)
+        self.assertEqual(self.info['name'], FIELDS['name'])
+        self.assertEqual(self.info.get('missing', 'x'), 'x')
+        self.assertEqual(self.info, dict(FIELDS, index=7))
+        with self.assertRaises(KeyError):
+            self.info['missing']
+
+    def test_json(self):
+        self.assertEqual(json.loads(json.dumps(self.info)), dict(FIELDS, index=7))
+
+    def test_read_only(self):
+        mutations = [
+            lambda: self.info.__setitem__('name', 'other'),
+            lambda: self.info.__delitem__('name'),
+            lambda: self.info.update(extra=1),
+            lambda: self.info.pop('name'),
+            lambda: self.info.popitem(),
+            lambda: self.info.setdefault('extra', 1),
+            lambda: self.info.clear(),
+        ]
+        for mutate in mutations:
+            with self.assertRaises(TypeError):
+                mutate()
+        with self.assertRaises(TypeError):
+            self.info |= {'extra': 1}
+        self.assertEqual(self.info, dict(FIELDS, index=7))
+
+    def test_merge_and_copy(self):
+        merged = {**self.info, 'extra': 1}
+        self.assertEqual(merged['extra'], 1)
+        self.assertEqual((self.info | {'extra': 1})['name'], FIELDS['name'])
+        copied = dict(self.info)
+        copied['name'] = 'other'
+        self.assertEqual(self.info.name, FIELDS['name'])
+        self.assertEqual(copy.copy(self.info), self.info)
+        self.assertIsInstance(copy.deepcopy(self.info), pyaudio.DeviceInfo)
+
+    def test_attributes(self):
+        self.assertEqual(self.info.maxInputChannels, 2)
+        with self.assertRaises(AttributeError):
+            self.info.missing
+
+    def test_pickle(self):
+        restored = pickle.loads(pickle.dumps(self.info))
+        self.assertIsInstance(restored, pyaudio.DeviceInfo)
+        self.assertEqual(restored, self.info)
+
+
+class DeviceInfoCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.p = pyaudio.PyAudio()
+
+    def tearDown(self):
+        self.p.terminate()
+
+    def test_callers_share_the_cached_instance(self):
+        fields = types.SimpleNamespace(**FIELDS)
+        with mock.patch.object(pyaudio.pa, 'get_device_info',
+                               return_value=fields) as get_device_info:
+            first = self.p.get_device_info_by_index(7)
+            second = self.p.get_device_info_by_index(7)
+
+        self.assertEqual(get_device_info.call_count, 1)
+        self.assertIs(first, second)
+        self.assertEqual(second, dict(FIELDS, index=7))
+        self.assertEqual(list(second)[0], 'index')
+        with self.assertRaises(TypeError):
+            first['name'] = 'changed'
+
+    def test_empty_loopback_map_is_built_once(self):
+        with mock.patch.object(pyaudio.PyAudio, 'get_loopback_device_info_generator',
+                               return_value=iter(())) as generator:
+            self.assertEqual(self.p.get_wasapi_loopback_map(), {})
+            self.assertEqual(self.p.get_wasapi_loopback_map(), {})
+            self.assertEqual(generator.call_count, 1)
+
+            self.p.update_device_list()
+            self.p.get_wasapi_loopback_map()
+            self.assertEqual(generator.call_count, 2)
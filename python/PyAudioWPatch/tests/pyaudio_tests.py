@@ -93,6 +93,21 @@ class PyAudioTests(unittest.TestCase):
         api_info = self.p.get_host_api_info_by_index(0)
         self.assertTrue(len(api_info.items()) > 0)
 
+    def test_update_device_list(self):
+        """Refreshing the device list keeps PortAudio usable"""
+        count = self.p.get_device_count()
+        self.assertIsInstance(self.p.update_device_list(), bool)
+        self.assertEqual(self.p.get_device_count(), count)
+        self.assertTrue(self.p.get_host_api_count() > 0)
+
+    def test_initialize_async(self):
+        """Background initialization yields a usable instance"""
+        p = pyaudio.PyAudio.initialize_async().result(timeout=30)
+        try:
+            self.assertEqual(p.get_device_count(), self.p.get_device_count())
+        finally:
+            p.terminate()
+
     @unittest.skipIf(SKIP_HW_TESTS or not ENABLE_LOOPBACK_TESTS,
                      'Loopback device required.')
     def test_input_output_blocking(self):
@@ -628,6 +643,63 @@ class PyAudioTests(unittest.TestCase):
         out_stream.stop_stream()
         self.assertEqual(num_times_called, 2)
 
+    @unittest.skipIf(SKIP_HW_TESTS, 'Loopback device required.')
+    def test_callback_stats(self):
+        """Ensure that callback timings are recorded only while enabled."""
+        num_times_called = 0
+
+        def out_callback(_, frame_count, time_info, status):
+            nonlocal num_times_called
+            num_times_called += 1
+            time.sleep(0.001)
+            return (b'\0' * frame_count * 4, pyaudio.paContinue)
+
+        out_stream = self.p.open(
+            format=self.p.get_format_from_width(2),
+            channels=2,
+            rate=44100,
+            output=True,
+            output_device_index=self.loopback_output_idx,
+            stream_callback=out_callback,
+            start=False)
+        self.assertEqual(out_stream.get_callback_stats()['callback']['count'],
+                         0)
+
+        out_stream.enable_callback_stats()
+        out_stream.start_stream()
+        time.sleep(0.5)
+        out_stream.stop_stream()
+        stats = out_stream.get_callback_stats(reset=True)
+
+        self.assertTrue(stats['enabled'])
+        self.assertEqual(stats['callback']['count'], num_times_called)
+        self.assertEqual(stats['gil_wait']['count'], num_times_called)
+        self.assertEqual(stats['interval']['count'], num_times_called - 1)
+        self.assertEqual(sum(stats['callback']['buckets']), num_times_called)
+        self.assertGreaterEqual(stats['callback']['max'], 0.001)
+        self.assertEqual(out_stream.get_callback_stats()['callback']['count'],
+                         0)
+
+        out_stream.enable_callback_stats(False)
+        out_stream.start_stream()
+        time.sleep(0.2)
+        out_stream.stop_stream()
+        self.assertEqual(out_stream.get_callback_stats()['callback']['count'],
+                         0)
+        out_stream.close()
+
+        blocking_stream = self.p.open(
+            format=self.p.get_format_from_width(2),
+            channels=2,
+            rate=44100,
+            output=True,
+            output_device_index=self.loopback_output_idx,
+            start=False)
+        self.assertIsNone(blocking_stream.get_callback_stats())
+        with self.assertRaises(ValueError):
+            blocking_stream.enable_callback_stats()
+        blocking_stream.close()
+
     @staticmethod
     def create_reference_signal(freqs, sampling_rate, width, duration):
         """Return reference signal with several sinuoids with frequencies
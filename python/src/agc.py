@@ -0,0 +1,259 @@
+"""
+Streaming automatic gain control.
+
+`AutomaticGainControl` brings float32 audio towards a target RMS level in
+10 ms blocks: the gain follows the block level with a fast attack and a
+slow release, is held through silence (so noise is not pumped up), and is
+capped by a look-ahead peak limiter. Output is delayed by the look-ahead
+only, and within each block the gain ramps linearly, applied in one
+vectorized multiplication.
+
+The applied gain is recorded as a `GainCurve` of (timeline frame, gain)
+knots and saved next to the recording, so derivatives can be normalized
+in the same single pass that exports them.
+"""
+
+import os
+from collections import deque
+from itertools import islice
+
+import numpy as np
+
+
+BLOCK_SECONDS = 0.01
+# knots closer than this to the previous one are not stored
+CURVE_TOLERANCE_DB = 0.05
+
+
+def gain_path(path):
+    """Gain curve file of a recording store"""
+    return os.path.splitext(path)[0] + ".gain.npz"
+
+
+def _db(value):
+    return 20 * np.log10(max(value, 1e-12))
+
+
+class GainCurve:
+    """Piecewise linear gain over the frames of a recording timeline"""
+
+    def __init__(self, rate):
+        """
+        Args:
+            rate: Sample rate in Hz of the recording
+        """
+        self.rate = int(rate)
+        self.frames = []
+        self.gains = []
+        self._held = None
+
+    def add(self, frame, gain):
+        """
+        Add a knot; knots within the tolerance of the last one are held back
+        and a knot at the frame of the last one replaces it
+        """
+        if self._held is not None and self._held[0] == frame:
+            self._held = None
+        elif self.frames and self.frames[-1] == frame:
+            self.frames.pop()
+            self.gains.pop()
+        if self.gains and abs(_db(gain) - _db(self.gains[-1])) < CURVE_TOLERANCE_DB:
+            self._held = (frame, gain)
+            return
+        if self._held is not None:
+            # the end of the flat stretch keeps the following change sharp
+            self._append(*self._held)
+        self._append(frame, gain)
+
+    def _append(self, frame, gain):
+        self._held = None
+        self.frames.append(frame)
+        self.gains.append(gain)
+
+    def knots(self):
+        """
+        All knots, including a held back one
+
+        Returns:
+            Two arrays: timeline frames and linear gains
+        """
+        frames, gains = list(self.frames), list(self.gains)
+        if self._held is not None:
+            frames.append(self._held[0])
+            gains.append(self._held[1])
+        return np.array(frames, dtype=np.int64), np.array(gains, dtype=np.float32)
+
+    def values(self, first, last):
+        """
+        Gains of frames [first, last)
+
+        Returns:
+            A float32 array of length last - first
+        """
+        if not self.frames:
+            return np.ones(last - first, dtype=np.float32)
+        return np.interp(np.arange(first, last), *self.knots()).astype(np.float32)
+
+    def save(self, path):
+        """Persist the knots to an .npz file (conventionally `<recording>.gain.npz`)"""
+        frames, gains = self.knots()
+        with open(path, "wb") as f:
+            np.savez(f, rate=self.rate, frames=frames, gains=gains)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a curve written by :py:meth:`save`
+
+        Returns:
+            A GainCurve
+        """
+        with np.load(path) as data:
+            curve = cls(int(data["rate"]))
+            curve.frames = data["frames"].tolist()
+            curve.gains = data["gains"].tolist()
+        return curve
+
+
+class AutomaticGainControl:
+    """Look-ahead limited streaming AGC on float32 frames"""
+
+    def __init__(self, rate, target_db=-20.0, max_gain_db=24.0, min_gain_db=-12.0,
+                 gate_db=-55.0, attack_seconds=0.05, release_seconds=2.0,
+                 lookahead_seconds=0.02, ceiling=0.95):
+        """
+        Args:
+            rate: Sample rate in Hz
+            target_db: Target RMS level in dBFS
+            max_gain_db: Largest gain applied
+            min_gain_db: Smallest gain applied
+            gate_db: Blocks quieter than this keep the current gain
+            attack_seconds: Time constant of gain reductions
+            release_seconds: Time constant of gain increases
+            lookahead_seconds: Delay used to see peaks before they are amplified
+            ceiling: Highest output magnitude the limiter allows
+        """
+        self.rate = int(rate)
+        self.block = max(1, int(round(BLOCK_SECONDS * self.rate)))
+        self.target_db = target_db
+        self.max_gain_db = max_gain_db
+        self.min_gain_db = min_gain_db
+        self.gate_db = gate_db
+        self.attack = 1 - np.exp(-self.block / (attack_seconds * self.rate))
+        self.release = 1 - np.exp(-self.block / (release_seconds * self.rate))
+        self.lookahead = max(1, int(round(lookahead_seconds * self.rate / self.block)))
+        self.ceiling = ceiling
+
+        self.gain_db = 0.0       # smoothed gain before limiting
+        self._applied = 1.0      # linear gain at the end of the last output block
+        self._blocks = deque()   # (samples, peak, gain_db) waiting for their look-ahead
+        self._pending = None     # samples not forming a whole block yet
+        self.frames_in = 0
+        self.frames_out = 0
+        self.curve = GainCurve(self.rate)
+        self.curve.add(0, 1.0)
+
+    @property
+    def latency(self):
+        """Frames received but not yet returned"""
+        return self.frames_in - self.frames_out
+
+    def _track(self, level_db):
+        if level_db <= self.gate_db:
+            return  # hold the gain through silence
+        desired = min(max(self.target_db - level_db, self.min_gain_db), self.max_gain_db)
+        coefficient = self.attack if desired < self.gain_db else self.release
+        self.gain_db += (desired - self.gain_db) * coefficient
+
+    def process(self, samples):
+        """
+        Add float32 frames and return the ones whose look-ahead is complete
+
+        Args:
+            samples: Array of shape (frames, channels)
+
+        Returns:
+            A float32 array of shape (frames, channels), delayed by
+            :py:attr:`latency` frames
+        """
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        self.frames_in += len(samples)
+        if self._pending is not None:
+            samples = np.concatenate((self._pending, samples))
+        whole = len(samples) // self.block * self.block
+        self._pending = samples[whole:]
+
+        blocks = samples[:whole].reshape(-1, self.block, samples.shape[1])
+        if len(blocks):
+            power = np.einsum("bij,bij->b", blocks, blocks) / blocks[0].size
+            peaks = np.abs(blocks).max(axis=(1, 2))
+            for block, block_power, peak in zip(blocks, power, peaks):
+                self._track(10 * np.log10(block_power + 1e-12))
+                self._blocks.append((block, peak, self.gain_db))
+
+        out = []
+        while len(self._blocks) > self.lookahead:
+            out.append(self._emit())
+        return self._join(out, samples.shape[1])
+
+    def _emit(self):
+        """Apply the ramped gain to the oldest block"""
+        # the oldest block and its look-ahead, with the gain tracked up to the
+        # newest of them, however many blocks the last chunk brought in
+        window = list(islice(self._blocks, self.lookahead + 1))
+        block, block_peak, _ = window[0]
+        window_peak = max(peak for _, peak, _ in window)
+        gain = 10 ** (window[-1][2] / 20)
+        start = self._applied
+        if window_peak * gain > self.ceiling:
+            gain = self.ceiling / window_peak
+        if block_peak * start > self.ceiling:
+            # at the start or after silence the held gain has not seen this block
+            start = self.ceiling / block_peak
+            self.curve.add(self.frames_out, start)
+        self._blocks.popleft()
+
+        ramp = np.linspace(start, gain, len(block) + 1, dtype=np.float32)[1:]
+        self._applied = gain
+        self.frames_out += len(block)
+        self.curve.add(self.frames_out, gain)
+        return block * ramp[:, None]
+
+    def _join(self, blocks, channels):
+        if not blocks:
+            return np.empty((0, channels), dtype=np.float32)
+        return np.concatenate(blocks)
+
+    def flush(self):
+        """
+        Return every frame still held back (at the end of a recording or
+        before a gap)
+
+        Returns:
+            A float32 array of shape (frames, channels)
+        """
+        if self._pending is not None and len(self._pending):
+            self._blocks.append((self._pending, float(np.abs(self._pending).max()),
+                                 self.gain_db))
+        self._pending = None
+        channels = self._blocks[0][0].shape[1] if self._blocks else 1
+        out = []
+        while self._blocks:
+            out.append(self._emit())
+        return self._join(out, channels)
+
+    def add_silence(self, frames):
+        """
+        Skip `frames` silent frames on the timeline, holding the gain
+
+        Returns:
+            The frames that were held back before the silence (see flush)
+        """
+        out = self.flush()
+        self.frames_in += frames
+        self.frames_out += frames
+        self.curve.add(self.frames_out, self._applied)
+        return out
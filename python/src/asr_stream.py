@@ -0,0 +1,375 @@
+"""
+Streaming ASR feeder.
+
+Live audio is pushed from the stream callback into a ring buffer. A feeder
+thread cuts it into overlapping windows whose ends are moved into pauses
+found by the VAD, converts them to 16 kHz mono and hands them to a
+pluggable transcription backend:
+
+- at most `max_in_flight` windows are being transcribed at once; when the
+  backend is slower than real time the feeder stops cutting windows, audio
+  piles up in the ring and, once the ring is full, the oldest unsent audio
+  is dropped (counted in `dropped_frames`) - the callback never waits,
+- every worker keeps its own persistent HTTP connection,
+- latency is measured from the ADC time of the last sample of a window to
+  the moment its text is returned.
+
+Backends implement ``transcribe(pcm16, rate) -> str``.
+"""
+
+import http.client
+import io
+import json
+import threading
+import time
+import wave
+from collections import deque, namedtuple
+from queue import Queue
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from export_pipeline import ASR_RATE, resample
+from recording_store import to_float32
+from vad import EnergyVad
+
+
+# start/end are seconds since the first fed frame, latency is in seconds
+Transcript = namedtuple("Transcript", ["seq", "text", "start", "end", "latency"])
+
+
+class HttpTranscriptionBackend:
+    """
+    POSTs each window as a 16 kHz mono WAV file and expects ``{"text": ...}``
+
+    Connections are kept alive and reused; each worker thread has its own.
+    """
+
+    def __init__(self, url, timeout=10.0, headers=None):
+        """
+        Args:
+            url: Transcription endpoint, e.g. http://127.0.0.1:8765/transcribe
+            timeout: Socket timeout in seconds
+            headers: Optional extra request headers (e.g. authorization)
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported transcription URL: {url}")
+
+        self.url = url
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self._scheme = parts.scheme
+        self._netloc = parts.netloc
+        self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            cls = http.client.HTTPSConnection if self._scheme == "https" \
+                else http.client.HTTPConnection
+            connection = cls(self._netloc, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def transcribe(self, pcm16, rate):
+        """
+        Transcribe one window
+
+        Args:
+            pcm16: Mono 16-bit little-endian PCM
+            rate: Sample rate of `pcm16`
+
+        Returns:
+            The transcribed text
+        """
+        body = io.BytesIO()
+        with wave.open(body, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(rate)
+            wf.writeframes(pcm16)
+        headers = {"Content-Type": "audio/wav", "Connection": "keep-alive", **self.headers}
+
+        # a kept-alive connection may have been closed by the server meanwhile
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                connection.request("POST", self._path, body.getvalue(), headers)
+                response = connection.getresponse()
+                payload = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    BrokenPipeError, http.client.CannotSendRequest):
+                self._drop_connection()
+                if attempt:
+                    raise
+
+        if response.will_close:
+            self._drop_connection()
+        if response.status != 200:
+            raise OSError(f"Transcription request failed: {response.status} {response.reason}")
+        return json.loads(payload.decode("utf-8")).get("text", "")
+
+    def close(self):
+        """Close the calling thread's connection"""
+        self._drop_connection()
+
+
+class _Window:
+    __slots__ = ("seq", "first", "last", "samples", "captured")
+
+    def __init__(self, seq, first, last, samples, captured):
+        self.seq = seq
+        self.first = first
+        self.last = last
+        self.samples = samples
+        self.captured = captured
+
+
+class StreamingTranscriber:
+    """
+    Cuts live audio into VAD-aligned overlapping windows for a transcription backend.
+
+    Call :py:meth:`start` with the stream parameters, :py:meth:`feed` from the
+    stream callback and :py:meth:`stop` to flush the tail and wait for the
+    outstanding windows.
+    """
+
+    def __init__(self, backend, window_seconds=6.0, overlap_seconds=1.0,
+                 align_seconds=1.5, ring_seconds=30.0, max_in_flight=2,
+                 on_transcript=None):
+        """
+        Args:
+            backend: Object with a ``transcribe(pcm16, rate) -> str`` method
+            window_seconds: Maximum window length
+            overlap_seconds: Audio repeated at the start of the next window
+            align_seconds: How far before the nominal window end a pause is searched
+            ring_seconds: Capacity of the ring buffer between callback and feeder
+            max_in_flight: Maximum number of windows being transcribed at once
+            on_transcript: Optional callable(Transcript), called from worker threads
+        """
+        if overlap_seconds + align_seconds >= window_seconds:
+            raise ValueError("overlap_seconds + align_seconds must be shorter than a window")
+        if ring_seconds <= window_seconds:
+            raise ValueError("ring_seconds must be longer than a window")
+
+        self.backend = backend
+        self.window_seconds = window_seconds
+        self.overlap_seconds = overlap_seconds
+        self.align_seconds = align_seconds
+        self.ring_seconds = ring_seconds
+        self.max_in_flight = max_in_flight
+        self.on_transcript = on_transcript
+
+        self.transcripts = []
+        self.latencies = []
+        self.dropped_frames = 0
+        self.skipped_windows = 0
+        self.errors = 0
+
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    def start(self, rate, channels, sample_format):
+        """
+        Allocate the ring buffer and start the feeder and worker threads
+
+        Args:
+            rate: Sample rate of the fed frames
+            channels: Number of interleaved channels
+            sample_format: PortAudio sample format of the fed frames
+        """
+        self.rate = int(rate)
+        self.channels = channels
+        self.sample_format = sample_format
+        self.vad = EnergyVad(self.rate)
+
+        self._ring = np.zeros(int(self.ring_seconds * self.rate), dtype=np.float32)
+        self._written = 0   # absolute frame counters
+        self._read = 0
+        self._chunk_times = deque()  # (end frame, monotonic capture time of that frame)
+        self._windows = Queue()
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._seq = 0
+        self._running = True
+
+        self._threads = [threading.Thread(target=self._feed_loop,
+                                          name="AsrFeeder", daemon=True)]
+        self._threads += [threading.Thread(target=self._work_loop,
+                                           name=f"AsrWorker-{i}", daemon=True)
+                          for i in range(self.max_in_flight)]
+        for thread in self._threads:
+            thread.start()
+
+    def feed(self, data, adc_time=None, current_time=None, captured=None):
+        """
+        Push frames (never blocks on the backend)
+
+        Args:
+            data: Bytes of whole interleaved frames
+            adc_time: time_info["input_buffer_adc_time"] of the callback
+            current_time: time_info["current_time"] of the callback
+            captured: Monotonic time of the first frame, when the frames are
+                fed later than the callback (replaces adc_time/current_time)
+        """
+        mono = to_float32(data, self.sample_format, self.channels).mean(axis=1)
+        # translate the ADC time of the chunk's last frame to the monotonic clock
+        # (without ADC timestamps the arrival time is the best estimate)
+        if captured is not None:
+            captured += len(mono) / self.rate
+        else:
+            captured = time.monotonic()
+            if adc_time and current_time:
+                captured += adc_time - current_time + len(mono) / self.rate
+
+        size = len(self._ring)
+        if len(mono) > size:
+            mono = mono[-size:]
+        with self._cond:
+            start = self._written % size
+            head = min(len(mono), size - start)
+            self._ring[start:start + head] = mono[:head]
+            self._ring[:len(mono) - head] = mono[head:]
+            self._written += len(mono)
+            self._chunk_times.append((self._written, captured))
+
+            overrun = self._written - self._read - size
+            if overrun > 0:
+                self._read += overrun
+                self.dropped_frames += overrun
+            self._cond.notify()
+
+    def _capture_time(self, frame):
+        """Monotonic capture time of absolute frame `frame` (holding the lock)"""
+        while len(self._chunk_times) > 1 and self._chunk_times[1][0] <= self._read:
+            self._chunk_times.popleft()
+        for end, captured in self._chunk_times:
+            if end >= frame:
+                return captured - (end - frame) / self.rate
+        return time.monotonic()
+
+    def _feed_loop(self):
+        window = int(self.window_seconds * self.rate)
+        overlap = int(self.overlap_seconds * self.rate)
+        align = int(self.align_seconds * self.rate)
+        size = len(self._ring)
+        sent = 0
+
+        while True:
+            with self._cond:
+                while self._running and self._written - self._read < window:
+                    self._cond.wait()
+                first = self._read
+                last = min(self._written, first + window)
+                if last <= first:
+                    break
+
+                index = np.arange(first, last) % size
+                samples = self._ring[index]
+                final = not self._running and last == self._written
+                if final and last <= sent:
+                    break  # only the overlap of the previous window is left
+
+                if not final:
+                    # end the window in the quietest part of its last `align` seconds
+                    search = samples[-align:]
+                    last = first + len(samples) - len(search) + self.vad.quietest_point(search)
+                    samples = samples[:last - first]
+                captured = self._capture_time(last)
+                self._read = last if final else max(first + 1, last - overlap)
+                # the overlap with the previous window was classified already
+                new = last - max(first, sent)
+                sent = last
+
+            if not self.vad.is_speech(samples, new=new):
+                self.skipped_windows += 1
+            else:
+                # blocks while max_in_flight windows are outstanding (backpressure)
+                self._in_flight.acquire()
+                self._windows.put(_Window(self._seq, first, last, samples, captured))
+                self._seq += 1
+
+            if final:
+                break
+
+        for _ in range(self.max_in_flight):
+            self._windows.put(None)
+
+    def _work_loop(self):
+        try:
+            while True:
+                window = self._windows.get()
+                if window is None:
+                    break
+                try:
+                    self._transcribe(window)
+                finally:
+                    self._in_flight.release()
+        finally:
+            close = getattr(self.backend, "close", None)
+            if close is not None:
+                close()
+
+    def _transcribe(self, window):
+        unit = self.rate // np.gcd(self.rate, ASR_RATE)
+        samples = window.samples[:len(window.samples) // unit * unit]
+        mono16k = resample(samples, self.rate, ASR_RATE)
+        pcm16 = (np.clip(mono16k, -1.0, 32767 / 32768) * 32768).astype("<i2").tobytes()
+
+        try:
+            text = self.backend.transcribe(pcm16, ASR_RATE)
+        except Exception as e:
+            with self._cond:
+                self.errors += 1
+            print(f"Warning: transcription of window {window.seq} failed: {e}")
+            return
+
+        transcript = Transcript(window.seq, text, window.first / self.rate,
+                                window.last / self.rate,
+                                time.monotonic() - window.captured)
+        with self._cond:
+            self.transcripts.append(transcript)
+            self.latencies.append(transcript.latency)
+        if self.on_transcript is not None:
+            self.on_transcript(transcript)
+
+    def stop(self):
+        """Transcribe the remaining audio and wait for all outstanding windows"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self):
+        """
+        Latency and drop statistics
+
+        Returns:
+            A dict with window counts, drops and ADC-to-text latency percentiles
+        """
+        with self._cond:
+            latencies = np.array(self.latencies)
+        stats = {
+            "windows": len(latencies),
+            "skipped_windows": self.skipped_windows,
+            "errors": self.errors,
+            "dropped_frames": self.dropped_frames,
+        }
+        if len(latencies):
+            stats.update(latency_p50=float(np.percentile(latencies, 50)),
+                         latency_p95=float(np.percentile(latencies, 95)),
+                         latency_max=float(latencies.max()))
+        return stats
@@ -3,16 +3,35 @@ Audio Recorder module for capturing system audio using WASAPI loopback devices.
 Based on official PyAudioWPatch examples.
 """
 
-from queue import Queue
 import pyaudiowpatch as pyaudio
 import wave
 import sys
+import threading
 import time
 import io # 确保导入 io 模块
 import datetime # 导入 datetime
+import json
 import os
 import atexit
 import locale
+import multiprocessing
+from concurrent.futures import Future
+from queue import Empty
+
+import channels
+import export_pipeline
+from agc import AutomaticGainControl, gain_path
+from device_watcher import DeviceWatcher, FormatAdapter
+from features import FeatureStore, LogMelFrontend
+from frame_bus import FrameBus, SubscriberDropped
+from loudness import LoudnessMeter
+from peaks import PeakIndex
+from preroll import PrerollBuffer
+from process_lock import ProcessLock
+from realtime_hygiene import RealtimeHygiene
+from recording_journal import RecordingJournal
+from recording_store import (RecordingStore, Silence, from_float32, gaps_path, silence_bytes,
+                             to_float32)
 
 # --- 控制台编码设置 ---
 # 在文件顶部尽早设置
@@ -32,28 +51,22 @@ except Exception as e:
     print(f"Warning: 设置控制台编码时出错: {e}")
 
 # --- 锁文件机制 ---
+# 使用操作系统级文件锁: 进程崩溃后锁会自动释放, 遗留的锁文件不会阻止重启
 LOCK_FILE = "audio_recorder.lock"
 
-# 检查锁文件
-if os.path.exists(LOCK_FILE):
-    print(f"Found lock file {LOCK_FILE}, another recording process may be running.")
-    print("If no other process is running, please delete the file and retry.")
-    sys.exit(1)
-
-# 创建锁文件
-with open(LOCK_FILE, "w", encoding="utf-8") as f:
-    f.write(str(os.getpid()))
+process_lock = ProcessLock(LOCK_FILE)
 
-# 注册退出时清理锁文件
+# 注册退出时释放锁
 def cleanup_lock():
-    if os.path.exists(LOCK_FILE):
-        try:
-            os.remove(LOCK_FILE)
-            print("Lock file has been removed.")
-        except Exception as e:
-            print(f"Error when cleaning up lock file: {e}")
+    process_lock.release()
+    print("Lock has been released.")
 
-atexit.register(cleanup_lock)
+# 导出进程池的子进程 (spawn) 会重新导入主模块, 子进程不获取锁
+if multiprocessing.current_process().name == "MainProcess":
+    if not process_lock.acquire():
+        print(f"Another recording process (PID {process_lock.owner_pid()}) is running.")
+        sys.exit(1)
+    atexit.register(cleanup_lock)
 
 # --- Force stdout and stderr to use UTF-8 ---
 # 这对于在 Windows 上运行 subprocess 并打印非 ASCII 字符至关重要
@@ -96,15 +109,85 @@ class AudioRecorder:
     
     CHUNK_SIZE = 1024
     FORMAT = pyaudio.paInt16
+    # the recording queue is only drained on save: no ceiling unless asked for
+    QUEUE_LIMIT_BYTES = None
+    # with a prober: the lowest rate worth recording (enough for transcription)
+    TARGET_RATE = 16000
+    # a running stream without callbacks for this long is considered lost
+    STALL_SECONDS = 2.0
+    # missing audio (by ADC time) longer than this is filled with silence
+    GAP_SECONDS = 0.05
     
-    def __init__(self):
-        """Initialize the audio recorder"""
-        self.p = pyaudio.PyAudio()
-        self.output_queue = Queue()
+    def __init__(self, recording_dir=None, journal_dir=None, transcriber=None,
+                 queue_limit_bytes=QUEUE_LIMIT_BYTES, queue_policy=channels.DROP_NEWEST,
+                 backend=None, prober=None, target_rate=TARGET_RATE, agc=False, realtime=False):
+        """
+        Initialize the audio recorder
+        
+        Args:
+            recording_dir: Optional directory for memory-mapped recording stores
+            journal_dir: Optional directory for crash-recovery journals
+            transcriber: Optional StreamingTranscriber fed with the live audio
+            queue_limit_bytes: Optional memory ceiling of the in-memory
+                recording queue (None for no limit)
+            queue_policy: Load-shedding policy of that queue once it reaches
+                the ceiling (see channels.py); BLOCK is not allowed because the
+                queue is only drained on save. Chunks the queue drops or
+                discards are saved as silence and listed in `lost`
+            backend: Optional PyAudio-compatible object (e.g. a fake backend for tests)
+            prober: Optional CapabilityProber; the stream then uses the cheapest
+                supported rate instead of the device default
+            target_rate: Lowest acceptable rate when a prober is given
+                (None for no lower bound)
+            agc: Level the transcriber feed (not the recording) with automatic gain control
+            realtime: Control the garbage collector and preallocate buffers
+                while recording
+        """
+        if queue_policy == channels.BLOCK:
+            raise ValueError("The recording queue is only drained on save and cannot block")
+        
+        self.p = backend if backend is not None else pyaudio.PyAudio()
+        self.output_queue = channels.BoundedChannel(
+            "recording", max_bytes=queue_limit_bytes, policy=queue_policy,
+            degrade=channels.make_downsampler(self.FORMAT, 2)
+            if queue_policy == channels.DOWNSAMPLE else None)
+        self.bus = FrameBus()
         self.stream = None
         self.recording = False
-        self.default_device = None
+        self.default_device = None  # probed ahead of time by probe_devices()
         self.current_device = None
+        self.device_format = None  # (rate, channels) the stream is opened with
+        self.prober = prober
+        self.target_rate = target_rate
+        self.rate = None
+        self.channels = None
+        self.recording_dir = recording_dir
+        self.store = None
+        self.peaks = None
+        self.mel = None
+        self.features = None
+        self.loudness = None
+        self.journal_dir = journal_dir
+        self.journal = None
+        self.journal_path = None
+        self.transcriber = transcriber
+        self.agc_enabled = agc
+        self.agc = None
+        self.hygiene = RealtimeHygiene() if realtime else None
+        self.preroll = None
+        self._standby = False
+        self._callback_lock = threading.Lock()
+        self._device_lock = threading.RLock()
+        self._follow_default = True
+        self._native_callback_stats = False
+        self._adapter = None
+        self._switch = None
+        self._last_callback = time.monotonic()
+        self.watcher = None
+        self._pipeline = None
+        self._pipeline_stop = threading.Event()
+        self._processed_frames = 0
+        self._reset_timeline()
     
     def __enter__(self):
         """Context manager entry method"""
@@ -114,10 +197,130 @@ class AudioRecorder:
         """Context manager exit method - ensures proper cleanup"""
         self.close()
         
+    def _reset_timeline(self):
+        """Forget the pause intervals, frame count and callback statistics of the previous recording"""
+        self.paused = False
+        self.pauses = []
+        self.recorded_frames = 0
+        self.first_frame_time = None
+        self.discontinuities = []
+        self.gaps = []
+        self.lost = []
+        self._evicted_frames = 0
+        self._queue_shedding = False
+        self._pause_started = None
+        self._next_adc_time = None
+        self.callbacks = 0
+        self.overflows = 0
+        # the standby callbacks before the start do not count
+        self._read_callback_stats(self.stream)
+        self.gil_wait_max = 0.0
+        self._gil_wait_total = 0.0
+        self._gil_wait_count = 0
+    
+    def _track_pause(self, frame_count, time_info):
+        """
+        Open/close soft-pause intervals at the ADC time of the current chunk
+        
+        Returns:
+            True if the chunk falls into a pause and must be discarded
+        """
+        paused = self.paused
+        if paused == (self._pause_started is not None) and self.first_frame_time is not None:
+            return paused
+        
+        # 当前块第一帧的墙上时间
+        adc_time = time_info.get("input_buffer_adc_time")
+        current_time = time_info.get("current_time")
+        wall = time.time()
+        if adc_time and current_time:
+            wall -= current_time - adc_time
+        
+        if self.first_frame_time is None and not paused:
+            self.first_frame_time = wall
+        if paused and self._pause_started is None:
+            self._pause_started = wall
+        elif not paused and self._pause_started is not None:
+            self._add_pause(self._pause_started, wall)
+        return paused
+    
+    def _add_pause(self, start, end):
+        """Record a pause interval at the current recording position"""
+        self.pauses.append({
+            "frame": self.recorded_frames,
+            "start": start,
+            "end": end,
+            "duration": end - start,
+        })
+        self._pause_started = None
+    
+    def _measure_callback(self, time_info, status):
+        """Count overflows and estimate how late the callback got the GIL"""
+        self.callbacks += 1
+        if status & pyaudio.paInputOverflow:
+            self.overflows += 1
+        current_time = time_info.get("current_time")
+        stream = self.stream
+        if not current_time or stream is None or self._native_callback_stats:
+            return
+        try:
+            # current_time is taken by PortAudio before the GIL is requested
+            wait = stream.get_time() - current_time
+        except OSError:
+            return
+        self.gil_wait_max = max(self.gil_wait_max, wait)
+        self._gil_wait_total += wait
+        self._gil_wait_count += 1
+    
+    def _enable_callback_stats(self):
+        """Turn on the native callback timing of the new stream, where the backend has it"""
+        enable = getattr(self.stream, "enable_callback_stats", None)
+        self._native_callback_stats = False
+        if enable is None:
+            return
+        try:
+            enable()
+            self._native_callback_stats = True
+        except (ValueError, OSError):
+            pass
+    
+    def _read_callback_stats(self, stream):
+        """
+        Fold the GIL waits the native callback measured on `stream` into the
+        figures of the recording and clear its histograms
+        """
+        if stream is None or not self._native_callback_stats:
+            return
+        try:
+            stats = stream.get_callback_stats(reset=True)
+        except OSError:
+            return  # the stream is closed or the device is gone
+        if not stats:
+            return
+        gil_wait = stats["gil_wait"]
+        self.gil_wait_max = max(self.gil_wait_max, gil_wait["max"])
+        self._gil_wait_total += gil_wait["mean"] * gil_wait["count"]
+        self._gil_wait_count += gil_wait["count"]
+    
     def callback(self, in_data, frame_count, time_info, status):
         """Callback function for audio processing"""
+        self._measure_callback(time_info, status)
         if len(in_data) > 0:
-            self.output_queue.put(in_data)
+            self._last_callback = time.monotonic()
+            with self._callback_lock:
+                if self._standby:
+                    self.preroll.write(in_data, time_info.get("input_buffer_adc_time"))
+                    return (in_data, pyaudio.paContinue)
+                if self._track_pause(frame_count, time_info):
+                    self._next_adc_time = None
+                    return (in_data, pyaudio.paContinue)
+                if self._switch is not None:
+                    self._mark_discontinuity(time_info)
+                self._fill_gap(frame_count, time_info)
+                if self._adapter is not None:
+                    in_data = self._adapter.convert(in_data)
+                    frame_count = len(in_data) // (self.channels * pyaudio.get_sample_size(self.FORMAT))
+                self._deliver(in_data, frame_count, time_info)
             # 如果是第一次收到数据或每100帧打印一次
             if hasattr(self, 'frame_counter'):
                 self.frame_counter += 1
@@ -150,30 +353,364 @@ class AudioRecorder:
             # Get default WASAPI speakers
             default_speakers = self.p.get_device_info_by_index(wasapi_info["defaultOutputDevice"])
             
-            # Look for a loopback device matching the default speakers
-            for loopback in self.p.get_loopback_device_info_generator():
-                if default_speakers["name"] in loopback["name"]:
-                    print(f"Found matching loopback device: {loopback['name']}")
-                    return loopback
-            
-            # If we get here, no suitable device was found
-            raise InvalidDevice("No suitable loopback device found")
+            # Look for the loopback device paired with the default speakers
+            try:
+                loopback = self.p.get_wasapi_loopback_analogue_by_dict(default_speakers)
+            except (LookupError, ValueError):
+                # If we get here, no suitable device was found
+                raise InvalidDevice("No suitable loopback device found")
+            print(f"Found matching loopback device: {loopback['name']}")
+            return loopback
+    
+    def probe_devices(self):
+        """
+        Look up the default loopback device ahead of the first recording
+        
+        The result is used by the next `start_recording()`/`enter_standby()`
+        without a device index; later ones probe again.
+        
+        Returns:
+            The device info dict of the default loopback device
+        """
+        self.default_device = self.find_loopback_device()
+        return self.default_device
     
     def list_devices(self):
         """List all audio devices with details"""
         self.p.print_detailed_system_info()
     
-    def start_recording(self, device_index=None):
+    def watch_devices(self, interval=1.0):
         """
-        Start recording from the specified device or find a default one
+        Follow device hot-plug and default-device changes in the background
         
         Args:
-            device_index: Optional index of the device to record from
+            interval: Seconds between device checks
         """
-        # Close any existing stream
-        self.stop_recording()
+        if self.watcher is None:
+            self.watcher = DeviceWatcher(self.check_device, interval)
+            self.watcher.start()
+    
+    def stop_watching(self):
+        """Stop following device changes"""
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+    
+    def _default_endpoint_id(self):
+        """
+        Endpoint ID of the current default output device, or None
+        
+        Asked from the OS, since the device list cannot be refreshed safely
+        while the stream is open. Without endpoint IDs (WinRT builds) a
+        default change is only followed once the stream is lost.
+        """
+        get_endpoint_id = getattr(self.p, "get_default_wasapi_endpoint_id", None)
+        if get_endpoint_id is None:
+            return None
+        try:
+            return get_endpoint_id(d_out=True)
+        except Exception:
+            return None
+    
+    def check_device(self):
+        """
+        Switch devices if the capture stream was lost or the default changed
+        
+        Returns:
+            True if the recorder switched to another device
+        """
+        with self._device_lock:
+            if self.current_device is None or not (self.recording or self._standby):
+                return False
+            
+            if self.stream is None:
+                reason = "capture device unavailable"
+            elif self.stream.is_stopped():
+                return False  # hard pause, the device is checked again on resume
+            elif not self.stream.is_active() \
+                    or time.monotonic() - self._last_callback > self.STALL_SECONDS:
+                reason = "capture stream lost"
+            else:
+                if not self._follow_default:
+                    return False
+                # 比较端点 ID, 不在流打开时刷新设备列表 (回环设备与其渲染设备共用同一 ID)
+                current = self.current_device.get("endpointId")
+                default = self._default_endpoint_id()
+                if current is None or default is None or default == current:
+                    return False
+                reason = "default device changed"
+            
+            return self._switch_device(reason)
+    
+    def _switch_device(self, reason):
+        """Reopen the capture on the current default loopback device"""
+        old_name = self.current_device["name"]
+        print(f"Switching capture device ({reason})...")
+        
+        if self.stream is not None:
+            stream, self.stream = self.stream, None
+            self._read_callback_stats(stream)
+            try:
+                stream.stop_stream()
+            except OSError:
+                pass  # the device may already be gone
+            try:
+                stream.close()
+            except OSError:
+                pass
+        
+        try:
+            # no stream is open now, so this may also reinitialize PortAudio
+            self.p.update_device_list()
+            device = self.find_loopback_device()
+        except (OSError, AudioRecorderException) as e:
+            print(f"No capture device available yet: {e}")
+            return False
+        
+        device_format = self._choose_format(device)
+        with self._callback_lock:
+            self.current_device = device
+            self.device_format = device_format
+            if self._standby:
+                # the pre-roll must stay in the device format it is committed in
+                self.preroll = PrerollBuffer(
+                    self.preroll.capacity / self.preroll.frame_size / self.preroll.rate,
+                    device_format[0],
+                    device_format[1] * pyaudio.get_sample_size(self.FORMAT))
+            elif device_format != (self.rate, self.channels):
+                self._adapter = FormatAdapter(self.FORMAT, *device_format,
+                                              self.rate, self.channels)
+            else:
+                self._adapter = None
+            self._next_adc_time = None
+            if self.recording:
+                # audio is missing from the last delivered chunk on
+                stopped = time.time() - (time.monotonic() - self._last_callback)
+                self._switch = {"from": old_name, "to": device["name"], "reason": reason,
+                                "stopped": stopped}
+        
+        self._last_callback = time.monotonic()
+        self._open_stream()
+        print(f"Capture continues on device: {device['name']}")
+        return True
+    
+    def _mark_discontinuity(self, time_info):
+        """Record where the audio of a new device joins the recording (holding the lock)"""
+        adc_time = time_info.get("input_buffer_adc_time")
+        current_time = time_info.get("current_time")
+        wall = time.time()
+        if adc_time and current_time:
+            wall -= current_time - adc_time
+        switch, self._switch = self._switch, None
+        self.discontinuities.append({
+            "frame": self.recorded_frames,
+            "time": wall,
+            "gap": max(0.0, wall - switch["stopped"]),
+            "from": switch["from"],
+            "to": switch["to"],
+            "reason": switch["reason"],
+        })
+    
+    def _fill_gap(self, frame_count, time_info):
+        """
+        Insert silence for audio the device did not deliver (holding the lock)
+        
+        WASAPI loopback delivers no packets while nothing plays; the jump in
+        ADC time between two chunks tells how much audio is missing.
+        """
+        adc_time = time_info.get("input_buffer_adc_time")
+        if not adc_time:
+            return
+        expected = self._next_adc_time
+        self._next_adc_time = adc_time + frame_count / self.device_format[0]
+        if expected is not None and adc_time - expected >= self.GAP_SECONDS:
+            self._deliver_silence(int(round((adc_time - expected) * self.rate)))
+    
+    def _deliver_silence(self, frames):
+        """
+        Add a run of silent frames to the timeline (holding the lock)
+        
+        The pipeline thread fills them in when the next chunk's position
+        (or the end of the recording) shows the jump.
+        """
+        if self.gaps and self.gaps[-1]["frame"] + self.gaps[-1]["frames"] == self.recorded_frames:
+            self.gaps[-1]["frames"] += frames
+        else:
+            self.gaps.append({"frame": self.recorded_frames, "frames": frames})
+        self.recorded_frames += frames
+        if self.journal is not None:
+            self.journal.append_silence(frames)
+    
+    def _deliver(self, in_data, frame_count, time_info):
+        """Publish a recorded chunk to the bus and the journal (holding the lock)"""
+        adc_time = time_info.get("input_buffer_adc_time")
+        current_time = time_info.get("current_time")
+        # monotonic time of the chunk's first frame, for the transcriber latency
+        captured = time.monotonic()
+        if adc_time and current_time:
+            captured += adc_time - current_time
+        else:
+            captured -= frame_count / self.rate
+        self.bus.publish(in_data, adc_time, self.recorded_frames, captured)
+        self.recorded_frames += frame_count
+        if self.journal is not None:
+            self.journal.append(in_data)
+    
+    def _start_pipeline(self):
+        """Subscribe the pipeline thread to the bus before the first chunk is published"""
+        self._stop_pipeline()
+        self._processed_frames = 0
+        self._pipeline_stop.clear()
+        subscriber = self.bus.subscribe("recording")
+        self._pipeline = threading.Thread(target=self._pipeline_loop, args=(subscriber,),
+                                          name="RecorderPipeline", daemon=True)
+        self._pipeline.start()
+    
+    def _stop_pipeline(self):
+        """Let the pipeline thread process every published chunk and wait for it"""
+        if self._pipeline is not None:
+            self._pipeline_stop.set()
+            self._pipeline.join()
+            self._pipeline = None
+    
+    def _pipeline_loop(self, subscriber):
+        """
+        Pipeline thread: store, meter and analyse the published chunks
         
-        # Determine which device to use
+        Keeps that work out of the audio callback, which only publishes.
+        """
+        dropped = False
+        try:
+            while True:
+                try:
+                    frame = subscriber.get(timeout=0.1)
+                except Empty:
+                    # nothing is published once the stop was requested
+                    if self._pipeline_stop.is_set() and subscriber.lag == 0:
+                        break
+                    continue
+                except SubscriberDropped:
+                    # the ring still holds the newest chunks; what was lost
+                    # becomes silence on the timeline
+                    dropped = True
+                    subscriber = self.bus.subscribe("recording", from_start=True)
+                    continue
+                missing = frame.position - self._processed_frames
+                if missing < 0:
+                    continue
+                if missing > 0:
+                    if dropped:
+                        self.lost.append({"frame": self._processed_frames, "frames": missing,
+                                          "cause": "pipeline"})
+                    self._process_silence(missing)
+                dropped = False
+                self._process(frame)
+            # silence the device left at the end of the recording
+            self._process_silence(self.recorded_frames - self._processed_frames)
+        finally:
+            subscriber.close()
+    
+    def _process_silence(self, frames):
+        """Pipeline thread: add silent frames to the outputs without storing zeros"""
+        if frames <= 0:
+            return
+        self._processed_frames += frames
+        self.loudness.add_silence(frames)
+        if self.agc is not None:
+            self._feed_transcriber(self.agc.add_silence(frames), None)
+        if self.store is not None:
+            self.store.add_silence(frames)
+            self.peaks.add_silence(frames)
+            self.features.append(self.mel.process_silence(frames))
+        else:
+            self.output_queue.put_nowait(Silence(frames))
+    
+    def _queued_frames(self, item):
+        """Timeline frames of an item of the recording queue"""
+        if isinstance(item, Silence):
+            return item.frames
+        frame_size = self.channels * pyaudio.get_sample_size(self.FORMAT)
+        if isinstance(item, channels.Downsampled):
+            return len(item.data) // frame_size * item.factor + len(item.tail) // frame_size
+        return len(item) // frame_size
+    
+    def _add_queue_loss(self, frame, frames):
+        """Pipeline thread: list audio the recording queue could not keep"""
+        if not self._queue_shedding:
+            self._queue_shedding = True
+            print(f"Warning: the recording queue is full "
+                  f"({self.output_queue.max_bytes} bytes); audio is being lost")
+        last = self.lost[-1] if self.lost else None
+        if last is not None and last["cause"] == "queue" \
+                and last["frame"] + last["frames"] == frame:
+            last["frames"] += frames
+        else:
+            self.lost.append({"frame": frame, "frames": frames, "cause": "queue"})
+    
+    def _process(self, frame):
+        """Pipeline thread: hand a published chunk to every output"""
+        data = frame.data
+        frames = len(data) // (self.channels * pyaudio.get_sample_size(self.FORMAT))
+        self._processed_frames += frames
+        samples = to_float32(data, self.FORMAT, self.channels)
+        self.loudness.add_samples(samples)
+        if self.store is not None:
+            self.store.write(data)
+            mono = samples.mean(axis=1)
+            self.peaks.add_samples(mono)
+            self.features.append(self.mel.process(mono))
+        else:
+            evicted = []
+            if not self.output_queue.put_nowait(data, evicted):
+                # the queue is full: keep the timeline and record what was lost
+                self.output_queue.put_nowait(Silence(frames), evicted)
+                self._add_queue_loss(self._processed_frames - frames, frames)
+            for item in evicted:
+                # DROP_OLDEST: the discarded chunks are the head of the saved timeline
+                count = self._queued_frames(item)
+                if not isinstance(item, Silence):
+                    self._add_queue_loss(self._evicted_frames, count)
+                self._evicted_frames += count
+        if self.agc is not None:
+            first_in = self.agc.frames_in
+            leveled = self.agc.process(samples)
+            # the AGC output starts `delay` frames before this chunk
+            delay = first_in - (self.agc.frames_out - len(leveled))
+            self._feed_transcriber(leveled, frame.captured - delay / self.rate)
+        elif self.transcriber is not None:
+            self.transcriber.feed(data, captured=frame.captured)
+    
+    def _feed_transcriber(self, samples, captured):
+        """Feed float32 frames (e.g. the AGC output) to the transcriber"""
+        if self.transcriber is not None and len(samples):
+            self.transcriber.feed(from_float32(samples, self.FORMAT), captured=captured)
+    
+    def _choose_format(self, device):
+        """
+        Stream rate and channel count for a device
+        
+        Returns:
+            A (rate, channels) tuple
+        """
+        default = (int(device["defaultSampleRate"]), device["maxInputChannels"])
+        if self.prober is None:
+            return default
+        try:
+            # 声道数保持设备默认值, 只在采样率上选择最便宜的格式
+            choice = self.prober.choose(device, self.target_rate, device["maxInputChannels"],
+                                        formats=(self.FORMAT,))
+        except OSError as e:
+            print(f"Warning: format probing failed: {e}")
+            return default
+        if choice is None:
+            print(f"Warning: no probed format of {device['name']} meets the target, "
+                  f"using the device default")
+            return default
+        return choice[:2]
+    
+    def _select_device(self, device_index=None):
+        """Set `current_device` to the requested device or the default loopback"""
+        self._follow_default = device_index is None
         if device_index is not None:
             try:
                 self.current_device = self.p.get_device_info_by_index(device_index)
@@ -182,52 +719,416 @@ class AudioRecorder:
                 print(f"Error using specified device {device_index}: {e}")
                 print("Falling back to default device")
                 self.current_device = self.find_loopback_device()
+        elif self.default_device is not None:
+            # 使用预先探测到的默认设备 (只用一次, 之后默认设备可能已改变)
+            self.current_device, self.default_device = self.default_device, None
+            print(f"Using default device: {self.current_device['name']}")
         else:
             # Use default device
             self.current_device = self.find_loopback_device()
-        
-        # Store recording start time
-        self.recording_start_time = datetime.datetime.now()
-        
-        # Open the stream
+        self.device_format = self._choose_format(self.current_device)
+    
+    def _open_stream(self):
+        """Open the callback stream on `current_device`"""
         try:
             self.stream = self.p.open(
                 format=self.FORMAT,
-                channels=self.current_device["maxInputChannels"],
-                rate=int(self.current_device["defaultSampleRate"]),
+                channels=self.device_format[1],
+                rate=self.device_format[0],
                 frames_per_buffer=self.CHUNK_SIZE,
                 input=True,
                 input_device_index=self.current_device["index"],
                 stream_callback=self.callback
             )
-            
-            self.recording = True
-            print(f"Recording started from device: {self.current_device['name']}")
-            print("Press Ctrl+C to stop recording...")
-            
         except Exception as e:
             raise AudioRecorderException(f"Failed to start recording: {e}")
+        self._enable_callback_stats()
+    
+    def _prepare_outputs(self):
+        """Reset the timeline and open the per-recording outputs"""
+        # Store recording start time
+        self.recording_start_time = datetime.datetime.now()
+        self._reset_timeline()
+        # 录音格式在开始时固定, 切换设备后的音频会被转换为该格式
+        self.rate, self.channels = self.device_format
+        self._adapter = None
+        self.loudness = LoudnessMeter(self.rate, self.channels, self.FORMAT)
+        
+        if self.recording_dir is not None:
+            self._open_store()
+        if self.journal_dir is not None:
+            self._open_journal()
+        if self.output_queue.policy == channels.DOWNSAMPLE:
+            self.output_queue.degrade = channels.make_downsampler(self.FORMAT, self.channels)
+        if self.transcriber is not None:
+            self.transcriber.start(self.rate, self.channels, self.FORMAT)
+        self.agc = AutomaticGainControl(self.rate) if self.agc_enabled else None
+        self._start_pipeline()
     
-    def pause_recording(self):
-        """Pause the recording stream"""
-        if self.stream and not self.stream.is_stopped():
+    def enter_standby(self, device_index=None, preroll_seconds=10.0):
+        """
+        Open the stream now and keep the last `preroll_seconds` of audio
+        
+        A later `start_recording()` on the same device starts instantly and
+        includes the buffered audio; `stop_recording()` then returns to
+        standby instead of closing the stream.
+        
+        Args:
+            device_index: Optional index of the device to listen to
+            preroll_seconds: Length of the pre-roll ring
+        """
+        self.leave_standby()
+        self.stop_recording()
+        self._select_device(device_index)
+        self.preroll = PrerollBuffer(
+            preroll_seconds, self.device_format[0],
+            self.device_format[1] * pyaudio.get_sample_size(self.FORMAT))
+        self._standby = True
+        self._open_stream()
+        print(f"Standby on device: {self.current_device['name']} "
+              f"({preroll_seconds:g}s pre-roll)")
+    
+    @property
+    def standby(self):
+        """True while the stream runs only to fill the pre-roll"""
+        return self._standby
+    
+    def read_standby(self, position=None):
+        """
+        Audio the standby stream captured after `position`
+        
+        Lets a watcher such as IdleMonitor share the standby stream instead
+        of opening a second stream on the device.
+        
+        Args:
+            position: Position returned by the previous call (None to start now)
+        
+        Returns:
+            (data, position): interleaved frames in `device_format`, or
+            (None, None) if the recorder is not on standby
+        """
+        with self._callback_lock:
+            if not self._standby or self.preroll is None:
+                return None, None
+            return self.preroll.read_since(position)
+    
+    def leave_standby(self):
+        """Leave standby mode, closing the stream unless a recording is running"""
+        if self.preroll is None:
+            return
+        self.preroll = None
+        if self._standby:
+            self._standby = False
+            if self.stream:
+                self.stream.stop_stream()
+                self.stream.close()
+                self.stream = None
+    
+    def _commit_preroll(self):
+        """Start recording on the standby stream, beginning with the pre-roll"""
+        self._prepare_outputs()
+        if self.hygiene is not None:
+            # collect before the recording callbacks need the GIL
+            self.hygiene.enter()
+        with self._callback_lock:
+            data = self.preroll.read()
+            start_adc_time = self.preroll.start_adc_time()
+            end_adc_time = self.preroll.end_adc_time
+            self.preroll.clear()
+            if self.stream.is_stopped():
+                self.stream.start_stream()
+            if data:
+                time_info = {"input_buffer_adc_time": start_adc_time,
+                             "current_time": self.stream.get_time() if start_adc_time else None}
+                frame_count = len(data) // self.preroll.frame_size
+                self._track_pause(frame_count, time_info)
+                self._deliver(data, frame_count, time_info)
+                self._next_adc_time = end_adc_time
+            self._standby = False
+        self.recording = True
+        print(f"Recording started from device: {self.current_device['name']} "
+              f"(with {self.recorded_frames / self.preroll.rate:.1f}s pre-roll)")
+    
+    def _deliver_preroll(self, preroll):
+        """Record the audio of a pre-roll captured by another stream"""
+        data = preroll.read()
+        in_channels = preroll.frame_size // pyaudio.get_sample_size(self.FORMAT)
+        if (preroll.rate, in_channels) != (self.rate, self.channels):
+            data = FormatAdapter(self.FORMAT, preroll.rate, in_channels,
+                                 self.rate, self.channels).convert(data)
+        frame_count = len(data) // (self.channels * pyaudio.get_sample_size(self.FORMAT))
+        with self._callback_lock:
+            self.first_frame_time = time.time() - preroll.frames / preroll.rate
+            self._deliver(data, frame_count, {})
+    
+    def start_recording(self, device_index=None, preroll=None):
+        """
+        Start recording from the specified device or find a default one
+        
+        Args:
+            device_index: Optional index of the device to record from
+            preroll: Optional PrerollBuffer with audio captured just before
+                the start (e.g. by an IdleMonitor probe), recorded first
+        """
+        with self._device_lock:
+            self._start_recording(device_index, preroll)
+    
+    def _start_recording(self, device_index, preroll=None):
+        if self._standby and device_index in (None, self.current_device["index"]):
+            self._commit_preroll()
+            return
+        
+        # Close any existing stream
+        self.leave_standby()
+        self.stop_recording()
+        
+        self._select_device(device_index)
+        self._prepare_outputs()
+        if preroll is not None and preroll.frames:
+            self._deliver_preroll(preroll)
+        if self.hygiene is not None:
+            # collect before the stream opens, not while its callback waits
+            self.hygiene.enter()
+        try:
+            self._open_stream()
+        except AudioRecorderException:
+            self._abort_outputs()
+            raise
+        self.recording = True
+        print(f"Recording started from device: {self.current_device['name']}")
+        print("Press Ctrl+C to stop recording...")
+    
+    def _open_store(self):
+        """Create a fresh recording store for the current device"""
+        self._close_store()
+        os.makedirs(self.recording_dir, exist_ok=True)
+        timestamp = self.recording_start_time.strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.recording_dir, f"recording_{timestamp}.pcm")
+        # 实时模式下预分配整段录音, 回调中不再扩容
+        preallocate = {} if self.hygiene is None else \
+            {"preallocate_seconds": self.hygiene.preallocate_seconds}
+        self.store = RecordingStore(
+            path,
+            channels=self.channels,
+            rate=self.rate,
+            sample_format=self.FORMAT,
+            **preallocate
+        )
+        self.peaks = PeakIndex(self.store.rate)
+        if self.hygiene is not None:
+            self.peaks.reserve(self.store.capacity)
+        self.mel = LogMelFrontend(self.store.rate)
+        self.features = FeatureStore.for_frontend(os.path.splitext(path)[0] + ".mel", self.mel)
+        print(f"Recording store: {path}")
+    
+    def _close_store(self):
+        """Finalize the current recording store, if any"""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        if self.features is not None:
+            self.features.close()
+    
+    def _open_journal(self):
+        """Start a new crash-recovery journal for the current device"""
+        self._close_journal()
+        os.makedirs(self.journal_dir, exist_ok=True)
+        timestamp = self.recording_start_time.strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.journal_dir, f"recording_{timestamp}.journal")
+        self.journal = RecordingJournal(
+            path,
+            channels=self.channels,
+            rate=self.rate,
+            sample_format=self.FORMAT
+        )
+        print(f"Recording journal: {path}")
+    
+    def _close_journal(self):
+        """Flush and close the current journal (the file is kept until saved)"""
+        if self.journal is not None:
+            try:
+                self.journal.close()
+            except OSError as e:
+                # the rest of the recording is still finalized
+                print(f"Warning: journal write failed, the journal is incomplete: {e}")
+            if self.journal.dropped:
+                print(f"Warning: journal writer dropped {self.journal.dropped} chunks")
+            self.journal_path = self.journal.path
+            self.journal = None
+    
+    def _discard_journal(self):
+        """Remove the journal of a recording that has been saved successfully"""
+        if self.journal is None and self.journal_path is not None:
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self.journal_path = None
+    
+    def pause_recording(self, soft=True):
+        """
+        Pause the recording
+        
+        Pause intervals are kept in `pauses` and written to the `.json`
+        metadata sidecar, so `wall_time()` can map offsets back to wall-clock time.
+        
+        Args:
+            soft: Keep the stream running and discard frames (fast resume).
+                If False, the stream is stopped as before.
+        """
+        if not self.stream or self.paused or self.stream.is_stopped():
+            return
+        if soft:
+            self.paused = True
+        else:
             self.stream.stop_stream()
-            print("Recording paused")
+            self._pause_started = time.time()
+            self._next_adc_time = None
+        print("Recording paused")
     
     def resume_recording(self):
-        """Resume a paused recording stream"""
-        if self.stream and self.stream.is_stopped():
+        """Resume a paused recording"""
+        if not self.stream:
+            return
+        if self.paused:
+            # the callback closes the pause interval with the next chunk
+            self.paused = False
+            print("Recording resumed")
+        elif self.stream.is_stopped():
+            self._add_pause(self._pause_started or time.time(), time.time())
             self.stream.start_stream()
             print("Recording resumed")
     
+    def wall_time(self, offset):
+        """
+        Wall-clock time of a position in the recording
+        
+        Args:
+            offset: Seconds from the start of the recorded audio (pauses excluded)
+        
+        Returns:
+            A POSIX timestamp, including the pauses and device-switch gaps before `offset`
+        """
+        rate = self.rate
+        start = self.first_frame_time if self.first_frame_time is not None \
+            else self.recording_start_time.timestamp()
+        gaps = sum(p["duration"] for p in self.pauses if p["frame"] <= offset * rate)
+        gaps += sum(d["gap"] for d in self.discontinuities if d["frame"] <= offset * rate)
+        return start + offset + gaps
+    
+    def recording_metadata(self):
+        """
+        Metadata of the current recording
+        
+        Returns:
+            A dict with the device, timing and pause intervals of the recording
+        """
+        return {
+            "device": self.current_device["name"],
+            "rate": self.rate,
+            "channels": self.channels,
+            "started": self.recording_start_time.isoformat(),
+            "first_frame_time": self.first_frame_time,
+            "frames": self.recorded_frames,
+            "pauses": list(self.pauses),
+            "discontinuities": list(self.discontinuities),
+            "gaps": [dict(gap) for gap in self.gaps],
+            "lost": [dict(lost) for lost in self.lost],
+            "loudness": self.loudness.metrics() if self.loudness is not None else None,
+        }
+    
+    def _write_metadata(self, audio_path):
+        """Write the recording metadata next to `audio_path` as a .json file"""
+        path = os.path.splitext(audio_path)[0] + ".json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.recording_metadata(), f, ensure_ascii=False, indent=2)
+        return path
+    
     def stop_recording(self):
-        """Stop recording and close the stream"""
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-            self.stream = None
+        """Stop recording and close the stream (or return to standby)"""
+        with self._device_lock:
+            self._stop_recording()
+    
+    def _stop_recording(self):
+        if self.recording and self.stream is None:
+            # the device was lost and no replacement was found
+            self.recording = False
+            self._finish_outputs()
+            return
+        if self.stream and self.recording:
+            self._fill_trailing_gap()
+            self._read_callback_stats(self.stream)
+            if self.preroll is not None:
+                with self._callback_lock:
+                    self._standby = True
+                    self.preroll.clear()
+                if self.stream.is_stopped():
+                    self.stream.start_stream()
+            else:
+                self.stream.stop_stream()
+                self.stream.close()
+                self.stream = None
             self.recording = False
-            print("Recording stopped")
+            self._finish_outputs()
+    
+    def _fill_trailing_gap(self):
+        """Fill silence up to the stop command if the device went quiet before it"""
+        with self._callback_lock:
+            if self._next_adc_time is None or self.paused or self.stream.is_stopped():
+                return
+            try:
+                now = self.stream.get_time() - self.stream.get_input_latency()
+            except OSError:
+                return
+            if now - self._next_adc_time >= self.GAP_SECONDS:
+                self._deliver_silence(int(round((now - self._next_adc_time) * self.rate)))
+            self._next_adc_time = None
+    
+    def _finish_outputs(self):
+        """Close the per-recording outputs"""
+        if self.hygiene is not None:
+            self.hygiene.exit()
+        if self._pause_started is not None:
+            self._add_pause(self._pause_started, time.time())
+        self.paused = False
+        self._switch = None
+        self._stop_pipeline()
+        if self.store is not None:
+            self.store.flush()
+            self.peaks.finish()
+            self.peaks.save(os.path.splitext(self.store.path)[0] + ".peaks.npz")
+            self.features.close()
+            self._write_metadata(self.store.path)
+        self._close_journal()
+        if self.agc is not None:
+            self._feed_transcriber(self.agc.flush(), None)
+            if self.store is not None:
+                self.agc.curve.save(gain_path(self.store.path))
+        if self.transcriber is not None:
+            self.transcriber.stop()
+            print(f"Transcription: {self.transcriber.stats()}")
+        loudness = self.loudness.metrics()
+        if loudness["quiet"]:
+            print(f"Warning: the recording is very quiet "
+                  f"({loudness['integrated_lufs']} LUFS integrated)")
+        if loudness["clipped"]:
+            print(f"Warning: {loudness['clipped_samples']} samples are clipped")
+        print("Recording stopped")
+    
+    def _abort_outputs(self):
+        """Close and remove the outputs of a recording whose stream failed to open"""
+        if self.hygiene is not None:
+            self.hygiene.exit()
+        self._stop_pipeline()
+        if self.transcriber is not None:
+            self.transcriber.stop()
+        paths = []
+        if self.store is not None:
+            paths += [self.store.path, gaps_path(self.store.path), self.features.path]
+        self._close_store()
+        self._close_journal()
+        self._discard_journal()
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
     
     def save_recording(self, filename=None):
         """
@@ -244,31 +1145,180 @@ class AudioRecorder:
             timestamp = self.recording_start_time.strftime("%Y%m%d_%H%M%S")
             filename = f"output_{timestamp}.wav"
         
+        if self.store is not None:
+            if len(self.store) == 0:
+                print("No audio data to save")
+                return None
+            print(f"Saving recording to {filename}...")
+            self.store.export_wav(filename)
+            self._write_metadata(filename)
+            print(f"Recording saved to {filename}")
+            self._discard_journal()
+            return filename
+        
         if not self.output_queue.empty():
             print(f"Saving recording to {filename}...")
             
             with wave.open(filename, 'wb') as wf:
-                wf.setnchannels(self.current_device["maxInputChannels"])
+                wf.setnchannels(self.channels)
                 wf.setsampwidth(pyaudio.get_sample_size(self.FORMAT))
-                wf.setframerate(int(self.current_device["defaultSampleRate"]))
+                wf.setframerate(self.rate)
                 
                 # Write all audio data from the queue
+                frame_size = self.channels * pyaudio.get_sample_size(self.FORMAT)
+                # the chunks DROP_OLDEST discarded started the recording
+                for block in silence_bytes(self._evicted_frames, frame_size, self.FORMAT):
+                    wf.writeframes(block)
+                self._evicted_frames = 0
                 while not self.output_queue.empty():
-                    wf.writeframes(self.output_queue.get())
+                    item = self.output_queue.get()
+                    if isinstance(item, Silence):
+                        for block in silence_bytes(item.frames, frame_size, self.FORMAT):
+                            wf.writeframes(block)
+                    else:
+                        wf.writeframes(channels.restore_rate(item, self.FORMAT, self.channels))
             
+            dropped = sum(lost["frames"] for lost in self.lost if lost["cause"] == "queue")
+            if dropped:
+                print(f"Warning: the recording queue was full; {dropped / self.rate:.1f}s "
+                      f"of audio were saved as silence")
+            self._write_metadata(filename)
             print(f"Recording saved to {filename}")
+            self._discard_journal()
             return filename
         else:
             print("No audio data to save")
             return None
     
+    def subscribe(self, name, from_start=False):
+        """
+        Subscribe a consumer to the captured chunks
+        
+        Args:
+            name: Consumer name (shown when it is dropped for being too slow)
+            from_start: Start with the oldest chunk still buffered on the bus
+        
+        Returns:
+            A frame_bus.Subscriber; iterate it or call get() from the consumer's thread
+        """
+        return self.bus.subscribe(name, from_start)
+    
+    def stats(self):
+        """
+        Live statistics of the current (or last) recording
+        
+        Returns:
+            A dict with the recorded length, gap and discontinuity counts,
+            the loudness figures (see loudness.LoudnessMeter.metrics) and
+            callback overflow and GIL-wait figures (measured natively where
+            the stream supports callback statistics, estimated otherwise)
+        """
+        self._read_callback_stats(self.stream)
+        return {
+            "recording": self.recording,
+            "frames": self.recorded_frames,
+            "seconds": self.recorded_frames / self.rate if self.rate else 0.0,
+            "gaps": len(self.gaps),
+            "lost_frames": sum(lost["frames"] for lost in self.lost),
+            "discontinuities": len(self.discontinuities),
+            "loudness": self.loudness.metrics() if self.loudness is not None else None,
+            "agc_gain_db": round(self.agc.gain_db, 2) if self.agc is not None else None,
+            "realtime": self.hygiene is not None and self.hygiene.active,
+            "callbacks": self.callbacks,
+            "overflows": self.overflows,
+            "gil_wait_max_ms": 1000 * self.gil_wait_max,
+            "gil_wait_mean_ms": 1000 * self._gil_wait_total / max(self._gil_wait_count, 1),
+        }
+    
+    def channel_metrics(self):
+        """
+        Metrics of the bounded channels between the capture and its consumers
+        
+        Returns:
+            A list of channel metric dicts (see channels.BoundedChannel.metrics)
+        """
+        metrics = [self.output_queue.metrics(), self.bus.metrics()]
+        if self.journal is not None:
+            metrics.append(self.journal.write_channel.metrics())
+        return metrics
+    
+    def export_recording(self, output_dir=None, derivatives=export_pipeline.DERIVATIVES,
+                         progress=None):
+        """
+        Export the recording store to WAV/FLAC/ASR/peaks files in parallel
+        
+        Args:
+            output_dir: Optional output directory (defaults to the recording directory)
+            derivatives: Derivatives to produce, see export_pipeline.export_recording
+            progress: Optional callable(done_frames, total_frames, bytes_per_second)
+        
+        Returns:
+            A dict with the output paths per derivative and throughput statistics
+        """
+        if self.store is None:
+            raise AudioRecorderException("Parallel export requires a recording_dir")
+        
+        self.store.flush()
+        print(f"Exporting {self.store.path}...")
+        result = export_pipeline.export_recording(
+            self.store.path, output_dir, derivatives, progress=progress)
+        print(f"Exported {result['frames']} frames in {result['seconds']:.1f}s "
+              f"({result['bytes_per_second'] / 1e6:.1f} MB/s)")
+        self._discard_journal()
+        return result
+    
     def close(self):
         """Close the recorder and release resources"""
+        self.stop_watching()
         self.stop_recording()
+        self.leave_standby()
+        self._close_store()
+        self.bus.close()
         self.p.terminate()
         print("Audio recorder closed")
 
 
+def prewarm_recorder(**kwargs):
+    """
+    Create an AudioRecorder in the background
+    
+    PortAudio initialization and the default device lookup both enumerate
+    the audio drivers, which can take a noticeable time. Call this when the
+    application starts and take the recorder from the future when it is
+    first needed, so the UI never waits on the drivers.
+    
+    Args:
+        **kwargs: AudioRecorder arguments
+    
+    Returns:
+        A concurrent.futures.Future resolving to the AudioRecorder
+    """
+    recorder_future = Future()
+    recorder_future.set_running_or_notify_cancel()
+    
+    def probe(backend_future):
+        try:
+            recorder = AudioRecorder(backend=backend_future.result(), **kwargs)
+        except Exception as e:
+            recorder_future.set_exception(e)
+            return
+        try:
+            recorder.probe_devices()
+        except AudioRecorderException as e:
+            # no device yet; start_recording() will look again
+            print(f"Warning: device probing failed: {e}")
+        recorder_future.set_result(recorder)
+    
+    backend = kwargs.pop("backend", None)
+    if backend is not None:
+        backend_future = Future()
+        backend_future.set_result(backend)
+        threading.Thread(target=probe, args=(backend_future,), daemon=True).start()
+    else:
+        pyaudio.PyAudio.initialize_async().add_done_callback(probe)
+    return recorder_future
+
+
 def record_audio(duration=None):
     """
     Simple function to record audio for a specified duration
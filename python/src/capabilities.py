@@ -0,0 +1,159 @@
+"""
+Device capability probing.
+
+`is_format_supported` costs one driver round trip per (rate, channels,
+format) combination. `CapabilityProber` tests a whole grid per device, in
+parallel threads for host APIs whose drivers can handle concurrent queries.
+It caches the supported combinations in a JSON file keyed by device endpoint
+and PortAudio version, so later launches skip the probing entirely.
+`choose()` then picks the cheapest supported format meeting a target
+quality instead of trusting the device defaults.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pyaudiowpatch as pyaudio
+
+
+RATES = (8000, 11025, 16000, 22050, 32000, 44100, 48000, 88200, 96000, 192000)
+# cheapest first
+FORMATS = (pyaudio.paInt16, pyaudio.paInt24, pyaudio.paInt32, pyaudio.paFloat32)
+# host APIs whose format queries may run concurrently
+PARALLEL_HOST_APIS = (pyaudio.paWASAPI,)
+
+
+def device_key(device):
+    """
+    Cache key of a device: its identity plus the PortAudio version
+
+    The WASAPI endpoint ID identifies a device even when another one has the
+    same name; the name is only used without it. A loopback device shares the
+    endpoint ID of its render device, so the direction is part of the key.
+    """
+    return "|".join(str(part) for part in (
+        device.get("endpointId") or device["name"], device["hostApi"],
+        device.get("isLoopbackDevice", False), device["maxInputChannels"],
+        device["maxOutputChannels"], int(device["defaultSampleRate"]),
+        pyaudio.get_portaudio_version_text()))
+
+
+def format_cost(rate, channels, sample_format):
+    """Bytes per second of a stream format"""
+    return rate * channels * pyaudio.get_sample_size(sample_format)
+
+
+class CapabilityProber:
+    """Probes and memoizes the input formats supported by devices"""
+
+    def __init__(self, p, cache_path=None, max_workers=4, rates=RATES, formats=FORMATS):
+        """
+        Args:
+            p: PyAudio instance
+            cache_path: Optional JSON file keeping results across launches
+            max_workers: Threads probing one device (for PARALLEL_HOST_APIS)
+            rates: Sample rates to test
+            formats: Sample formats to test
+        """
+        self.p = p
+        self.cache_path = cache_path
+        self.max_workers = max_workers
+        self.rates = tuple(rates)
+        self.formats = tuple(formats)
+        self._lock = threading.Lock()
+        self._cache = self._load()
+
+    def _load(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return {key: [tuple(entry) for entry in entries]
+                        for key, entries in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring unreadable capability cache {self.cache_path}: {e}")
+            return {}
+
+    def _save(self):
+        if self.cache_path is None:
+            return
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({key: [list(entry) for entry in entries]
+                       for key, entries in self._cache.items()}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _host_api_type(self, device):
+        try:
+            return self.p.get_host_api_info_by_index(device["hostApi"])["type"]
+        except (OSError, KeyError):
+            return None
+
+    def _test(self, device, rate, channels, sample_format):
+        try:
+            return self.p.is_format_supported(
+                rate, input_device=device["index"], input_channels=channels,
+                input_format=sample_format)
+        except ValueError:
+            return False
+
+    def probe(self, device, refresh=False):
+        """
+        Supported input formats of a device (from the cache when possible)
+
+        Args:
+            device: Device info dict
+            refresh: Probe again even if the device is cached
+
+        Returns:
+            A list of supported (rate, channels, format) tuples
+        """
+        key = device_key(device)
+        with self._lock:
+            if not refresh and key in self._cache:
+                return self._cache[key]
+
+        grid = [(rate, channels, sample_format)
+                for rate in self.rates
+                for channels in range(1, device["maxInputChannels"] + 1)
+                for sample_format in self.formats]
+        # the device's own format is always worth testing
+        default = (int(device["defaultSampleRate"]), device["maxInputChannels"])
+        grid += [default + (f,) for f in self.formats if default + (f,) not in grid]
+
+        workers = self.max_workers if self._host_api_type(device) in PARALLEL_HOST_APIS else 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda entry: self._test(device, *entry), grid))
+        supported = [entry for entry, ok in zip(grid, results) if ok]
+
+        with self._lock:
+            self._cache[key] = supported
+            try:
+                self._save()
+            except OSError as e:
+                print(f"Warning: could not write capability cache: {e}")
+        return supported
+
+    def choose(self, device, min_rate=None, min_channels=1, formats=None):
+        """
+        Cheapest supported input format meeting a target quality
+
+        Args:
+            device: Device info dict
+            min_rate: Lowest acceptable sample rate (None for no lower bound)
+            min_channels: Lowest acceptable channel count
+            formats: Acceptable sample formats (None for all probed formats)
+
+        Returns:
+            A (rate, channels, format) tuple, or None if nothing qualifies
+        """
+        candidates = [entry for entry in self.probe(device)
+                      if (min_rate is None or entry[0] >= min_rate)
+                      and entry[1] >= min_channels
+                      and (formats is None or entry[2] in formats)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda entry: (format_cost(*entry),
+                                                  self.formats.index(entry[2])))
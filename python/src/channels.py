@@ -0,0 +1,302 @@
+"""
+Bounded channels between the capture and its consumers.
+
+Every consumer (disk writer, encoder, ASR client, ...) gets its own channel
+with a hard memory ceiling and a policy for what happens when it is full:
+
+- BLOCK:        the producer waits for room - only for producer threads,
+                a non-blocking put (as done from the audio callback) drops
+                the new chunk instead,
+- DROP_OLDEST:  the oldest queued chunks are discarded to make room,
+- DROP_NEWEST:  the new chunk is discarded,
+- DOWNSAMPLE:   above a high-water mark new chunks are degraded (e.g. to half
+                the sample rate) before queueing; if they still do not fit
+                they are dropped.
+
+Channels mirror the parts of the queue.Queue API used in this project and
+keep counters (see :py:meth:`BoundedChannel.metrics`).
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+from queue import Empty, Full
+
+import numpy as np
+import pyaudiowpatch as pyaudio
+
+from recording_store import from_float32, to_float32
+
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DOWNSAMPLE = "downsample"
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, DOWNSAMPLE)
+
+# a chunk reduced to 1/factor of its sample rate by a DOWNSAMPLE channel;
+# `tail` holds the frames that did not fill a whole group, at the original rate
+Downsampled = namedtuple("Downsampled", ["data", "factor", "tail"], defaults=(b"",))
+
+
+class ChannelClosed(Exception):
+    """The channel was closed and all queued chunks have been consumed"""
+    pass
+
+
+def nbytes(item):
+    """Default size of a queued item: buffer size, or 0 for other objects"""
+    if isinstance(item, Downsampled):
+        return memoryview(item.data).nbytes + memoryview(item.tail).nbytes
+    try:
+        return memoryview(item).nbytes
+    except TypeError:
+        return 0
+
+
+def make_downsampler(sample_format, channels, factor=2):
+    """
+    Degrade function for DOWNSAMPLE channels carrying raw interleaved frames
+
+    Frames are averaged in groups of `factor` (a crude but cheap low-pass),
+    so the chunk shrinks by `factor` and its rate drops accordingly. Frames
+    left over after the last whole group are kept unchanged as the tail.
+
+    Returns:
+        A callable(data) -> Downsampled
+    """
+    def downsample(data):
+        samples = to_float32(data, sample_format, channels)
+        whole = len(samples) // factor * factor
+        reduced = samples[:whole].reshape(-1, factor, channels).mean(axis=1)
+        frame_size = pyaudio.get_sample_size(sample_format) * channels
+        return Downsampled(from_float32(reduced, sample_format), factor,
+                           bytes(data[whole * frame_size:]))
+
+    return downsample
+
+
+def restore_rate(item, sample_format, channels):
+    """
+    Bytes of a chunk at its original rate (Downsampled chunks repeat frames)
+
+    Keeps the timeline of a recording intact when some chunks were degraded.
+    """
+    if not isinstance(item, Downsampled):
+        return item
+    frame_size = pyaudio.get_sample_size(sample_format) * channels
+    frames = np.frombuffer(item.data, dtype=np.uint8).reshape(-1, frame_size)
+    return np.repeat(frames, item.factor, axis=0).tobytes() + bytes(item.tail)
+
+
+class BoundedChannel:
+    """Bounded FIFO with a load-shedding policy and metrics"""
+
+    def __init__(self, name, max_bytes=None, max_items=None, policy=DROP_NEWEST,
+                 degrade=None, degrade_watermark=0.5, sizeof=nbytes):
+        """
+        Args:
+            name: Consumer name used in metrics and warnings
+            max_bytes: Memory ceiling of the queued chunks (None for no byte limit)
+            max_items: Maximum number of queued chunks (None for no count
+                limit); with neither limit the channel is unbounded
+            policy: One of BLOCK, DROP_OLDEST, DROP_NEWEST, DOWNSAMPLE
+            degrade: For DOWNSAMPLE, callable mapping a chunk to a smaller one
+            degrade_watermark: Fill ratio above which DOWNSAMPLE degrades chunks
+            sizeof: Callable returning the size in bytes of a queued item
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown channel policy: {policy}")
+        if policy == DOWNSAMPLE and degrade is None:
+            raise ValueError("DOWNSAMPLE channels need a degrade function")
+
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.policy = policy
+        self.degrade = degrade
+        self.degrade_watermark = degrade_watermark
+        self.sizeof = sizeof
+
+        self._items = deque()
+        self._bytes = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+        self.put_count = 0
+        self.get_count = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.degraded = 0
+        self.blocked_seconds = 0.0
+        self.high_water_bytes = 0
+        self.high_water_items = 0
+
+    def _fits(self, size):
+        """True if an item of `size` bytes fits now (holding the lock)"""
+        if self.max_items is not None and len(self._items) >= self.max_items:
+            return False
+        return self.max_bytes is None or self._bytes + size <= self.max_bytes
+
+    def _fill_ratio(self, size=0):
+        ratios = []
+        if self.max_items is not None:
+            ratios.append((len(self._items) + 1) / self.max_items)
+        if self.max_bytes is not None:
+            ratios.append((self._bytes + size) / self.max_bytes)
+        return max(ratios, default=0.0)
+
+    def put(self, item, block=True, timeout=None, evicted=None):
+        """
+        Queue a chunk according to the channel policy
+
+        Args:
+            item: Chunk to queue
+            block: Only for BLOCK channels: wait for room. Must be False when
+                called from the audio callback
+            timeout: Maximum wait in seconds when blocking
+            evicted: Optional list; the chunks a DROP_OLDEST channel discards
+                to make room are appended to it, oldest first
+
+        Returns:
+            True if the chunk (or its degraded version) was queued, False if
+            it was dropped
+
+        Raises:
+            queue.Full: If a blocking put timed out
+            ChannelClosed: If the channel has been closed
+        """
+        size = self.sizeof(item)
+        degraded = False
+        if self.policy == DOWNSAMPLE:
+            with self._lock:
+                degraded = self._fill_ratio(size) > self.degrade_watermark
+            # degrading is real work; the consumer must not wait for it
+            if degraded:
+                item = self.degrade(item)
+                size = self.sizeof(item)
+
+        with self._lock:
+            if self._closed:
+                raise ChannelClosed(self.name)
+
+            if degraded:
+                self.degraded += 1
+
+            if not self._fits(size):
+                if self.policy == DROP_OLDEST:
+                    while self._items and not self._fits(size):
+                        oldest = self._items.popleft()
+                        self._bytes -= self.sizeof(oldest)
+                        self.dropped_oldest += 1
+                        if evicted is not None:
+                            evicted.append(oldest)
+                elif self.policy == BLOCK and block:
+                    started = time.monotonic()
+                    deadline = None if timeout is None else started + timeout
+                    while not self._fits(size) and self._items and not self._closed:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.blocked_seconds += time.monotonic() - started
+                            raise Full(self.name)
+                        self._not_full.wait(remaining)
+                    self.blocked_seconds += time.monotonic() - started
+                    if self._closed:
+                        raise ChannelClosed(self.name)
+
+            # an item larger than the whole channel is still accepted into an empty one
+            if not self._fits(size) and self._items:
+                self.dropped_newest += 1
+                return False
+
+            self._items.append(item)
+            self._bytes += size
+            self.put_count += 1
+            self.high_water_bytes = max(self.high_water_bytes, self._bytes)
+            self.high_water_items = max(self.high_water_items, len(self._items))
+            self._not_empty.notify()
+            return True
+
+    def put_nowait(self, item, evicted=None):
+        """Non-blocking put, safe to call from the audio callback"""
+        return self.put(item, block=False, evicted=evicted)
+
+    def get(self, block=True, timeout=None):
+        """
+        Take the oldest chunk
+
+        Raises:
+            queue.Empty: If no chunk is available (non-blocking or timed out)
+            ChannelClosed: If the channel is closed and drained
+        """
+        with self._lock:
+            if block:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while not self._items and not self._closed:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise Empty
+                    self._not_empty.wait(remaining)
+
+            if not self._items:
+                if self._closed:
+                    raise ChannelClosed(self.name)
+                raise Empty
+
+            item = self._items.popleft()
+            self._bytes -= self.sizeof(item)
+            self.get_count += 1
+            self._not_full.notify()
+            return item
+
+    def get_nowait(self):
+        """Non-blocking get"""
+        return self.get(block=False)
+
+    def empty(self):
+        with self._lock:
+            return not self._items
+
+    def qsize(self):
+        with self._lock:
+            return len(self._items)
+
+    @property
+    def queued_bytes(self):
+        """Bytes currently queued"""
+        return self._bytes
+
+    def close(self):
+        """Reject further puts; consumers drain the rest and then get ChannelClosed"""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def metrics(self):
+        """
+        Channel counters
+
+        Returns:
+            A dict with sizes, high-water marks, drop/degrade counts and the
+            time producers spent blocked
+        """
+        with self._lock:
+            return {
+                "name": self.name,
+                "policy": self.policy,
+                "items": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_items": self.max_items,
+                "high_water_bytes": self.high_water_bytes,
+                "high_water_items": self.high_water_items,
+                "put": self.put_count,
+                "get": self.get_count,
+                "dropped_oldest": self.dropped_oldest,
+                "dropped_newest": self.dropped_newest,
+                "degraded": self.degraded,
+                "blocked_seconds": self.blocked_seconds,
+            }
@@ -0,0 +1,109 @@
+"""
+Capture device hot-plug support.
+
+`DeviceWatcher` periodically asks the recorder to check its capture device
+(lost stream, changed default loopback device). After a switch the new
+device may run at another rate or channel count than the recording, so
+`FormatAdapter` converts its chunks to the recording format, keeping the
+output one continuous stream; the recorder adds a discontinuity marker to
+the metadata where the new device joins.
+"""
+
+import threading
+
+import numpy as np
+
+from recording_store import from_float32, to_float32
+
+
+class DeviceWatcher:
+    """Background thread calling `check()` every `interval` seconds"""
+
+    def __init__(self, check, interval=1.0):
+        """
+        Args:
+            check: Callable performing one device check (exceptions are reported
+                and do not stop the watcher)
+            interval: Seconds between checks
+        """
+        self.check = check
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="DeviceWatcher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Warning: device check failed: {e}")
+
+    def stop(self):
+        """Stop the watcher and wait for a running check to finish"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+
+class FormatAdapter:
+    """
+    Converts chunks from a device's rate/channel count to the recording's
+
+    Channels are down-mixed to mono or up-mixed by repeating the mono mix;
+    the rate is converted by linear interpolation whose phase carries over
+    from chunk to chunk, so consecutive chunks join without clicks.
+    """
+
+    def __init__(self, sample_format, in_rate, in_channels, out_rate, out_channels):
+        self.sample_format = sample_format
+        self.in_rate = int(in_rate)
+        self.in_channels = in_channels
+        self.out_rate = int(out_rate)
+        self.out_channels = out_channels
+        self._step = self.in_rate / self.out_rate
+        self._position = 0.0   # next output position, relative to the carried frame
+        self._previous = None  # last input frame of the previous chunk
+
+    def _map_channels(self, samples):
+        if self.in_channels == self.out_channels:
+            return samples
+        if self.out_channels < self.in_channels and self.out_channels > 1:
+            return samples[:, :self.out_channels]
+        mono = samples.mean(axis=1, keepdims=True)
+        return np.repeat(mono, self.out_channels, axis=1)
+
+    def convert(self, data):
+        """
+        Convert one chunk of interleaved frames
+
+        Returns:
+            Bytes of interleaved frames in the recording format
+        """
+        samples = self._map_channels(to_float32(data, self.sample_format, self.in_channels))
+        if self.in_rate == self.out_rate or not len(samples):
+            return from_float32(samples, self.sample_format)
+
+        if self._previous is not None:
+            samples = np.concatenate((self._previous, samples))
+        last = len(samples) - 1
+        count = int(np.floor((last - self._position) / self._step)) + 1 \
+            if self._position <= last else 0
+        positions = self._position + np.arange(count) * self._step
+        index = np.minimum(positions.astype(np.int64), max(last - 1, 0))
+        frac = (positions - index)[:, None].astype(np.float32)
+        upper = samples[np.minimum(index + 1, last)]
+        resampled = samples[index] * (1 - frac) + upper * frac
+
+        self._position += count * self._step - last
+        self._previous = samples[-1:]
+        return from_float32(resampled, self.sample_format)
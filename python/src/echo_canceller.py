@@ -0,0 +1,156 @@
+"""
+Streaming acoustic echo cancellation.
+
+When the microphone is recorded together with the loopback audio, the far
+side reaches the microphone through the speakers. `EchoCanceller` removes
+it with a partitioned-block frequency-domain adaptive filter (NLMS
+normalized per frequency bin), using the loopback track as the reference.
+
+Audio is processed in blocks of `block_size` samples. Each block costs a
+fixed number of FFTs of size 2 * block_size, vectorized over the filter
+partitions, so the compute per chunk is bounded by the chunk length. ERLE
+(echo return loss enhancement) and per-block processing times are reported
+by :py:meth:`EchoCanceller.metrics`.
+"""
+
+import time
+
+import numpy as np
+
+
+class EchoCanceller:
+    """Partitioned-block frequency-domain NLMS echo canceller (mono)"""
+
+    def __init__(self, rate, block_size=256, tail_seconds=0.2, step=0.5,
+                 smoothing=0.9, min_reference_db=-70.0):
+        """
+        Args:
+            rate: Sample rate in Hz of both tracks
+            block_size: Samples per block (also the algorithmic granularity;
+                chunks that are multiples of it add no latency)
+            tail_seconds: Echo path length covered by the filter
+            step: NLMS step size (0 < step <= 1)
+            smoothing: Forgetting factor of the per-bin reference power
+            min_reference_db: Below this reference level the filter does not adapt
+        """
+        self.rate = int(rate)
+        self.block_size = block_size
+        self.partitions = max(1, int(np.ceil(tail_seconds * self.rate / block_size)))
+        self.step = step
+        self.smoothing = smoothing
+        self.min_reference_power = 10 ** (min_reference_db / 10)
+
+        bins = block_size + 1
+        self._weights = np.zeros((self.partitions, bins), dtype=np.complex128)
+        self._history = np.zeros((self.partitions, bins), dtype=np.complex128)
+        self._power = np.full(bins, 1e-6)
+        self._previous_ref = np.zeros(block_size)
+        self._pending_mic = np.zeros(0)
+        self._pending_ref = np.zeros(0)
+
+        self.blocks = 0
+        self.erle_db = 0.0
+        self._mic_energy = 0.0
+        self._error_energy = 0.0
+        self.total_seconds = 0.0
+        self.max_block_seconds = 0.0
+
+    @property
+    def latency(self):
+        """Samples received but not yet returned (less than one block)"""
+        return len(self._pending_mic)
+
+    @staticmethod
+    def _mono(samples):
+        samples = np.asarray(samples, dtype=np.float64)
+        return samples.mean(axis=1) if samples.ndim == 2 else samples
+
+    def process(self, mic, reference):
+        """
+        Remove the echo of `reference` from `mic`
+
+        Args:
+            mic: Float microphone samples, shape (n,) or (n, channels)
+            reference: Float loopback samples of the same time span and length
+
+        Returns:
+            Float32 mono samples with the echo removed; as many as were
+            received, minus the samples still waiting for a full block
+        """
+        mic, reference = self._mono(mic), self._mono(reference)
+        if len(mic) != len(reference):
+            raise ValueError("Microphone and reference chunks must have the same length")
+
+        mic = np.concatenate((self._pending_mic, mic))
+        reference = np.concatenate((self._pending_ref, reference))
+        n = self.block_size
+        full = len(mic) // n * n
+        output = np.empty(full, dtype=np.float32)
+        for start in range(0, full, n):
+            output[start:start + n] = self._process_block(mic[start:start + n],
+                                                          reference[start:start + n])
+        self._pending_mic = mic[full:]
+        self._pending_ref = reference[full:]
+        return output
+
+    def _process_block(self, mic, reference):
+        started = time.perf_counter()
+        n = self.block_size
+
+        # reference spectrum of the last two blocks (overlap-save)
+        spectrum = np.fft.rfft(np.concatenate((self._previous_ref, reference)))
+        self._previous_ref = reference
+        self._history = np.roll(self._history, 1, axis=0)
+        self._history[0] = spectrum
+
+        # echo estimate and error
+        estimate = np.fft.irfft((self._weights * self._history).sum(axis=0))[n:]
+        error = mic - estimate
+
+        # NLMS update, normalized per bin by the smoothed reference power summed
+        # over the partitions
+        self._power = self.smoothing * self._power + (1 - self.smoothing) * np.abs(spectrum) ** 2
+        if np.dot(reference, reference) / n > self.min_reference_power:
+            error_spectrum = np.fft.rfft(np.concatenate((np.zeros(n), error)))
+            gradient = np.conj(self._history) * (error_spectrum * self.step
+                                                 / (self._power * self.partitions + 1e-10))
+            # constrain each partition to a causal block (linear, not circular, convolution)
+            constrained = np.fft.irfft(gradient, axis=1)
+            constrained[:, n:] = 0
+            self._weights += np.fft.rfft(constrained, axis=1)
+
+        self._update_metrics(mic, error, time.perf_counter() - started)
+        return error
+
+    def _update_metrics(self, mic, error, seconds):
+        self.blocks += 1
+        self.total_seconds += seconds
+        self.max_block_seconds = max(self.max_block_seconds, seconds)
+        # exponentially weighted energies (about one second of memory)
+        decay = np.exp(-self.block_size / self.rate)
+        self._mic_energy = decay * self._mic_energy + np.dot(mic, mic)
+        self._error_energy = decay * self._error_energy + np.dot(error, error)
+        if self._error_energy > 0:
+            self.erle_db = float(10 * np.log10(self._mic_energy / self._error_energy + 1e-12))
+
+    def reset(self):
+        """Forget the echo path (e.g. after a device switch)"""
+        self._weights[:] = 0
+        self._history[:] = 0
+        self._power[:] = 1e-6
+        self._previous_ref[:] = 0
+
+    def metrics(self):
+        """
+        Echo canceller counters
+
+        Returns:
+            A dict with the smoothed ERLE in dB and the per-block processing times
+        """
+        return {
+            "blocks": self.blocks,
+            "erle_db": self.erle_db,
+            "mean_block_ms": 1000 * self.total_seconds / max(self.blocks, 1),
+            "max_block_ms": 1000 * self.max_block_seconds,
+            "block_ms_budget": 1000 * self.block_size / self.rate,
+        }
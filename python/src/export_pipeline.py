@@ -0,0 +1,228 @@
+"""
+Parallel post-call export pipeline.
+
+Turns a RecordingStore into its derivatives (WAV, FLAC/Opus, a 16 kHz mono
+ASR copy and a waveform peaks file) using a process pool:
+
+- the recording is walked once in large chunks; each chunk is handed to a
+  worker which maps it (page cache, no copy through the parent) and computes
+  all per-chunk derivatives (ASR resampling, peaks) in one go,
+- stateful encoders (FLAC/Opus) cannot be split into independent chunks, so
+  each runs as a single whole-file task in parallel with the chunk tasks,
+- the parent writes chunk results in order and reports progress/throughput,
+- silence markers of the store are expanded here, so every derivative
+  follows the wall-clock timeline,
+- if the recorder saved an AGC gain curve (`<store>.gain.npz`), the ASR
+  copy is leveled with it in the same pass.
+"""
+
+import math
+import os
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from agc import GainCurve, gain_path
+from peaks import DEFAULT_LEVELS, PeakIndex, summarize
+from recording_store import RecordingStore
+
+
+DERIVATIVES = ("wav", "flac", "asr", "peaks")
+ENCODED_FORMATS = {
+    "flac": ("FLAC", "PCM_16"),
+    "opus": ("OGG", "OPUS"),
+}
+ASR_RATE = 16000
+# extra context mapped around each chunk so resampling edges stay exact
+RESAMPLE_PAD_SECONDS = 0.05
+
+# store and gain curve of the recording a worker process is exporting
+_worker = {}
+
+
+def resample(mono, rate, target_rate):
+    """FFT resampling of a 1-D block whose length is a multiple of the rate ratio"""
+    if rate == target_rate:
+        return mono
+    out_len = len(mono) * target_rate // rate
+    spectrum = np.fft.rfft(mono)
+    return np.fft.irfft(spectrum[:out_len // 2 + 1], out_len) * (out_len / len(mono))
+
+
+def _worker_state(store_path):
+    """Store and gain curve (or None) of `store_path`, loaded once per worker"""
+    if _worker.get("path") != store_path:
+        path = gain_path(store_path)
+        _worker.update(path=store_path, store=RecordingStore.open(store_path),
+                       gain=GainCurve.load(path) if os.path.exists(path) else None)
+    return _worker["store"], _worker["gain"]
+
+
+def _process_chunk(store_path, first, last, tasks):
+    """
+    Worker: compute the per-chunk derivatives of frames [first, last)
+
+    Returns:
+        dict of derivative name -> bytes / arrays to be written by the parent
+    """
+    store, gain = _worker_state(store_path)
+    results = {}
+
+    if "asr" in tasks:
+        unit = store.rate // math.gcd(store.rate, ASR_RATE)
+        pad = int(RESAMPLE_PAD_SECONDS * store.rate) // unit * unit
+        lo, hi = max(0, first - pad), min(store.timeline_frames, last + pad)
+        mono = store.timeline_float_slice(lo, hi).mean(axis=1)
+        if gain is not None:
+            mono *= gain.values(lo, hi)
+        # zero-pad the block to a multiple of the resampling unit, so the
+        # last chunk still yields all of its ASR frames
+        mono = np.pad(mono, (0, -len(mono) % unit))
+        resampled = resample(mono, store.rate, ASR_RATE)
+        ratio = ASR_RATE / store.rate
+        start = int(round((first - lo) * ratio))
+        count = int(round((last - first) * ratio))
+        resampled = resampled[start:start + count]
+        results["asr"] = (np.clip(resampled, -1.0, 32767 / 32768) * 32768).astype("<i2").tobytes()
+
+    if "peaks" in tasks:
+        # chunks are aligned to the finest level, the parent folds the coarser ones
+        results["peaks"] = summarize(store.timeline_float_slice(first, last).mean(axis=1),
+                                     DEFAULT_LEVELS[0])
+
+    return results
+
+
+def _encode_whole(store_path, output_path, container, subtype, chunk_frames):
+    """Worker: stream the whole store through a stateful soundfile encoder"""
+    import soundfile
+
+    store = RecordingStore.open(store_path)
+    with soundfile.SoundFile(output_path, "w", samplerate=store.rate,
+                             channels=store.channels, format=container,
+                             subtype=subtype) as sf:
+        total = store.timeline_frames
+        for first in range(0, total, chunk_frames):
+            sf.write(store.timeline_float_slice(first, min(first + chunk_frames, total)))
+    return output_path
+
+
+def export_recording(store_path, output_dir=None, derivatives=DERIVATIVES,
+                     chunk_seconds=30, max_workers=None, progress=None):
+    """
+    Export a recording store to several derivatives in parallel
+
+    Args:
+        store_path: RecordingStore file to export
+        output_dir: Directory for the outputs (defaults to the store's directory)
+        derivatives: Any of "wav", "flac", "opus", "asr" and "peaks"
+        chunk_seconds: Size of the chunks handed to the workers
+        max_workers: Process pool size (defaults to the number of CPUs)
+        progress: Optional callable(done_frames, total_frames, bytes_per_second)
+
+    Returns:
+        A dict with the output paths per derivative and throughput statistics
+    """
+    store = RecordingStore.open(store_path)
+    if output_dir is None:
+        output_dir = os.path.dirname(os.path.abspath(store_path))
+    os.makedirs(output_dir, exist_ok=True)
+    base = os.path.join(output_dir, os.path.splitext(os.path.basename(store_path))[0])
+
+    unknown = set(derivatives) - set(DERIVATIVES) - set(ENCODED_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown derivatives: {', '.join(sorted(unknown))}")
+    encoded = [d for d in derivatives if d in ENCODED_FORMATS]
+    if encoded:
+        try:
+            import soundfile  # noqa: F401
+        except ImportError:
+            raise RuntimeError("FLAC/Opus export requires the 'soundfile' package")
+
+    # chunk boundaries must line up with peak bins and the resampling ratio
+    unit = store.rate // math.gcd(store.rate, ASR_RATE)
+    peak_bin = DEFAULT_LEVELS[0]
+    unit = unit * peak_bin // math.gcd(unit, peak_bin)
+    chunk_frames = max(unit, int(chunk_seconds * store.rate) // unit * unit)
+    chunk_tasks = tuple(d for d in derivatives if d in ("asr", "peaks"))
+
+    outputs = {}
+    writers = {}
+    if "wav" in derivatives:
+        outputs["wav"] = base + ".wav"
+        writers["wav"] = _open_wav(outputs["wav"], store.channels,
+                                   store.sample_width, store.rate)
+    if "asr" in derivatives:
+        outputs["asr"] = base + ".16k.wav"
+        writers["asr"] = _open_wav(outputs["asr"], 1, 2, ASR_RATE)
+    if "peaks" in derivatives:
+        outputs["peaks"] = base + ".peaks.npz"
+        peaks = PeakIndex(store.rate)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    done_frames = 0
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            whole = []
+            for name in encoded:
+                outputs[name] = base + (".flac" if name == "flac" else ".opus")
+                container, subtype = ENCODED_FORMATS[name]
+                whole.append(pool.submit(_encode_whole, store_path, outputs[name],
+                                         container, subtype, chunk_frames))
+
+            ranges = [(first, min(first + chunk_frames, store.timeline_frames))
+                      for first in range(0, store.timeline_frames, chunk_frames)]
+            pending = {}
+            submitted = 0
+
+            for index, (first, last) in enumerate(ranges):
+                # keep the pool busy without holding every result in memory
+                while chunk_tasks and submitted < len(ranges) and submitted - index < max_workers * 2:
+                    pending[submitted] = pool.submit(_process_chunk, store_path,
+                                                     *ranges[submitted], chunk_tasks)
+                    submitted += 1
+
+                # results are written in order while later chunks keep running
+                results = pending.pop(index).result() if chunk_tasks else {}
+                if "wav" in writers:
+                    writers["wav"].writeframesraw(store.timeline_slice(first, last).tobytes())
+                if "asr" in writers:
+                    writers["asr"].writeframesraw(results["asr"])
+                if "peaks" in results:
+                    peaks.add_bins(results["peaks"], last - first)
+
+                done_frames += last - first
+                if progress is not None:
+                    elapsed = time.perf_counter() - started
+                    progress(done_frames, store.timeline_frames,
+                             done_frames * store.frame_size / max(elapsed, 1e-9))
+
+            for future in whole:
+                future.result()
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    if "peaks" in derivatives:
+        peaks.finish()
+        peaks.save(outputs["peaks"])
+
+    elapsed = time.perf_counter() - started
+    return {
+        "outputs": outputs,
+        "frames": store.timeline_frames,
+        "seconds": elapsed,
+        "bytes_per_second": store.timeline_frames * store.frame_size / max(elapsed, 1e-9),
+    }
+
+
+def _open_wav(path, channels, sample_width, rate):
+    wf = wave.open(path, "wb")
+    wf.setnchannels(channels)
+    wf.setsampwidth(sample_width)
+    wf.setframerate(rate)
+    return wf
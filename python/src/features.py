@@ -0,0 +1,267 @@
+"""
+Incremental log-mel features.
+
+`LogMelFrontend` computes log-mel frames once, as audio arrives: each chunk
+is framed together with the tail of the previous one, so the result is the
+same as a single STFT over the whole recording. `FeatureStore` appends the
+frames to a raw float32 file with a small fixed header (like the
+RecordingStore), so re-transcription or re-analysis of any time range reads
+a zero-copy memory-mapped view instead of recomputing from PCM. The
+recorder writes the features of a store to `<store>.mel`.
+"""
+
+import os
+import struct
+import time
+
+import numpy as np
+
+
+# magic, version, mels, rate, hop, window, frames, created
+HEADER_FORMAT = "<8sHHIIIQd"
+HEADER_SIZE = 64
+MAGIC = b"AVHMEL01"
+VERSION = 1
+
+N_MELS = 80
+WINDOW_SECONDS = 0.025
+HOP_SECONDS = 0.01
+LOG_FLOOR = 1e-10
+
+
+def hz_to_mel(hz):
+    return 2595.0 * np.log10(1.0 + np.asarray(hz, dtype=np.float64) / 700.0)
+
+
+def mel_to_hz(mel):
+    return 700.0 * (10 ** (np.asarray(mel, dtype=np.float64) / 2595.0) - 1.0)
+
+
+def mel_filterbank(rate, n_fft, n_mels=N_MELS, fmin=0.0, fmax=None):
+    """
+    Triangular mel filters (HTK scale)
+
+    Returns:
+        A float32 array of shape (n_fft // 2 + 1, n_mels) to multiply power
+        spectra with
+    """
+    fmax = rate / 2 if fmax is None else min(fmax, rate / 2)
+    edges = mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), n_mels + 2))
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / rate)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (freqs - lower) / (center - lower)
+    falling = (upper - freqs) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).T.astype(np.float32)
+
+
+class LogMelFrontend:
+    """Streaming STFT / log-mel frontend carrying its overlap between chunks"""
+
+    def __init__(self, rate, n_mels=N_MELS, window_seconds=WINDOW_SECONDS,
+                 hop_seconds=HOP_SECONDS, fmax=8000.0):
+        """
+        Args:
+            rate: Sample rate in Hz of the fed samples
+            n_mels: Number of mel bands
+            window_seconds: STFT window length
+            hop_seconds: Distance between frames
+            fmax: Upper edge of the mel filters (capped at the Nyquist rate)
+        """
+        self.rate = int(rate)
+        self.n_mels = n_mels
+        self.window = max(1, int(round(window_seconds * self.rate)))
+        self.hop = max(1, int(round(hop_seconds * self.rate)))
+        self.n_fft = 1 << (self.window - 1).bit_length()
+        self._taper = np.hanning(self.window).astype(np.float32)
+        self._filters = mel_filterbank(self.rate, self.n_fft, n_mels, fmax=fmax)
+        # samples of frames that are not complete yet
+        self._tail = np.empty(0, dtype=np.float32)
+        self.frames = 0
+
+    def process(self, samples):
+        """
+        Log-mel frames completed by a chunk of mono float samples
+
+        Returns:
+            A float32 array of shape (frames, n_mels)
+        """
+        samples = np.concatenate((self._tail, np.asarray(samples, dtype=np.float32)))
+        count = 0 if len(samples) < self.window else (len(samples) - self.window) // self.hop + 1
+        self._tail = samples[count * self.hop:]
+        if not count:
+            return np.empty((0, self.n_mels), dtype=np.float32)
+
+        frames = np.lib.stride_tricks.sliding_window_view(
+            samples[:(count - 1) * self.hop + self.window], self.window)[::self.hop]
+        spectrum = np.fft.rfft(frames * self._taper, n=self.n_fft)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+        self.frames += count
+        return np.log(np.maximum(power @ self._filters, LOG_FLOOR))
+
+    def process_silence(self, samples):
+        """
+        Log-mel frames completed by `samples` silent samples, without
+        materializing the silence
+
+        Returns:
+            A float32 array of shape (frames, n_mels)
+        """
+        head = min(samples, self.window)
+        features = self.process(np.zeros(head, dtype=np.float32))
+        if head == samples:
+            # shorter than a window: the tail still holds real samples
+            return features
+        # after `window` zeros every buffered sample is silent, and so is
+        # every later frame
+        available = len(self._tail) + samples - head
+        count = 0 if available < self.window else (available - self.window) // self.hop + 1
+        if not count:
+            self._tail = np.zeros(available, dtype=np.float32)
+            return features
+        self._tail = np.zeros(available - count * self.hop, dtype=np.float32)
+        self.frames += count
+        silent = np.full((count, self.n_mels), np.log(LOG_FLOOR), dtype=np.float32)
+        return np.concatenate((features, silent))
+
+
+class FeatureStore:
+    """
+    Log-mel frames of a recording in a raw float32 file indexed by time.
+
+    Frames are appended with :py:meth:`append`; :py:meth:`slice` returns a
+    read-only memory-mapped view of any time range.
+    """
+
+    def __init__(self, path, rate, n_mels=N_MELS, hop=None, window=None):
+        """
+        Create a new feature file
+
+        Args:
+            path: File to create (overwritten if it exists)
+            rate: Sample rate in Hz of the audio the features describe
+            n_mels: Number of mel bands per frame
+            hop: Samples between frames
+            window: Samples per frame
+        """
+        self.path = path
+        self.rate = int(rate)
+        self.n_mels = n_mels
+        self.hop = hop or int(round(HOP_SECONDS * self.rate))
+        self.window = window or int(round(WINDOW_SECONDS * self.rate))
+        self.created = time.time()
+        self.frames = 0
+        self._file = open(path, "w+b")
+        self._write_header()
+        self._file.seek(HEADER_SIZE)
+
+    @classmethod
+    def for_frontend(cls, path, frontend):
+        """Create a feature file matching a LogMelFrontend"""
+        return cls(path, frontend.rate, frontend.n_mels, frontend.hop, frontend.window)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open an existing feature file read-only
+
+        Returns:
+            A read-only FeatureStore
+        """
+        store = cls.__new__(cls)
+        store.path = path
+        store._file = None
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            raise ValueError("Not a feature file: header is truncated")
+        (magic, version, store.n_mels, store.rate, store.hop, store.window,
+         frames, store.created) = struct.unpack_from(HEADER_FORMAT, header)
+        if magic != MAGIC:
+            raise ValueError("Not a feature file: bad magic")
+        if version != VERSION:
+            raise ValueError(f"Unsupported feature file version: {version}")
+        # the frames on disk count, even if the writer did not update the header
+        available = (os.path.getsize(path) - HEADER_SIZE) // (4 * store.n_mels)
+        store.frames = available
+        return store
+
+    def _write_header(self):
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, self.n_mels, self.rate,
+                             self.hop, self.window, self.frames, self.created)
+        self._file.seek(0)
+        self._file.write(header.ljust(HEADER_SIZE, b"\0"))
+
+    def __enter__(self):
+        """Context manager entry method"""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit method - ensures the header is finalized"""
+        self.close()
+
+    def __len__(self):
+        return self.frames
+
+    def append(self, features):
+        """
+        Append log-mel frames
+
+        Args:
+            features: Float array of shape (frames, n_mels)
+        """
+        if self._file is None:
+            raise ValueError("Feature file is not open for writing")
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        if features.ndim != 2 or features.shape[1] != self.n_mels:
+            raise ValueError(f"Expected frames of {self.n_mels} mel bands")
+        self._file.write(features.tobytes())
+        self.frames += len(features)
+
+    def flush(self):
+        """Persist the frame count and flush the file"""
+        if self._file is not None:
+            self._write_header()
+            self._file.seek(0, os.SEEK_END)
+            self._file.flush()
+
+    def close(self):
+        """Finalize the header"""
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+
+    def time_to_frame(self, seconds):
+        """Index of the frame starting at or after `seconds`, clamped to the file"""
+        return min(max(int(np.ceil(seconds * self.rate / self.hop)), 0), self.frames)
+
+    def frame_slice(self, first, last):
+        """
+        Zero-copy view of feature frames [first, last)
+
+        Returns:
+            A read-only float32 np.memmap of shape (frames, n_mels)
+        """
+        if self._file is not None:
+            self._file.flush()
+        last = min(last, self.frames)
+        if last <= first:
+            return np.empty((0, self.n_mels), dtype=np.float32)
+        return np.memmap(self.path, dtype=np.float32, mode="r",
+                         offset=HEADER_SIZE + first * 4 * self.n_mels,
+                         shape=(last - first, self.n_mels))
+
+    def slice(self, start=0.0, end=None):
+        """
+        Feature frames of the audio between `start` and `end` seconds
+
+        Frame i covers samples [i * hop, i * hop + window) of the recording
+        timeline.
+
+        Returns:
+            A read-only float32 np.memmap of shape (frames, n_mels)
+        """
+        first = self.time_to_frame(start)
+        last = self.frames if end is None else self.time_to_frame(end)
+        return self.frame_slice(first, last)
@@ -0,0 +1,175 @@
+"""
+Broadcast frame bus.
+
+The capture callback publishes every chunk once into a shared ring; any
+number of subscribers (disk writer, meters, VAD, ASR, ...) read it through
+their own cursor, so a chunk is stored once whatever the number of
+consumers. Publishing never waits for a subscriber: one that falls more
+than a ring's worth of chunks behind is dropped on its own, without
+affecting the others.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from queue import Empty
+
+
+# seq is the bus-wide chunk number, adc_time the stream time of the first
+# frame; a publisher may add the position of the first frame on its timeline
+# and the monotonic time it was captured at
+Frame = namedtuple("Frame", ["seq", "data", "adc_time", "position", "captured"],
+                   defaults=(None, None))
+
+
+class SubscriberDropped(Exception):
+    """The subscriber fell too far behind the publisher and was removed"""
+    pass
+
+
+class Subscriber:
+    """Independent read cursor over a FrameBus"""
+
+    def __init__(self, bus, name, cursor):
+        self.bus = bus
+        self.name = name
+        self.cursor = cursor
+        self.dropped = False
+        self.received = 0
+
+    @property
+    def lag(self):
+        """Number of published chunks not yet read"""
+        return self.bus.head - self.cursor
+
+    def get(self, block=True, timeout=None):
+        """
+        Next chunk for this subscriber
+
+        Returns:
+            A Frame
+
+        Raises:
+            queue.Empty: If no chunk arrived in time (or block is False)
+            SubscriberDropped: If the subscriber was dropped for being too slow
+        """
+        return self.bus._read(self, block, timeout)
+
+    def __iter__(self):
+        """Yield frames until the bus is closed"""
+        while True:
+            try:
+                yield self.get()
+            except Empty:
+                return
+
+    def close(self):
+        """Unsubscribe"""
+        self.bus.unsubscribe(self)
+
+
+class FrameBus:
+    """Single-producer, multi-subscriber ring of captured chunks"""
+
+    def __init__(self, capacity=512):
+        """
+        Args:
+            capacity: Number of chunks kept in the ring; a subscriber lagging
+                by more than this is dropped
+        """
+        self.capacity = capacity
+        self.head = 0  # seq of the next chunk to publish
+        self.closed = False
+        self.dropped_subscribers = []
+        self._slots = [None] * capacity
+        self._subscribers = []
+        self._cond = threading.Condition()
+
+    def subscribe(self, name, from_start=False):
+        """
+        Add a subscriber
+
+        Args:
+            name: Name used in metrics and warnings
+            from_start: Start with the oldest chunk still in the ring instead
+                of the next published one
+
+        Returns:
+            A Subscriber
+        """
+        with self._cond:
+            cursor = max(0, self.head - self.capacity) if from_start else self.head
+            subscriber = Subscriber(self, name, cursor)
+            self._subscribers.append(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._cond:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def publish(self, data, adc_time=None, position=None, captured=None):
+        """
+        Publish a chunk to every subscriber (never blocks on subscribers)
+
+        Args:
+            data: Chunk bytes (stored by reference, not copied)
+            adc_time: Optional ADC time of the chunk's first frame
+            position: Optional timeline frame of the chunk's first frame
+            captured: Optional monotonic time of the chunk's first frame
+        """
+        with self._cond:
+            seq = self.head
+            self._slots[seq % self.capacity] = Frame(seq, data, adc_time, position, captured)
+            self.head = seq + 1
+
+            # the slot just overwritten was the oldest unread one of these
+            slow = [s for s in self._subscribers if self.head - s.cursor > self.capacity]
+            for subscriber in slow:
+                subscriber.dropped = True
+                self._subscribers.remove(subscriber)
+                self.dropped_subscribers.append(subscriber.name)
+                print(f"Warning: frame bus subscriber '{subscriber.name}' is too slow "
+                      f"and was dropped")
+
+            self._cond.notify_all()
+
+    def _read(self, subscriber, block, timeout):
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                if subscriber.dropped:
+                    raise SubscriberDropped(subscriber.name)
+                if subscriber.cursor < self.head:
+                    frame = self._slots[subscriber.cursor % self.capacity]
+                    subscriber.cursor += 1
+                    subscriber.received += 1
+                    return frame
+                if not block or self.closed:
+                    raise Empty
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise Empty
+                self._cond.wait(remaining)
+
+    def close(self):
+        """Wake all subscribers; they drain the ring and then stop iterating"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def metrics(self):
+        """
+        Bus counters
+
+        Returns:
+            A dict with the published chunk count and per-subscriber lag
+        """
+        with self._cond:
+            return {
+                "published": self.head,
+                "capacity": self.capacity,
+                "subscribers": {s.name: {"lag": self.head - s.cursor, "received": s.received}
+                                for s in self._subscribers},
+                "dropped_subscribers": list(self.dropped_subscribers),
+            }
@@ -0,0 +1,251 @@
+"""
+Low-CPU idle mode with automatic recording arm.
+
+While no call is running, `IdleMonitor` keeps only a probe stream open on
+the loopback device. The probe uses large buffers (a few callbacks per
+second instead of ~47) and measures the speech-band energy of each one.
+Once speech-band energy has lasted `arm_seconds`, the probe is closed and
+the recorder's full pipeline (writer, journal, ASR, ...) is started. The
+probe's last seconds are included, so the start of the call is kept. After
+`disarm_seconds` without speech the recording is stopped, handed to
+`on_disarm` and the monitor goes back to probing.
+
+If the recorder is on standby (see AudioRecorder.enter_standby), its stream
+is shared instead of opening a probe: the monitor reads the new standby
+audio every `probe_seconds` and arming commits the recorder's own pre-roll.
+An error in a cycle is reported and the monitor starts probing again.
+"""
+
+import threading
+import time
+from queue import Empty
+
+import pyaudiowpatch as pyaudio
+
+from frame_bus import SubscriberDropped
+from preroll import PrerollBuffer
+from recording_store import to_float32
+from vad import speech_band_db
+
+
+IDLE = "idle"
+ARMED = "armed"
+
+
+class IdleMonitor:
+    """Arms and disarms an AudioRecorder from a cheap loopback energy probe"""
+
+    # pause before probing again after an error
+    RETRY_SECONDS = 1.0
+
+    def __init__(self, recorder, device_index=None, threshold_db=-45.0, arm_seconds=1.0,
+                 disarm_seconds=60.0, probe_seconds=0.25, preroll_seconds=2.0,
+                 on_arm=None, on_disarm=None):
+        """
+        Args:
+            recorder: The AudioRecorder to arm
+            device_index: Optional device to watch (None for the default loopback)
+            threshold_db: Speech-band level (dBFS) counting as activity
+            arm_seconds: Sustained activity needed to start recording
+            disarm_seconds: Inactivity after which the recording is stopped
+            probe_seconds: Buffer length of the probe stream
+            preroll_seconds: Probe audio included at the start of the recording
+            on_arm: Optional callable(recorder) after recording started
+            on_disarm: Optional callable(recorder) after recording stopped,
+                e.g. to save it
+        """
+        self.recorder = recorder
+        self.device_index = device_index
+        self.threshold_db = threshold_db
+        self.arm_seconds = arm_seconds
+        self.disarm_seconds = disarm_seconds
+        self.probe_seconds = probe_seconds
+        self.preroll_seconds = preroll_seconds
+        self.on_arm = on_arm
+        self.on_disarm = on_disarm
+
+        self.state = IDLE
+        self.arm_count = 0
+        self.probe_callbacks = 0
+        self._probe = None
+        self._listening = False
+        self._standby_position = None
+        self._preroll = None
+        self._active_seconds = 0.0
+        self._armed = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Open the probe and start watching"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._open_probe()
+        self._thread = threading.Thread(target=self._run, name="IdleMonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching; a running recording is stopped and handed to on_disarm"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._armed.set()
+        self._thread.join()
+        self._thread = None
+        self._close_probe()
+
+    def _shares_standby(self):
+        """True if the recorder's standby stream watches the requested device"""
+        return self.recorder.standby and \
+            self.device_index in (None, self.recorder.current_device["index"])
+
+    def _open_probe(self):
+        self._active_seconds = 0.0
+        self._armed.clear()
+        if self._shares_standby():
+            _, self._standby_position = self.recorder.read_standby()
+            self._format = self.recorder.device_format
+            self._preroll = None  # the recorder commits its own pre-roll
+            self._listening = True
+            print(f"Idle monitor sharing the standby stream of "
+                  f"{self.recorder.current_device['name']}")
+            return
+
+        if self.device_index is None:
+            device = self.recorder.find_loopback_device()
+        else:
+            device = self.recorder.p.get_device_info_by_index(self.device_index)
+        rate = int(device["defaultSampleRate"])
+        channels = device["maxInputChannels"]
+        self._format = (rate, channels)
+        self._preroll = PrerollBuffer(self.preroll_seconds, rate,
+                                      channels * pyaudio.get_sample_size(self.recorder.FORMAT))
+        self._probe = self.recorder.p.open(
+            format=self.recorder.FORMAT,
+            channels=channels,
+            rate=rate,
+            frames_per_buffer=max(1, int(rate * self.probe_seconds)),
+            input=True,
+            input_device_index=device["index"],
+            stream_callback=self._probe_callback,
+        )
+        self._listening = True
+        print(f"Idle monitor probing {device['name']}")
+
+    def _close_probe(self):
+        self._listening = False
+        if self._probe is not None:
+            probe, self._probe = self._probe, None
+            probe.stop_stream()
+            probe.close()
+
+    def _is_active(self, data, rate, channels):
+        """True if a chunk carries speech-band energy above the threshold"""
+        mono = to_float32(data, self.recorder.FORMAT, channels).mean(axis=1)
+        return speech_band_db(mono, rate) > self.threshold_db
+
+    def _update_activity(self, data):
+        """Count sustained activity in a chunk and arm once it lasts long enough"""
+        rate, channels = self._format
+        if self._is_active(data, rate, channels):
+            frame_size = channels * pyaudio.get_sample_size(self.recorder.FORMAT)
+            self._active_seconds += len(data) / frame_size / rate
+            if self._active_seconds >= self.arm_seconds:
+                self._armed.set()
+        else:
+            self._active_seconds = 0.0
+
+    def _probe_callback(self, in_data, frame_count, time_info, status):
+        self.probe_callbacks += 1
+        self._preroll.write(in_data)
+        self._update_activity(in_data)
+        return (in_data, pyaudio.paContinue)
+
+    def _wait_for_activity(self):
+        """
+        Wait until the probe (or the shared standby stream) armed
+
+        Returns:
+            True to arm, False if the monitor was stopped or the standby ended
+        """
+        while not self._stop.is_set():
+            if self._probe is not None:
+                self._armed.wait(self.probe_seconds)
+            else:
+                data, self._standby_position = \
+                    self.recorder.read_standby(self._standby_position)
+                if data is None:
+                    self._close_probe()  # standby ended: probe on our own
+                    return False
+                if data:
+                    self._update_activity(data)
+                if not self._armed.is_set():
+                    self._stop.wait(self.probe_seconds)
+            if self._armed.is_set():
+                return not self._stop.is_set()
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if not self._listening:
+                    self._open_probe()
+                if not self._wait_for_activity():
+                    continue
+                self._arm()
+                self._watch_recording()
+                self._disarm()
+            except Exception as e:
+                print(f"Warning: idle monitor error: {e}")
+                self._recover()
+
+    def _recover(self):
+        """Stop a recording the failed cycle left running, then probe again"""
+        try:
+            self._close_probe()
+        except Exception:
+            self._probe = None
+        if self.state == ARMED:
+            self.state = IDLE
+            try:
+                self.recorder.stop_recording()
+            except Exception as e:
+                print(f"Warning: idle monitor could not stop the recording: {e}")
+        self._stop.wait(self.RETRY_SECONDS)
+
+    def _arm(self):
+        self._close_probe()
+        self.recorder.start_recording(self.device_index, preroll=self._preroll)
+        self.state = ARMED
+        self.arm_count += 1
+        print("Idle monitor: activity detected, recording armed")
+        if self.on_arm is not None:
+            self.on_arm(self.recorder)
+
+    def _watch_recording(self):
+        """Follow the recording's audio until it has been inactive long enough"""
+        subscriber = self.recorder.subscribe("idle-monitor")
+        last_active = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() - last_active >= self.disarm_seconds:
+                    return
+                try:
+                    frame = subscriber.get(timeout=self.probe_seconds)
+                except Empty:
+                    continue  # no packets: the loopback device is idle
+                except SubscriberDropped:
+                    subscriber = self.recorder.subscribe("idle-monitor")
+                    continue
+                if self._is_active(frame.data, self.recorder.rate, self.recorder.channels):
+                    last_active = time.monotonic()
+        finally:
+            subscriber.close()
+
+    def _disarm(self):
+        self.recorder.stop_recording()
+        self.state = IDLE
+        print("Idle monitor: recording disarmed after inactivity")
+        if self.on_disarm is not None:
+            self.on_disarm(self.recorder)
@@ -0,0 +1,225 @@
+"""
+Streaming loudness metering (ITU-R BS.1770 / EBU R128).
+
+`LoudnessMeter` is fed chunk by chunk and keeps momentary (400 ms),
+short-term (3 s) and integrated loudness in LUFS, the true peak in dBTP
+and a count of clipped samples. Audio is measured in 100 ms blocks; the
+K-weighting is applied to the power spectrum of each block (the magnitude
+response of the two BS.1770 biquads evaluated at the FFT bins), so a whole
+chunk is weighted in one vectorized pass. Gating blocks go into a fixed
+histogram of 0.1 LU bins, which keeps every update O(1) and lets the
+integrated loudness be read at any time without a second pass.
+"""
+
+import numpy as np
+
+from recording_store import to_float32
+
+
+BLOCK_SECONDS = 0.1
+MOMENTARY_BLOCKS = 4    # 400 ms
+SHORT_TERM_BLOCKS = 30  # 3 s
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+HISTOGRAM_MAX = 5.0
+HISTOGRAM_STEP = 0.1
+OVERSAMPLING = 4
+# samples kept on each side of a chunk against the FFT interpolation's wrap-around
+TRUE_PEAK_PAD = 64
+# samples at or above this magnitude count as clipped
+CLIP_LEVEL = 0.999
+QUIET_LUFS = -40.0
+
+
+def lufs(energy):
+    """Loudness in LUFS of a mean-square energy (-inf for silence)"""
+    with np.errstate(divide="ignore"):
+        return float(-0.691 + 10 * np.log10(energy))
+
+
+def k_weighting_response(rate, n_fft):
+    """
+    Power response of the BS.1770 K-weighting filter at the rfft bins
+
+    Returns:
+        A float64 array of length n_fft // 2 + 1
+    """
+    # high shelf (head effects)
+    k = np.tan(np.pi * 1681.974450955533 / rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0,
+             (vh - vb * k / q + k * k) / a0), \
+        (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    # RLB high-pass
+    k = np.tan(np.pi * 38.13547087602444 / rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass = (1.0, -2.0, 1.0), (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+
+    z = np.exp(-1j * np.pi * np.arange(n_fft // 2 + 1) / (n_fft // 2))
+    response = np.ones(len(z), dtype=np.complex128)
+    for b, a in (shelf, highpass):
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(response) ** 2
+
+
+class LoudnessMeter:
+    """Incremental K-weighted loudness, true-peak and clipping meter"""
+
+    def __init__(self, rate, channels, sample_format=None):
+        """
+        Args:
+            rate: Sample rate in Hz
+            channels: Number of interleaved channels
+            sample_format: PortAudio sample format for :py:meth:`add_frames`
+        """
+        self.rate = int(rate)
+        self.channels = channels
+        self.sample_format = sample_format
+        self.block = max(1, int(round(BLOCK_SECONDS * self.rate)))
+        self._weights = k_weighting_response(self.rate, self.block)
+        # Parseval: bins other than DC (and Nyquist) stand for two
+        self._weights[1:(self.block + 1) // 2] *= 2
+        self._weights /= self.block ** 2
+
+        self._pending = np.empty((0, channels), dtype=np.float32)
+        # weighted mean-square energy of the last SHORT_TERM_BLOCKS blocks
+        self._blocks = np.zeros(SHORT_TERM_BLOCKS)
+        self._block_count = 0
+        bins = int(round((HISTOGRAM_MAX - ABSOLUTE_GATE) / HISTOGRAM_STEP))
+        self._histogram_counts = np.zeros(bins, dtype=np.int64)
+        self._histogram_energy = np.zeros(bins)
+        self._peak_tail = np.zeros((0, channels), dtype=np.float32)
+
+        self.momentary = -np.inf
+        self.short_term = -np.inf
+        self.max_momentary = -np.inf
+        self.max_short_term = -np.inf
+        self.sample_peak = 0.0
+        self.true_peak = 0.0
+        self.clipped_samples = 0
+        self.frames = 0
+
+    def add_frames(self, data):
+        """Add interleaved frames in the meter's sample format"""
+        self.add_samples(to_float32(data, self.sample_format, self.channels))
+
+    def add_samples(self, samples):
+        """
+        Add float samples in [-1, 1)
+
+        Args:
+            samples: Array of shape (frames, channels)
+        """
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1, self.channels)
+        if not len(samples):
+            return
+        self.frames += len(samples)
+        magnitude = np.abs(samples)
+        self.sample_peak = max(self.sample_peak, float(magnitude.max()))
+        self.clipped_samples += int(np.count_nonzero(magnitude >= CLIP_LEVEL))
+        self._update_true_peak(samples)
+
+        samples = np.concatenate((self._pending, samples))
+        whole = len(samples) // self.block
+        self._pending = samples[whole * self.block:]
+        if whole:
+            blocks = samples[:whole * self.block].reshape(whole, self.block, self.channels)
+            power = np.abs(np.fft.rfft(blocks, axis=1)) ** 2
+            # channel weights are 1 for mono/stereo; summed over channels
+            energies = np.einsum("bfc,f->b", power, self._weights)
+            for energy in energies:
+                self._add_block(energy)
+
+    def add_silence(self, frames):
+        """Add `frames` silent frames without materializing them"""
+        head = min(frames, -len(self._pending) % self.block)
+        if head:
+            self.add_samples(np.zeros((head, self.channels), dtype=np.float32))
+        self.frames += frames - head
+        whole, rest = divmod(frames - head, self.block)
+        # silent blocks fall below the absolute gate: only the windows change
+        for _ in range(min(whole, SHORT_TERM_BLOCKS)):
+            self._add_block(0.0)
+        self._block_count += max(0, whole - SHORT_TERM_BLOCKS)
+        self._pending = np.zeros((rest, self.channels), dtype=np.float32)
+        self._peak_tail = np.zeros_like(self._peak_tail)
+
+    def _update_true_peak(self, samples):
+        """Peak of the signal oversampled by FFT interpolation"""
+        pad = TRUE_PEAK_PAD
+        signal = np.concatenate((self._peak_tail, samples))
+        self._peak_tail = signal[-2 * pad:]
+        if len(signal) <= 2 * pad:
+            return
+        n = len(signal)
+        spectrum = np.fft.rfft(signal, axis=0)
+        upsampled = np.fft.irfft(spectrum, n=n * OVERSAMPLING, axis=0) * OVERSAMPLING
+        # the ends suffer from the circular wrap; they are covered by the next chunk
+        inner = upsampled[pad * OVERSAMPLING:(n - pad) * OVERSAMPLING]
+        if len(inner):
+            self.true_peak = max(self.true_peak, float(np.abs(inner).max()))
+
+    def _add_block(self, energy):
+        self._blocks[self._block_count % SHORT_TERM_BLOCKS] = energy
+        self._block_count += 1
+        if self._block_count < MOMENTARY_BLOCKS:
+            return
+
+        recent = [(self._block_count - i) % SHORT_TERM_BLOCKS
+                  for i in range(1, MOMENTARY_BLOCKS + 1)]
+        momentary_energy = self._blocks[recent].mean()
+        self.momentary = lufs(momentary_energy)
+        self.max_momentary = max(self.max_momentary, self.momentary)
+        if self._block_count >= SHORT_TERM_BLOCKS:
+            self.short_term = lufs(self._blocks.mean())
+            self.max_short_term = max(self.max_short_term, self.short_term)
+
+        # each momentary window is a BS.1770 gating block (75% overlap)
+        if self.momentary > ABSOLUTE_GATE:
+            index = min(int((self.momentary - ABSOLUTE_GATE) / HISTOGRAM_STEP),
+                        len(self._histogram_counts) - 1)
+            self._histogram_counts[index] += 1
+            self._histogram_energy[index] += momentary_energy
+
+    @property
+    def integrated(self):
+        """Gated integrated loudness in LUFS since the start (-inf if silent)"""
+        counts = self._histogram_counts
+        if not counts.any():
+            return -np.inf
+        relative = lufs(self._histogram_energy.sum() / counts.sum()) + RELATIVE_GATE
+        first = max(0, int(np.ceil((relative - ABSOLUTE_GATE) / HISTOGRAM_STEP)))
+        if not counts[first:].any():
+            return -np.inf
+        return lufs(self._histogram_energy[first:].sum() / counts[first:].sum())
+
+    def metrics(self):
+        """
+        Loudness figures for stats and metadata
+
+        Returns:
+            A dict with LUFS values, peaks in dBTP/dBFS, the clipped sample
+            count and flags for very quiet or clipped audio (None stands for
+            silence, to keep the dict JSON-safe)
+        """
+        def db(value):
+            return None if not np.isfinite(value) else round(float(value), 2)
+
+        with np.errstate(divide="ignore"):
+            integrated = self.integrated
+            return {
+                "momentary_lufs": db(self.momentary),
+                "short_term_lufs": db(self.short_term),
+                "integrated_lufs": db(integrated),
+                "max_momentary_lufs": db(self.max_momentary),
+                "max_short_term_lufs": db(self.max_short_term),
+                "true_peak_dbtp": db(20 * np.log10(max(self.true_peak, self.sample_peak))),
+                "sample_peak_dbfs": db(20 * np.log10(self.sample_peak)),
+                "clipped_samples": self.clipped_samples,
+                "quiet": bool(self.frames) and not integrated > QUIET_LUFS,
+                "clipped": self.clipped_samples > 0,
+            }
@@ -0,0 +1,283 @@
+"""
+Multi-resolution waveform peak index.
+
+Keeps min/max/RMS summaries of a recording at several zoom levels (e.g. 256,
+4096 and 65536 samples per bin), updated incrementally as frames arrive, so
+a waveform of any length can be rendered in O(pixels) instead of scanning
+the raw PCM. Only the finest level is computed from samples; coarser levels
+are folded from finished bins of the finest one. The recorder saves the
+index next to its store as `<store>.peaks.npz` when a recording stops.
+"""
+
+import numpy as np
+
+from recording_store import to_float32
+
+
+DEFAULT_LEVELS = (256, 4096, 65536)
+# columns of a summary array
+MIN, MAX, RMS = 0, 1, 2
+
+
+def summarize(samples, bin_size):
+    """
+    Min/max/RMS of consecutive `bin_size` blocks of a 1-D signal
+
+    The last bin covers the remaining samples if the length is not a
+    multiple of `bin_size`.
+
+    Returns:
+        A float32 array of shape (bins, 3)
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    full = len(samples) // bin_size * bin_size
+    blocks = samples[:full].reshape(-1, bin_size)
+    bins = np.empty((len(blocks) + (full < len(samples)), 3), dtype=np.float32)
+    bins[:len(blocks), MIN] = blocks.min(axis=1)
+    bins[:len(blocks), MAX] = blocks.max(axis=1)
+    bins[:len(blocks), RMS] = np.sqrt(np.einsum("ij,ij->i", blocks, blocks) / bin_size)
+    if full < len(samples):
+        tail = samples[full:]
+        bins[-1] = tail.min(), tail.max(), np.sqrt(np.dot(tail, tail) / len(tail))
+    return bins
+
+
+def _fold(bins, factor):
+    """Combine every `factor` bins (the last group may be shorter) into one"""
+    return _fold_at(bins, np.arange(0, len(bins), factor))
+
+
+def _fold_at(bins, starts):
+    """Combine bins into groups beginning at the (strictly increasing) `starts`"""
+    counts = np.diff(np.append(starts, len(bins)))
+    folded = np.empty((len(starts), 3), dtype=np.float32)
+    folded[:, MIN] = np.minimum.reduceat(bins[:, MIN], starts)
+    folded[:, MAX] = np.maximum.reduceat(bins[:, MAX], starts)
+    folded[:, RMS] = np.sqrt(np.add.reduceat(bins[:, RMS] ** 2, starts) / counts)
+    return folded
+
+
+class PeakIndex:
+    """
+    Incrementally built min/max/RMS pyramid of a (mono-mixed) recording.
+
+    Feed it with :py:meth:`add_frames` (raw callback data) or
+    :py:meth:`add_samples`, call :py:meth:`finish` once the recording has
+    ended to flush the partial bins, then :py:meth:`save` it next to the
+    recording. :py:meth:`query` returns at most `pixels` bins for any range.
+    """
+
+    def __init__(self, rate, levels=DEFAULT_LEVELS):
+        """
+        Args:
+            rate: Sample rate in Hz (kept for converting times to frames)
+            levels: Samples per bin of each zoom level; every level must be a
+                multiple of the finest one
+        """
+        levels = tuple(sorted(int(size) for size in levels))
+        if not levels or any(size % levels[0] for size in levels):
+            raise ValueError("Every peak level must be a multiple of the finest level")
+
+        self.rate = int(rate)
+        self.levels = levels
+        self.frames = 0
+        self.finished = False
+        # growable per-level arrays (doubling), only the first _counts rows are valid
+        self._bins = {size: np.empty((1024, 3), dtype=np.float32) for size in levels}
+        self._counts = {size: 0 for size in levels}
+        # samples not yet forming a finest bin, finest bins not yet forming a coarse bin
+        self._pending_samples = np.empty(0, dtype=np.float32)
+        self._pending_bins = {size: np.empty((0, 3), dtype=np.float32) for size in levels[1:]}
+
+    def reserve(self, frames):
+        """
+        Preallocate every level for a recording of `frames` frames
+
+        Args:
+            frames: Expected length of the recording
+        """
+        for size in self.levels:
+            bins = -(-frames // size)
+            if bins > len(self._bins[size]):
+                grown = np.empty((bins, 3), dtype=np.float32)
+                grown[:self._counts[size]] = self.level(size)
+                self._bins[size] = grown
+
+    def add_frames(self, data, sample_format, channels):
+        """
+        Add interleaved frames as delivered by the stream callback
+
+        Args:
+            data: Bytes (or array) of whole frames
+            sample_format: PortAudio sample format of `data`
+            channels: Number of interleaved channels
+        """
+        self.add_samples(to_float32(data, sample_format, channels).mean(axis=1))
+
+    def add_samples(self, samples):
+        """
+        Add mono float samples in [-1, 1)
+
+        Args:
+            samples: 1-D array of samples
+        """
+        self._check_open()
+        base = self.levels[0]
+        samples = np.asarray(samples, dtype=np.float32)
+        if len(self._pending_samples):
+            samples = np.concatenate((self._pending_samples, samples))
+
+        full = len(samples) // base * base
+        self._pending_samples = samples[full:].copy()
+        if full:
+            self._add_bins(summarize(samples[:full], base), full)
+
+    def add_silence(self, frames):
+        """
+        Add `frames` silent samples without materializing them
+
+        Args:
+            frames: Number of silent frames
+        """
+        self._check_open()
+        base = self.levels[0]
+        head = min(frames, -len(self._pending_samples) % base)
+        if head:
+            self.add_samples(np.zeros(head, dtype=np.float32))
+        full = (frames - head) // base * base
+        if full:
+            self._add_bins(np.zeros((full // base, 3), dtype=np.float32), full)
+        if frames - head - full:
+            self.add_samples(np.zeros(frames - head - full, dtype=np.float32))
+
+    def add_bins(self, bins, frames):
+        """
+        Add precomputed finest-level bins (see :py:func:`summarize`)
+
+        Used by workers that summarize aligned chunks in parallel. Only the
+        last call before :py:meth:`finish` may contain a partial bin.
+
+        Args:
+            bins: Array of shape (n, 3) at the finest level
+            frames: Number of frames the bins cover
+        """
+        self._check_open()
+        if len(self._pending_samples):
+            raise ValueError("Cannot add bins while samples are pending")
+        self._add_bins(np.asarray(bins, dtype=np.float32), frames)
+
+    def _add_bins(self, bins, frames):
+        base = self.levels[0]
+        self.frames += frames
+        self._append(base, bins)
+        for size in self.levels[1:]:
+            factor = size // base
+            pending = np.concatenate((self._pending_bins[size], bins))
+            full = len(pending) // factor * factor
+            if full:
+                self._append(size, _fold(pending[:full], factor))
+            self._pending_bins[size] = pending[full:]
+
+    def _append(self, size, bins):
+        count = self._counts[size]
+        if count + len(bins) > len(self._bins[size]):
+            grown = np.empty((max(count + len(bins), 2 * len(self._bins[size])), 3),
+                             dtype=np.float32)
+            grown[:count] = self._bins[size][:count]
+            self._bins[size] = grown
+        self._bins[size][count:count + len(bins)] = bins
+        self._counts[size] = count + len(bins)
+
+    def _check_open(self):
+        if self.finished:
+            raise ValueError("Peak index is finished")
+
+    def finish(self):
+        """Flush the partial bins at the end of the recording"""
+        if self.finished:
+            return
+
+        base = self.levels[0]
+        if len(self._pending_samples):
+            self.frames += len(self._pending_samples)
+            bins = summarize(self._pending_samples, base)
+            self._append(base, bins)
+            for size in self.levels[1:]:
+                self._pending_bins[size] = np.concatenate((self._pending_bins[size], bins))
+            self._pending_samples = np.empty(0, dtype=np.float32)
+
+        for size in self.levels[1:]:
+            if len(self._pending_bins[size]):
+                self._append(size, _fold(self._pending_bins[size], size // base))
+                self._pending_bins[size] = np.empty((0, 3), dtype=np.float32)
+        self.finished = True
+
+    def level(self, size):
+        """
+        Summary array of one zoom level
+
+        Returns:
+            A float32 view of shape (bins, 3) with min, max and RMS columns
+        """
+        return self._bins[size][:self._counts[size]]
+
+    def query(self, first, last, pixels):
+        """
+        Waveform of frames [first, last) reduced to at most `pixels` columns
+
+        Uses the coarsest level that still has at least one bin per pixel,
+        so the cost is proportional to `pixels`, not to the range length.
+
+        Returns:
+            A float32 array of shape (columns, 3) with min, max and RMS
+        """
+        last = min(last, self.frames)
+        if last <= first or pixels <= 0:
+            return np.empty((0, 3), dtype=np.float32)
+
+        per_pixel = (last - first) / pixels
+        size = self.levels[0]
+        for candidate in self.levels:
+            if candidate <= per_pixel:
+                size = candidate
+
+        bins = self.level(size)[first // size:-(-last // size)]
+        if len(bins) <= pixels:
+            return bins.copy()
+
+        starts = np.arange(pixels) * len(bins) // pixels
+        return _fold_at(bins, starts)
+
+    def query_time(self, start, end, pixels):
+        """Like :py:meth:`query`, with the range given in seconds"""
+        return self.query(int(start * self.rate), int(end * self.rate), pixels)
+
+    def save(self, path):
+        """
+        Persist all levels to an .npz file
+
+        Args:
+            path: Target file (conventionally `<recording>.peaks.npz`)
+        """
+        arrays = {f"level_{size}": self.level(size) for size in self.levels}
+        with open(path, "wb") as f:
+            np.savez(f, rate=self.rate, frames=self.frames,
+                     levels=np.array(self.levels), **arrays)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a finished index written by :py:meth:`save`
+
+        Returns:
+            A finished PeakIndex
+        """
+        with np.load(path) as data:
+            index = cls(int(data["rate"]), tuple(int(size) for size in data["levels"]))
+            index.frames = int(data["frames"])
+            for size in index.levels:
+                index._append(size, data[f"level_{size}"])
+        index.finished = True
+        return index
+
@@ -0,0 +1,96 @@
+"""
+Pre-roll ring buffer.
+
+While the recorder is on standby the capture stream keeps running and its
+chunks overwrite a fixed-size ring, so the last few seconds before a start
+command can be committed to the recording retroactively.
+"""
+
+
+class PrerollBuffer:
+    """Fixed-size ring of the most recent interleaved frames"""
+
+    def __init__(self, seconds, rate, frame_size):
+        """
+        Args:
+            seconds: Amount of audio kept
+            rate: Sample rate in Hz
+            frame_size: Bytes per interleaved frame
+        """
+        self.rate = int(rate)
+        self.frame_size = frame_size
+        self.capacity = max(1, int(seconds * self.rate)) * frame_size
+        self._ring = bytearray(self.capacity)
+        self._written = 0
+        # stream time of the first frame after the buffered audio
+        self.end_adc_time = None
+
+    @property
+    def frames(self):
+        """Number of frames currently buffered"""
+        return min(self._written, self.capacity) // self.frame_size
+
+    def write(self, data, adc_time=None):
+        """
+        Append a chunk, overwriting the oldest audio
+
+        Args:
+            data: Bytes of whole frames
+            adc_time: Optional ADC time of the chunk's first frame
+        """
+        data = memoryview(data).cast("B")
+        chunk_frames = len(data) // self.frame_size
+        if len(data) > self.capacity:
+            data = data[len(data) - self.capacity:]
+        start = self._written % self.capacity
+        head = min(len(data), self.capacity - start)
+        self._ring[start:start + head] = data[:head]
+        self._ring[:len(data) - head] = data[head:]
+        self._written += len(data)
+        if adc_time:
+            self.end_adc_time = adc_time + chunk_frames / self.rate
+
+    def read(self):
+        """
+        The buffered audio, oldest frame first
+
+        Returns:
+            Bytes of whole frames
+        """
+        if self._written <= self.capacity:
+            return bytes(self._ring[:self._written])
+        start = self._written % self.capacity
+        return bytes(self._ring[start:] + self._ring[:start])
+
+    def read_since(self, position):
+        """
+        The audio written after an earlier `position` (at most the whole ring)
+
+        Args:
+            position: Position returned by the previous call, or None to
+                start from now
+
+        Returns:
+            (bytes of whole frames, position for the next call)
+        """
+        if position is None:
+            return b"", self._written
+        if position > self._written:
+            position = 0  # cleared in between
+        position = max(position, self._written - self.capacity)
+        count = self._written - position
+        start = position % self.capacity
+        head = min(count, self.capacity - start)
+        return bytes(self._ring[start:start + head]) + bytes(self._ring[:count - head]), \
+            self._written
+
+    def start_adc_time(self):
+        """Stream time of the oldest buffered frame (None if unknown)"""
+        if self.end_adc_time is None:
+            return None
+        return self.end_adc_time - self.frames / self.rate
+
+    def clear(self):
+        """Drop the buffered audio"""
+        self._written = 0
+        self.end_adc_time = None
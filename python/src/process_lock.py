@@ -0,0 +1,89 @@
+"""
+Single-instance process lock.
+
+The lock is an OS-level lock (fcntl on POSIX, msvcrt on Windows) held on an
+open file descriptor, so it is released by the operating system when the
+owning process dies. A lock file left behind by a crashed process therefore
+never blocks a restart; the file only records the owner's PID for messages.
+"""
+
+import os
+import sys
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+# Windows locks are mandatory, so lock a byte past the PID to keep it readable
+LOCK_OFFSET = 64
+
+
+class ProcessLock:
+    """Non-blocking, crash-safe exclusive lock on a file"""
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Lock file path
+        """
+        self.path = path
+        self._fd = None
+
+    def acquire(self):
+        """
+        Try to take the lock and record our PID in the lock file
+
+        Returns:
+            True if the lock was acquired, False if another live process holds it
+        """
+        if self._fd is not None:
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if sys.platform == "win32":
+                os.lseek(fd, LOCK_OFFSET, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, str(os.getpid()).encode("ascii").ljust(LOCK_OFFSET - 1) + b"\n")
+        self._fd = fd
+        return True
+
+    def owner_pid(self):
+        """
+        PID recorded in the lock file
+
+        Returns:
+            The PID, or None if the file is missing or unreadable
+        """
+        try:
+            with open(self.path, "rb") as f:
+                return int(f.read(LOCK_OFFSET).strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def release(self):
+        """
+        Release the lock. The file is left in place: removing it could let
+        two processes lock different inodes of the same path, and an
+        unlocked file does not block anybody.
+        """
+        if self._fd is None:
+            return
+
+        try:
+            if sys.platform == "win32":
+                os.lseek(self._fd, LOCK_OFFSET, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,76 @@
+"""
+Real-time hygiene during capture.
+
+The audio callback runs on a PortAudio thread that must take the GIL. A
+full garbage collection on another thread holds the GIL for as long as it
+walks the heap, and a callback waiting behind it can overflow the device
+buffer. `RealtimeHygiene` keeps the collector out of the way while a
+recording runs:
+
+- objects created during setup are moved out of the collector's reach
+  with `gc.freeze()`, so later collections do not walk them,
+- the collection thresholds are raised, so collections are rare and
+  small, and restored when the recording stops,
+- the recorder preallocates its buffers for `preallocate_seconds`, so the
+  callback does not grow them.
+
+`enter()` runs a full collection, so the recorder calls it before the
+stream is opened or started, never while the callback is live.
+
+Only the recording store and the peak index are preallocated. The feature
+file, the `output_queue` of a recorder without a store and the AGC gain
+curve still grow per chunk; they are fed on the pipeline thread, and with
+the raised thresholds their allocations seldom trigger a collection.
+"""
+
+import gc
+
+
+# generation 0 collections every 50k allocations, older generations rarely
+THRESHOLDS = (50000, 50, 100)
+
+
+class RealtimeHygiene:
+    """Garbage collector control for the duration of a recording"""
+
+    def __init__(self, thresholds=THRESHOLDS, preallocate_seconds=3600):
+        """
+        Args:
+            thresholds: gc thresholds used while recording
+            preallocate_seconds: Recording length the pipeline buffers are
+                preallocated for
+        """
+        self.thresholds = tuple(thresholds)
+        self.preallocate_seconds = preallocate_seconds
+        self.active = False
+        self._saved_thresholds = None
+        self.frozen_objects = 0
+
+    def enter(self):
+        """Freeze the setup objects and raise the thresholds (after setup)"""
+        if self.active:
+            return
+        # collect the setup garbage now rather than during the recording
+        gc.collect()
+        gc.freeze()
+        self.frozen_objects = gc.get_freeze_count()
+        self._saved_thresholds = gc.get_threshold()
+        gc.set_threshold(*self.thresholds)
+        self.active = True
+
+    def exit(self):
+        """Restore the thresholds and unfreeze (at stop)"""
+        if not self.active:
+            return
+        gc.set_threshold(*self._saved_thresholds)
+        gc.unfreeze()
+        self.active = False
+
+    def __enter__(self):
+        """Context manager entry method"""
+        self.enter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit method - restores the collector settings"""
+        self.exit()
@@ -0,0 +1,403 @@
+"""
+Crash-safe recording journal.
+
+Captured chunks are appended to a journal file as self-describing records
+(sequence number, timestamp, frame count, CRC32, payload) by a bounded
+background writer, so a crash loses at most the last unsynced records.
+Silence the recorder inserts into its timeline is journaled as zero-length
+records that only carry the frame count. `recover` rebuilds a WAV (or FLAC)
+file from a complete or partial journal in one streaming pass, on the same
+timeline as the recording store.
+The recorder removes its journal once the recording has been saved.
+
+Usage:
+    python recording_journal.py recover <journal> [output.wav|output.flac]
+"""
+
+import os
+import struct
+import sys
+import threading
+import time
+import wave
+import zlib
+from queue import Empty
+
+import pyaudiowpatch as pyaudio
+
+from channels import BoundedChannel, ChannelClosed, DROP_NEWEST
+from recording_store import silence_bytes
+
+
+# magic, version, channels, sample format, sample width, rate, created
+FILE_HEADER_FORMAT = "<8sHHIHxxId"
+FILE_HEADER_SIZE = struct.calcsize(FILE_HEADER_FORMAT)
+FILE_MAGIC = b"AVHJRN01"
+VERSION = 2
+
+# sync word, sequence, timestamp, frames, payload length, crc32
+RECORD_HEADER_FORMAT = "<4sQdIII"
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+RECORD_SYNC = b"CHNK"
+# records larger than this are treated as corruption during recovery
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+
+def _record_crc(seq, timestamp, frames, payload):
+    """CRC32 over the record fields and the payload"""
+    crc = zlib.crc32(struct.pack("<QdII", seq, timestamp, frames, len(payload)))
+    return zlib.crc32(payload, crc)
+
+
+class RecordingJournal:
+    """
+    Append-only chunk journal written by a background thread.
+
+    `append` never blocks (it is called from the stream callback): if the
+    writer falls more than `max_pending` chunks behind, new chunks are
+    dropped and counted in `dropped`, which shows up as a sequence gap
+    during recovery and is filled with silence there.
+    """
+
+    def __init__(self, path, channels, rate, sample_format=pyaudio.paInt16,
+                 max_pending=256, sync_interval=1.0):
+        """
+        Create the journal file and start the writer thread
+
+        Args:
+            path: Journal file to create (overwritten if it exists)
+            channels: Number of interleaved channels
+            rate: Sample rate in Hz
+            sample_format: PortAudio sample format of the chunks
+            max_pending: Maximum number of chunks queued for the writer
+            sync_interval: Seconds between fsync calls
+        """
+        self.path = path
+        self.channels = channels
+        self.rate = int(rate)
+        self.sample_format = sample_format
+        self.sample_width = pyaudio.get_sample_size(sample_format)
+        self.sync_interval = sync_interval
+        self.written = 0
+        self.dropped = 0
+        self._seq = 0
+        self.write_channel = BoundedChannel("journal", max_items=max_pending, policy=DROP_NEWEST,
+                                            sizeof=lambda item: len(item[3]))
+        self._error = None
+
+        self._file = open(path, "wb")
+        self._file.write(struct.pack(FILE_HEADER_FORMAT, FILE_MAGIC, VERSION,
+                                     channels, sample_format, self.sample_width,
+                                     self.rate, time.time()))
+        self._file.flush()
+
+        self._writer = threading.Thread(target=self._write_loop,
+                                        name="RecordingJournalWriter", daemon=True)
+        self._writer.start()
+
+    def append(self, data, timestamp=None):
+        """
+        Queue a chunk for writing (non-blocking)
+
+        Args:
+            data: Bytes of whole frames
+            timestamp: Capture time of the chunk (defaults to time.time())
+
+        Returns:
+            True if queued, False if the chunk was dropped
+        """
+        data = bytes(data)
+        return self._queue(len(data) // (self.channels * self.sample_width), data, timestamp)
+
+    def append_silence(self, frames, timestamp=None):
+        """
+        Queue a run of silent frames as a zero-length record (non-blocking)
+
+        Args:
+            frames: Number of silent frames
+            timestamp: Time of the first silent frame (defaults to time.time())
+
+        Returns:
+            True if queued, False if the record was dropped
+        """
+        return self._queue(frames, b"", timestamp)
+
+    def _queue(self, frames, payload, timestamp):
+        seq = self._seq
+        self._seq += 1
+        queued = self.write_channel.put_nowait(
+            (seq, time.time() if timestamp is None else timestamp, frames, payload))
+        if not queued:
+            self.dropped += 1
+        return queued
+
+    def _write_loop(self):
+        """Writer thread: drain the queue, fsync every `sync_interval` seconds"""
+        last_sync = time.monotonic()
+        while True:
+            try:
+                item = self.write_channel.get(timeout=self.sync_interval)
+            except Empty:
+                item = ()
+            except ChannelClosed:
+                break
+
+            try:
+                if item:
+                    seq, timestamp, frames, payload = item
+                    self._file.write(struct.pack(
+                        RECORD_HEADER_FORMAT, RECORD_SYNC, seq, timestamp, frames,
+                        len(payload), _record_crc(seq, timestamp, frames, payload)))
+                    self._file.write(payload)
+                    self.written += 1
+
+                if time.monotonic() - last_sync >= self.sync_interval:
+                    self._sync()
+                    last_sync = time.monotonic()
+            except OSError as e:
+                # keep draining so append() never stalls; report on close()
+                self._error = e
+
+        self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """
+        Flush all queued chunks and close the journal
+
+        Raises:
+            OSError: If the writer thread failed to write a record
+        """
+        if self._file is None:
+            return
+
+        self.write_channel.close()
+        self._writer.join()
+        self._file.close()
+        self._file = None
+
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        """Context manager entry method"""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit method - flushes and closes the journal"""
+        self.close()
+
+
+def read_journal(path):
+    """
+    Stream the valid records of a (possibly truncated or damaged) journal
+
+    Damaged records are skipped by scanning forward to the next sync word.
+
+    Args:
+        path: Journal file
+
+    Returns:
+        (info, records): `info` is a dict with the stream parameters and a
+        `corrupt` counter updated while iterating; `records` yields
+        (seq, timestamp, frames, payload) tuples in file order, with an
+        empty payload for a silence record
+    """
+    f = open(path, "rb")
+    header = f.read(FILE_HEADER_SIZE)
+    if len(header) < FILE_HEADER_SIZE:
+        f.close()
+        raise ValueError("Not a recording journal: header is truncated")
+
+    magic, version, channels, sample_format, sample_width, rate, created = \
+        struct.unpack(FILE_HEADER_FORMAT, header)
+    if magic != FILE_MAGIC:
+        f.close()
+        raise ValueError("Not a recording journal: bad magic")
+    if version != VERSION:
+        f.close()
+        raise ValueError(f"Unsupported recording journal version: {version}")
+
+    info = {"channels": channels, "sample_format": sample_format,
+            "sample_width": sample_width, "rate": rate, "created": created,
+            "corrupt": 0}
+
+    def records():
+        with f:
+            while True:
+                start = f.tell()
+                header = f.read(RECORD_HEADER_SIZE)
+                if len(header) < RECORD_HEADER_SIZE:
+                    return  # clean end or torn header
+
+                sync, seq, timestamp, frames, length, crc = \
+                    struct.unpack(RECORD_HEADER_FORMAT, header)
+                if sync == RECORD_SYNC and length <= MAX_RECORD_SIZE:
+                    payload = f.read(length)
+                    if len(payload) < length:
+                        return  # torn tail
+                    if _record_crc(seq, timestamp, frames, payload) == crc:
+                        yield seq, timestamp, frames, payload
+                        continue
+
+                info["corrupt"] += 1
+                if not _resync(f, start + 1):
+                    return
+
+    return info, records()
+
+
+def _resync(f, position):
+    """Seek `f` to the next sync word at or after `position`"""
+    f.seek(position)
+    window = b""
+    while True:
+        block = f.read(1 << 16)
+        if not block:
+            return False
+        window += block
+        index = window.find(RECORD_SYNC)
+        if index >= 0:
+            f.seek(position + index)
+            return True
+        # keep a possible partial sync word at the boundary
+        position += len(window) - (len(RECORD_SYNC) - 1)
+        window = window[-(len(RECORD_SYNC) - 1):]
+
+
+def recover(journal_path, output_path=None):
+    """
+    Rebuild an audio file from a journal in a single streaming pass
+
+    Silence records are written out as silent frames. Records the writer
+    dropped (gaps in the sequence numbers) are filled with silence as long
+    as the audio record before them (or after them, at the start), so the
+    output stays on the recording's timeline.
+
+    Args:
+        journal_path: Journal written by RecordingJournal (may be truncated)
+        output_path: Target .wav or .flac file (defaults to the journal name
+            with a .wav extension). FLAC output requires the `soundfile` package.
+
+    Returns:
+        A dict with the output filename and recovery statistics
+    """
+    if output_path is None:
+        output_path = os.path.splitext(journal_path)[0] + ".wav"
+
+    info, records = read_journal(journal_path)
+    frame_size = info["channels"] * info["sample_width"]
+    stats = {"output": output_path, "records": 0, "frames": 0, "silent_frames": 0,
+             "missing_records": 0, "missing_frames": 0, "corrupt_records": 0}
+
+    if output_path.lower().endswith(".flac"):
+        writer = _FlacWriter(output_path, info)
+    else:
+        writer = _WavWriter(output_path, info)
+
+    def write_silence(frames):
+        for block in silence_bytes(frames, frame_size, info["sample_format"]):
+            writer.write(block)
+        stats["frames"] += frames
+
+    expected_seq = None
+    chunk_frames = None  # length of the last audio record
+    with writer:
+        for seq, timestamp, frames, payload in records:
+            if payload:
+                frames = len(payload) // frame_size
+            if expected_seq is not None and seq > expected_seq:
+                missing = (seq - expected_seq) * (chunk_frames or frames)
+                stats["missing_records"] += seq - expected_seq
+                stats["missing_frames"] += missing
+                write_silence(missing)
+            expected_seq = seq + 1
+
+            if payload:
+                writer.write(payload[:frames * frame_size])
+                stats["frames"] += frames
+                chunk_frames = frames
+            else:
+                write_silence(frames)
+                stats["silent_frames"] += frames
+            stats["records"] += 1
+
+    stats["corrupt_records"] = info["corrupt"]
+    return stats
+
+
+class _WavWriter:
+    def __init__(self, path, info):
+        self._wf = wave.open(path, "wb")
+        self._wf.setnchannels(info["channels"])
+        self._wf.setsampwidth(info["sample_width"])
+        self._wf.setframerate(info["rate"])
+
+    def write(self, payload):
+        self._wf.writeframesraw(payload)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # wave patches the header sizes on close
+        self._wf.close()
+
+
+class _FlacWriter:
+    SUBTYPES = {2: "PCM_16", 3: "PCM_24"}
+
+    def __init__(self, path, info):
+        try:
+            import numpy as np
+            import soundfile
+        except ImportError:
+            raise RuntimeError("FLAC output requires the 'soundfile' package")
+
+        width = info["sample_width"]
+        if width not in self.SUBTYPES or info["sample_format"] == pyaudio.paFloat32:
+            raise ValueError("FLAC output supports 16 and 24 bit integer journals only")
+
+        self._np = np
+        self._width = width
+        self._channels = info["channels"]
+        self._sf = soundfile.SoundFile(path, "w", samplerate=info["rate"],
+                                       channels=info["channels"], format="FLAC",
+                                       subtype=self.SUBTYPES[width])
+
+    def write(self, payload):
+        if self._width == 3:
+            payload = pyaudio.int24_to_int32(payload)
+            samples = self._np.frombuffer(payload, dtype="<i4")
+        else:
+            samples = self._np.frombuffer(payload, dtype="<i2")
+        self._sf.write(samples.reshape(-1, self._channels))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._sf.close()
+
+
+def main(argv):
+    """Command line entry point: `recover <journal> [output]`"""
+    if len(argv) < 2 or argv[0] != "recover":
+        print(__doc__.strip().splitlines()[-1].strip())
+        return 2
+
+    stats = recover(argv[1], argv[2] if len(argv) > 2 else None)
+    print(f"Recovered {stats['frames']} frames from {stats['records']} records "
+          f"to {stats['output']}")
+    if stats["missing_records"] or stats["corrupt_records"]:
+        print(f"Skipped {stats['corrupt_records']} corrupt records, "
+              f"{stats['missing_records']} records were never written "
+              f"({stats['missing_frames']} frames filled with silence)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,567 @@
+"""
+Memory-mapped recording store.
+
+Audio is kept as raw PCM in a single preallocated file with a small fixed
+header, so any time range of a recording can be exposed as a zero-copy
+numpy view backed by the page cache (for replay, waveform rendering or
+re-transcription of a region) instead of re-reading a WAV file.
+
+Stretches of silence (e.g. WASAPI loopback delivering nothing while no
+audio plays) are not stored as zeros: they are recorded as run-length
+markers in a small ``.gaps`` sidecar file and expanded on the fly by the
+timeline accessors and on export, so the timeline matches wall-clock time.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import time
+import wave
+from collections import namedtuple
+
+import numpy as np
+import pyaudiowpatch as pyaudio
+
+
+# magic, version, channels, sample format, sample width, rate, frames, created
+HEADER_FORMAT = "<8sHHIHxxIQd"
+HEADER_SIZE = 64
+MAGIC = b"AVHPCM01"
+VERSION = 1
+
+# gap markers: stored frame position, number of silent frames
+GAP_FORMAT = "<QQ"
+GAP_SIZE = struct.calcsize(GAP_FORMAT)
+
+# marker for a run of silent frames, queued in place of audio data
+Silence = namedtuple("Silence", ["frames"])
+
+# numpy dtypes of the PortAudio sample formats (paInt24 has no numpy
+# equivalent and is exposed as raw bytes, see pyaudiowpatch.int24_to_int32)
+SAMPLE_DTYPES = {
+    pyaudio.paFloat32: np.float32,
+    pyaudio.paInt32: np.int32,
+    pyaudio.paInt16: np.int16,
+    pyaudio.paInt8: np.int8,
+    pyaudio.paUInt8: np.uint8,
+}
+
+
+def to_float32(data, sample_format, channels):
+    """
+    Convert interleaved frames to float32 samples in [-1, 1)
+
+    Args:
+        data: Bytes-like object or array (e.g. a store slice) of whole frames
+        sample_format: PortAudio sample format of `data`
+        channels: Number of interleaved channels
+
+    Returns:
+        A float32 array of shape (frames, channels)
+    """
+    if sample_format == pyaudio.paInt24:
+        converted = pyaudio.int24_to_float32(np.ascontiguousarray(data))
+        return np.frombuffer(converted, dtype=np.float32).reshape(-1, channels)
+
+    dtype = SAMPLE_DTYPES[sample_format]
+    if isinstance(data, np.ndarray):
+        samples = data.reshape(-1, channels)
+    else:
+        samples = np.frombuffer(data, dtype=dtype).reshape(-1, channels)
+
+    if sample_format == pyaudio.paFloat32:
+        return np.asarray(samples)
+    if sample_format == pyaudio.paUInt8:
+        return (samples.astype(np.float32) - 128) / 128
+    return samples.astype(np.float32) / (float(np.iinfo(dtype).max) + 1)
+
+
+def gaps_path(path):
+    """Sidecar file holding the silence markers of a store"""
+    return os.path.splitext(path)[0] + ".gaps"
+
+
+def silence_bytes(frames, frame_size, sample_format=None, chunk_frames=1 << 16):
+    """
+    Yield silent byte chunks covering `frames` frames
+
+    Lets a long run of silence be written out without allocating it at once.
+    Unsigned 8-bit silence is 0x80, every other format is zero-filled.
+    """
+    fill = b"\x80" if sample_format == pyaudio.paUInt8 else b"\x00"
+    block = fill * (min(frames, chunk_frames) * frame_size)
+    while frames > 0:
+        count = min(frames, chunk_frames)
+        yield block if count == chunk_frames else block[:count * frame_size]
+        frames -= count
+
+
+def from_float32(samples, sample_format):
+    """
+    Convert float32 samples in [-1, 1) back to interleaved frames
+
+    Args:
+        samples: Float array of shape (frames, channels)
+        sample_format: Target PortAudio sample format
+
+    Returns:
+        Bytes of interleaved frames
+    """
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    if sample_format == pyaudio.paFloat32:
+        return samples.tobytes()
+    if sample_format == pyaudio.paInt24:
+        return pyaudio.float32_to_int24(samples)
+    if sample_format == pyaudio.paUInt8:
+        return (np.clip(samples * 128 + 128, 0, 255)).astype(np.uint8).tobytes()
+
+    info = np.iinfo(SAMPLE_DTYPES[sample_format])
+    scaled = np.clip(np.round(samples * (float(info.max) + 1)), info.min, info.max)
+    return scaled.astype(info.dtype).tobytes()
+
+
+class RecordingStore:
+    """
+    Raw PCM recording backed by a growing memory-mapped file.
+
+    Frames are appended with :py:meth:`write` (e.g. from the stream callback)
+    or read straight from a blocking stream into the mapping with
+    :py:meth:`capture_from`. Any time range can be accessed with
+    :py:meth:`slice` without copying.
+
+    Silence is appended with :py:meth:`add_silence` and only recorded as a
+    marker. `frames` and :py:meth:`slice` refer to the stored frames;
+    `timeline_frames` and :py:meth:`timeline_slice` include the silence.
+
+    Note: Windows refuses to resize a file that is still mapped, so views
+    returned by :py:meth:`slice` should be dropped before the store has to
+    grow past its preallocated capacity (or before it is closed). Frames
+    that cannot be written because of that are recorded as silence and
+    counted in `lost_frames`.
+    """
+
+    def __init__(self, path, channels, rate, sample_format=pyaudio.paInt16,
+                 preallocate_seconds=600):
+        """
+        Create a new store, preallocating room for `preallocate_seconds` of audio
+
+        Args:
+            path: File to create (overwritten if it exists)
+            channels: Number of interleaved channels
+            rate: Sample rate in Hz
+            sample_format: PortAudio sample format of the frames
+            preallocate_seconds: Initial capacity; the file doubles when full
+        """
+        self.path = path
+        self.channels = channels
+        self.rate = int(rate)
+        self.sample_format = sample_format
+        self.sample_width = pyaudio.get_sample_size(sample_format)
+        self.frame_size = self.channels * self.sample_width
+        self.created = time.time()
+        self.frames = 0
+        self.lost_frames = 0
+        self.writable = True
+        self._reader = None
+        self._init_gaps([])
+        self._gaps_file = open(gaps_path(path), "wb")
+
+        capacity = max(1, int(preallocate_seconds * self.rate)) * self.frame_size
+        self._file = open(path, "w+b")
+        self._file.truncate(HEADER_SIZE + capacity)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._write_header()
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open an existing store read-only
+
+        Args:
+            path: Store file written by a previous :py:class:`RecordingStore`
+
+        Returns:
+            A read-only RecordingStore
+        """
+        store = cls.__new__(cls)
+        store.path = path
+        store._file = None
+        store._map = None
+        store._gaps_file = None
+        store._reader = None
+        store.lost_frames = 0
+        store.writable = False
+
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        (store.channels, store.rate, store.sample_format, store.sample_width,
+         store.frames, store.created) = cls._parse_header(header)
+        store.frame_size = store.channels * store.sample_width
+
+        # The header count is authoritative: until the store is closed the file
+        # ends in a preallocated, zeroed tail, so its size says nothing about
+        # the frames written. It only caps the count if the file was cut short.
+        available = (os.path.getsize(path) - HEADER_SIZE) // store.frame_size
+        store.frames = min(store.frames, available)
+        store._init_gaps(cls._read_gaps(gaps_path(path), store.frames))
+        return store
+
+    @staticmethod
+    def _read_gaps(path, frames):
+        """Silence markers of a sidecar file, merged and limited to `frames`"""
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb") as f:
+            data = f.read()
+        gaps = []
+        # a torn last record (crash while writing) is ignored
+        for position, length in struct.iter_unpack(GAP_FORMAT,
+                                                   data[:len(data) // GAP_SIZE * GAP_SIZE]):
+            if position > frames:
+                break
+            if gaps and gaps[-1][0] == position:
+                gaps[-1] = (position, gaps[-1][1] + length)
+            else:
+                gaps.append((position, length))
+        return gaps
+
+    def _init_gaps(self, gaps):
+        """Set the silence markers and the timeline index derived from them"""
+        self.gaps = []
+        self._gap_starts = []  # timeline frame where each gap starts
+        self._gap_ends = []    # timeline frame after each gap
+        self.silent_frames = 0
+        for position, length in gaps:
+            self._append_gap(position, length)
+
+    def _append_gap(self, position, length):
+        if self.gaps and self.gaps[-1][0] == position:
+            self.gaps[-1] = (position, self.gaps[-1][1] + length)
+            self._gap_ends[-1] += length
+        else:
+            start = position + self.silent_frames
+            self.gaps.append((position, length))
+            self._gap_starts.append(start)
+            self._gap_ends.append(start + length)
+        self.silent_frames += length
+
+    @staticmethod
+    def _parse_header(header):
+        """Validate a raw header and return its fields"""
+        if len(header) < HEADER_SIZE:
+            raise ValueError("Not a recording store: header is truncated")
+
+        (magic, version, channels, sample_format, sample_width, rate, frames,
+         created) = struct.unpack_from(HEADER_FORMAT, header)
+
+        if magic != MAGIC:
+            raise ValueError("Not a recording store: bad magic")
+        if version != VERSION:
+            raise ValueError(f"Unsupported recording store version: {version}")
+
+        return channels, rate, sample_format, sample_width, frames, created
+
+    def _write_header(self):
+        """Write the header (including the current frame count) into the mapping"""
+        struct.pack_into(HEADER_FORMAT, self._map, 0, MAGIC, VERSION,
+                         self.channels, self.sample_format, self.sample_width,
+                         self.rate, self.frames, self.created)
+
+    def __enter__(self):
+        """Context manager entry method"""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit method - ensures the file is finalized"""
+        self.close()
+
+    def __len__(self):
+        return self.frames
+
+    @property
+    def duration(self):
+        """Length of the stored audio in seconds"""
+        return self.frames / self.rate
+
+    @property
+    def timeline_frames(self):
+        """Length of the recording in frames, silence markers included"""
+        return self.frames + self.silent_frames
+
+    @property
+    def timeline_duration(self):
+        """Length of the recording in seconds, silence markers included"""
+        return self.timeline_frames / self.rate
+
+    @property
+    def capacity(self):
+        """Number of frames that fit into the file without growing it"""
+        if self._map is None:
+            return self.frames
+        return (len(self._map) - HEADER_SIZE) // self.frame_size
+
+    def _ensure_capacity(self, frames):
+        """Grow (double) the file until `frames` more frames fit"""
+        needed = self.frames + frames
+        if needed <= self.capacity:
+            return
+
+        new_capacity = max(needed, self.capacity * 2)
+        self._reader = None
+        self._map.flush()
+        self._map.close()
+        try:
+            self._file.truncate(HEADER_SIZE + new_capacity * self.frame_size)
+        finally:
+            # on failure the file keeps its size and is mapped again as it was
+            self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def _check_writable(self):
+        if not self.writable or self._map is None:
+            raise ValueError("Recording store is not open for writing")
+
+    def write(self, data):
+        """
+        Append interleaved frames
+
+        Args:
+            data: Bytes-like object holding whole frames
+
+        Returns:
+            Number of frames written
+        """
+        self._check_writable()
+
+        nbytes = memoryview(data).nbytes
+        if nbytes % self.frame_size:
+            raise ValueError("Data does not contain a whole number of frames")
+
+        frames = nbytes // self.frame_size
+        try:
+            self._ensure_capacity(frames)
+        except OSError as e:
+            # keep the timeline intact instead of failing the writer
+            if not self.lost_frames:
+                print(f"Warning: recording store cannot grow ({e}); "
+                      f"recording silence until its slices are released")
+            self.lost_frames += frames
+            self.add_silence(frames)
+            return 0
+        offset = HEADER_SIZE + self.frames * self.frame_size
+        self._map[offset:offset + nbytes] = data
+        self.frames += frames
+        return frames
+
+    def add_silence(self, frames):
+        """
+        Append `frames` silent frames as a marker (nothing is written to the map)
+
+        Args:
+            frames: Number of silent frames
+        """
+        self._check_writable()
+        if frames <= 0:
+            return
+        self._gaps_file.write(struct.pack(GAP_FORMAT, self.frames, frames))
+        self._append_gap(self.frames, frames)
+
+    def capture_from(self, stream, num_frames, exception_on_overflow=False):
+        """
+        Read `num_frames` from a blocking input stream directly into the store
+
+        Args:
+            stream: An open (blocking) pyaudiowpatch input Stream
+            num_frames: Number of frames to read
+            exception_on_overflow: Passed through to Stream.readinto
+
+        Returns:
+            Number of frames captured
+        """
+        self._check_writable()
+        self._ensure_capacity(num_frames)
+
+        offset = HEADER_SIZE + self.frames * self.frame_size
+        end = offset + num_frames * self.frame_size
+        with memoryview(self._map) as mapping, mapping[offset:end] as view:
+            frames = stream.readinto(view, num_frames, exception_on_overflow)
+
+        self.frames += frames
+        return frames
+
+    def flush(self):
+        """Persist the frame count and flush dirty pages to disk"""
+        if self._map is not None:
+            self._write_header()
+            self._map.flush()
+            self._gaps_file.flush()
+
+    def close(self):
+        """Finalize the file, trimming the preallocated tail"""
+        if self._map is None:
+            return
+
+        self._write_header()
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._reader = None
+        try:
+            self._file.truncate(HEADER_SIZE + self.frames * self.frame_size)
+        except OSError:
+            # still mapped by a reader; the header frame count stays authoritative
+            pass
+        self._file.close()
+        self._file = None
+        self._gaps_file.close()
+        self._gaps_file = None
+        self.writable = False
+
+    def time_to_frame(self, seconds):
+        """Convert a time offset (in seconds) to a frame index clamped to the store"""
+        return min(max(int(round(seconds * self.rate)), 0), self.frames)
+
+    def slice(self, start=0.0, end=None):
+        """
+        Zero-copy view of the audio between `start` and `end` seconds
+
+        Args:
+            start: Start of the range in seconds
+            end: End of the range in seconds (None for the end of the recording)
+
+        Returns:
+            A read-only np.memmap of shape (frames, channels), or
+            (frames, channels, 3) raw bytes for paInt24 recordings
+        """
+        first = self.time_to_frame(start)
+        last = self.frames if end is None else self.time_to_frame(end)
+        return self.frame_slice(first, max(first, last))
+
+    def frame_slice(self, first, last):
+        """
+        Zero-copy view of frames [first, last)
+
+        Returns:
+            A read-only np.memmap (see :py:meth:`slice`)
+        """
+        dtype = SAMPLE_DTYPES.get(self.sample_format)
+        if dtype is None:
+            shape = (last - first, self.channels, self.sample_width)
+            dtype = np.uint8
+        else:
+            shape = (last - first, self.channels)
+
+        if last <= first:
+            return np.empty(shape, dtype=dtype)
+
+        # one read-only mapping of the file serves every slice; it is
+        # replaced when the file grows
+        length = self.capacity
+        if self._reader is None or len(self._reader) < min(last, length):
+            self._reader = np.memmap(self.path, dtype=dtype, mode="r", offset=HEADER_SIZE,
+                                     shape=(length,) + shape[1:])
+        return self._reader[first:last]
+
+    def float_slice(self, first, last):
+        """
+        Frames [first, last) converted to float32 (see :py:func:`to_float32`)
+
+        Returns:
+            A float32 array of shape (frames, channels)
+        """
+        return to_float32(self.frame_slice(first, last), self.sample_format, self.channels)
+
+    def _timeline_segments(self, first, last):
+        """
+        Split timeline frames [first, last) into stored audio and silence
+
+        Yields:
+            (stored_first, stored_last) tuples for audio, or Silence(frames)
+        """
+        i = bisect.bisect_right(self._gap_ends, first)
+        position = first
+        while position < last:
+            if i < len(self.gaps) and self._gap_starts[i] <= position:
+                end = min(self._gap_ends[i], last)
+                yield Silence(end - position)
+                i += 1
+            else:
+                # silence of all gaps before this stored position
+                silent_before = self._gap_ends[i - 1] - self.gaps[i - 1][0] if i else 0
+                end = min(self._gap_starts[i], last) if i < len(self.gaps) else last
+                yield (position - silent_before, end - silent_before)
+            position = end
+
+    def timeline_slice(self, first, last):
+        """
+        Timeline frames [first, last) with the silence expanded
+
+        Zero-copy (see :py:meth:`frame_slice`) unless the range overlaps a
+        silence marker, in which case a new array is assembled.
+
+        Returns:
+            An array shaped like :py:meth:`frame_slice`
+        """
+        last = min(last, self.timeline_frames)
+        first = min(first, last)
+        segments = list(self._timeline_segments(first, last))
+        if len(segments) == 1 and not isinstance(segments[0], Silence):
+            return self.frame_slice(*segments[0])
+
+        parts = []
+        for segment in segments:
+            if isinstance(segment, Silence):
+                empty = self.frame_slice(0, 0)
+                silence = np.zeros((segment.frames,) + empty.shape[1:], dtype=empty.dtype)
+                if self.sample_format == pyaudio.paUInt8:
+                    silence += 128
+                parts.append(silence)
+            else:
+                parts.append(self.frame_slice(*segment))
+        if not parts:
+            return self.frame_slice(0, 0)
+        return np.concatenate(parts)
+
+    def timeline_float_slice(self, first, last):
+        """
+        Timeline frames [first, last) converted to float32 (silence included)
+
+        Returns:
+            A float32 array of shape (frames, channels)
+        """
+        return to_float32(self.timeline_slice(first, last), self.sample_format, self.channels)
+
+    def iter_chunks(self, chunk_frames):
+        """
+        Iterate over the recording in views of at most `chunk_frames` frames
+
+        Yields:
+            np.memmap views (see :py:meth:`slice`)
+        """
+        for first in range(0, self.frames, chunk_frames):
+            yield self.frame_slice(first, min(first + chunk_frames, self.frames))
+
+    def export_wav(self, filename, chunk_frames=1 << 16):
+        """
+        Write the whole recording to a WAV file, expanding the silence markers
+
+        Args:
+            filename: Target WAV file
+
+        Returns:
+            The filename written
+        """
+        with wave.open(filename, "wb") as wf:
+            wf.setnchannels(self.channels)
+            wf.setsampwidth(self.sample_width)
+            wf.setframerate(self.rate)
+            for segment in self._timeline_segments(0, self.timeline_frames):
+                if isinstance(segment, Silence):
+                    for block in silence_bytes(segment.frames, self.frame_size,
+                                               self.sample_format):
+                        wf.writeframes(block)
+                    continue
+                for first in range(segment[0], segment[1], chunk_frames):
+                    wf.writeframes(self.frame_slice(
+                        first, min(first + chunk_frames, segment[1])).tobytes())
+        return filename
@@ -0,0 +1,133 @@
+"""
+Lightweight energy-based voice activity detection.
+
+Works on 10 ms frames of mono float samples with an adaptive noise floor:
+a frame is speech when its energy is a margin above the tracked floor and
+above an absolute threshold. Used to place window cuts in pauses instead of
+in the middle of words.
+"""
+
+import numpy as np
+
+
+FRAME_SECONDS = 0.01
+
+
+def frame_energy_db(samples, frame_size):
+    """
+    Energy (dBFS) of consecutive `frame_size` blocks of a 1-D signal
+
+    Returns:
+        A float32 array with one value per whole frame
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    frames = samples[:len(samples) // frame_size * frame_size].reshape(-1, frame_size)
+    power = np.einsum("ij,ij->i", frames, frames) / frame_size
+    return (10 * np.log10(power + 1e-12)).astype(np.float32)
+
+
+def speech_band_db(samples, rate, low=300.0, high=3400.0, decimate=4):
+    """
+    Energy (dBFS) of a 1-D signal within the speech band
+
+    A cheap probe for long blocks: the signal is box-filtered and decimated
+    before a single FFT, so the cost stays small even at 48 kHz.
+
+    Args:
+        samples: Mono float samples in [-1, 1)
+        rate: Sample rate in Hz
+        low: Lower band edge in Hz
+        high: Upper band edge in Hz (kept below the decimated Nyquist rate)
+        decimate: Decimation factor applied before the FFT
+
+    Returns:
+        The band energy in dBFS (a float)
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    decimate = max(1, min(decimate, int(rate // (2 * high))))
+    samples = samples[:len(samples) // decimate * decimate].reshape(-1, decimate).mean(axis=1)
+    if not len(samples):
+        return -120.0
+    spectrum = np.fft.rfft(samples)
+    freqs = np.fft.rfftfreq(len(samples), decimate / rate)
+    band = spectrum[(freqs >= low) & (freqs <= high)]
+    # Parseval: mean power of the band-limited signal
+    power = 2 * np.vdot(band, band).real / len(samples) ** 2
+    return float(10 * np.log10(power + 1e-12))
+
+
+class EnergyVad:
+    """Energy VAD with a noise floor that falls fast and rises slowly"""
+
+    def __init__(self, rate, threshold_db=-50.0, margin_db=10.0, floor_rise_db=0.05):
+        """
+        Args:
+            rate: Sample rate in Hz
+            threshold_db: Frames below this level are never speech
+            margin_db: Required level above the noise floor for speech
+            floor_rise_db: Per-frame rise of the noise floor estimate
+        """
+        self.rate = int(rate)
+        self.frame_size = max(1, int(self.rate * FRAME_SECONDS))
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.floor_rise_db = floor_rise_db
+        self.noise_floor_db = None
+
+    def speech_mask(self, samples, update=True):
+        """
+        Classify the 10 ms frames of `samples`
+
+        Args:
+            samples: Mono float samples
+            update: Carry the noise floor forward past `samples`; False for
+                samples that were already seen
+
+        Returns:
+            A boolean array with one entry per whole frame
+        """
+        energy = frame_energy_db(samples, self.frame_size)
+        if not len(energy):
+            return np.zeros(0, dtype=bool)
+
+        # floor[i] = min(level[i], floor[i - 1] + rise), unrolled:
+        # i * rise + min(initial + rise, min over j <= i of level[j] - j * rise)
+        initial = energy[0] if self.noise_floor_db is None else self.noise_floor_db
+        ramp = np.arange(len(energy)) * self.floor_rise_db
+        floor = np.minimum(np.minimum.accumulate(energy - ramp),
+                           initial + self.floor_rise_db) + ramp
+        if update:
+            self.noise_floor_db = float(floor[-1])
+
+        return (energy > floor + self.margin_db) & (energy > self.threshold_db)
+
+    def is_speech(self, samples, min_ratio=0.05, new=None):
+        """
+        True if at least `min_ratio` of the frames of `samples` are speech
+
+        Args:
+            samples: Mono float samples
+            min_ratio: Share of speech frames required
+            new: Number of trailing samples not classified before (None for
+                all); only they update the noise floor, so overlapping
+                windows do not count the same audio twice
+        """
+        seen = 0 if new is None else max(0, len(samples) - new)
+        seen -= seen % self.frame_size
+        mask = np.concatenate((self.speech_mask(samples[:seen], update=False),
+                               self.speech_mask(samples[seen:])))
+        return bool(len(mask)) and mask.mean() >= min_ratio
+
+    def quietest_point(self, samples):
+        """
+        Sample offset of the middle of the quietest frame of `samples`
+
+        Returns:
+            An offset into `samples` (len(samples) if it holds no whole frame)
+        """
+        energy = frame_energy_db(samples, self.frame_size)
+        if not len(energy):
+            return len(samples)
+        # prefer the latest of equally quiet frames so windows stay long
+        index = len(energy) - 1 - int(np.argmin(energy[::-1]))
+        return index * self.frame_size + self.frame_size // 2
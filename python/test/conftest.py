@@ -0,0 +1,12 @@
+"""
+pytest configuration: the application modules live in ../src.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# interactive harness, not a test module
+collect_ignore = ["test_recorder.py"]
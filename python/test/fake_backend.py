@@ -0,0 +1,216 @@
+"""
+Fake PyAudio backend for exercising device switching without audio hardware.
+
+`FakePyAudio` implements the parts of the PyAudio API used by AudioRecorder.
+Its streams call the callback from a thread with a sine tone at the device
+rate. `set_default()` and `unplug()` simulate a default-device change and a
+removed device, `set_silent()` a loopback device that delivers nothing
+while no audio plays.
+
+Like PortAudio, the device list (and the default device it reports) only
+changes on `update_device_list()`, which fails while a stream is open;
+`get_default_wasapi_endpoint_id()` reports the current default at once.
+
+Usage:
+    recorder = AudioRecorder(backend=FakePyAudio())
+"""
+
+import threading
+import time
+
+import numpy as np
+import pyaudiowpatch as pyaudio
+
+
+def loopback_device(index, name, rate, channels):
+    """Device info dict of a fake loopback device"""
+    return {
+        "index": index,
+        "name": f"{name} [Loopback]",
+        "hostApi": 0,
+        "maxInputChannels": channels,
+        "maxOutputChannels": 0,
+        "defaultSampleRate": float(rate),
+        "defaultLowInputLatency": 0.003,
+        "defaultHighInputLatency": 0.01,
+        "isLoopbackDevice": True,
+        "endpointId": f"{{0.0.0.00000000}}.{{fake-{index}}}",
+    }
+
+
+class FakeStream:
+    """Callback stream producing a 440 Hz tone in paInt16"""
+
+    def __init__(self, backend, device, channels, rate, frames_per_buffer, callback):
+        self.backend = backend
+        self.device = device
+        self.channels = channels
+        self.rate = rate
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = callback
+        self._phase = 0
+        self._active = False
+        self._closed = False
+        self._thread = None
+        self._start = time.monotonic()
+        self.start_stream()
+
+    def get_time(self):
+        return time.monotonic() - self._start
+
+    def _chunk(self):
+        t = (self._phase + np.arange(self.frames_per_buffer)) / self.rate
+        self._phase += self.frames_per_buffer
+        tone = (np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16)
+        return np.repeat(tone[:, None], self.channels, axis=1).tobytes()
+
+    def _run(self):
+        period = self.frames_per_buffer / self.rate
+        while self._active:
+            if self.device["name"] not in self.backend.present:
+                self._active = False  # the device was removed: the stream dies
+                return
+            if self.device["name"] in self.backend.silent:
+                self._phase += self.frames_per_buffer
+                time.sleep(period)
+                continue
+            now = self.get_time()
+            time_info = {"input_buffer_adc_time": now - period, "current_time": now,
+                         "output_buffer_dac_time": 0.0}
+            self.callback(self._chunk(), self.frames_per_buffer, time_info, 0)
+            time.sleep(period)
+
+    def get_input_latency(self):
+        return self.frames_per_buffer / self.rate
+
+    def start_stream(self):
+        if self._closed:
+            raise IOError("Stream closed", pyaudio.paBadStreamPtr)
+        if self._active:
+            return
+        self._active = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop_stream(self):
+        self._active = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def close(self):
+        self.stop_stream()
+        self._closed = True
+
+    def is_active(self):
+        return self._active
+
+    def is_stopped(self):
+        return self._thread is None
+
+
+class FakePyAudio:
+    """Stand-in for pyaudio.PyAudio with simulated loopback devices"""
+
+    def __init__(self, devices=(("Speakers", 48000, 2), ("Headphones", 44100, 2))):
+        """
+        Args:
+            devices: (name, rate, channels) of the loopback devices; the first
+                one is the default
+        """
+        self.devices = [loopback_device(i, *d) for i, d in enumerate(devices)]
+        self.present = {d["name"] for d in self.devices}
+        self.default = self.devices[0]["name"]
+        self.listed_default = self.default
+        self.silent = set()
+        self.streams = []
+        self.opened = 0
+
+    def _find(self, name):
+        for device in self.devices:
+            if device["name"].startswith(name):
+                return device
+        raise ValueError(f"No fake device named {name}")
+
+    def set_default(self, name):
+        """Make another device the default (as when headphones are plugged in)"""
+        self.default = self._find(name)["name"]
+
+    def set_silent(self, name, silent=True):
+        """Stop (or resume) delivering packets, like an idle loopback device"""
+        device = self._find(name)["name"]
+        if silent:
+            self.silent.add(device)
+        else:
+            self.silent.discard(device)
+
+    def unplug(self, name, new_default=None):
+        """Remove a device; its streams stop delivering audio"""
+        self.present.discard(self._find(name)["name"])
+        if new_default is not None:
+            self.set_default(new_default)
+
+    def get_host_api_info_by_type(self, host_api_type):
+        return {"index": 0, "name": "Windows WASAPI", "defaultOutputDevice": 0}
+
+    def get_host_api_info_by_index(self, host_api_index):
+        return {"index": 0, "type": pyaudio.paWASAPI, "name": "Windows WASAPI"}
+
+    def is_format_supported(self, rate, input_device=None, input_channels=None,
+                            input_format=None, **kwargs):
+        """Devices accept their default rate, 44.1/48 kHz, up to their channel count"""
+        device = self.get_device_info_by_index(input_device)
+        if rate not in (int(device["defaultSampleRate"]), 44100, 48000) \
+                or not 1 <= input_channels <= device["maxInputChannels"] \
+                or input_format not in (pyaudio.paInt16, pyaudio.paFloat32):
+            raise ValueError("Invalid sample rate", pyaudio.paInvalidSampleRate)
+        return True
+
+    def get_default_wasapi_loopback(self):
+        if self.listed_default not in self.present:
+            raise LookupError("No default loopback device")
+        return dict(self._find(self.listed_default))
+
+    def get_default_wasapi_endpoint_id(self, *, d_out=False, d_in=False):
+        if self.default not in self.present:
+            return None
+        return self._find(self.default)["endpointId"]
+
+    def get_wasapi_loopback_analogue_by_dict(self, info_dict):
+        # fake devices are loopback devices already
+        if not info_dict["isLoopbackDevice"]:
+            raise LookupError("No analogue is found for passed device")
+        return info_dict
+
+    def get_device_info_by_index(self, index):
+        device = self.devices[index]
+        if device["name"] not in self.present:
+            raise IOError("Invalid device index", pyaudio.paInvalidDevice)
+        return dict(device)
+
+    def get_loopback_device_info_generator(self):
+        for device in self.devices:
+            if device["name"] in self.present:
+                yield dict(device)
+
+    def update_device_list(self):
+        if any(not stream._closed for stream in self.streams):
+            raise IOError("Cannot reinitialize PortAudio with open streams",
+                          pyaudio.paInternalError)
+        self.listed_default = self.default
+        return False
+
+    def open(self, format, channels, rate, frames_per_buffer, input=False,
+             input_device_index=None, stream_callback=None, **kwargs):
+        device = self.get_device_info_by_index(input_device_index)
+        stream = FakeStream(self, device, channels, rate, frames_per_buffer, stream_callback)
+        self.streams = [s for s in self.streams if not s._closed] + [stream]
+        self.opened += 1
+        return stream
+
+    def print_detailed_system_info(self):
+        for device in self.get_loopback_device_info_generator():
+            print(f"{device['index']}: {device['name']}")
+
+    def terminate(self):
+        pass
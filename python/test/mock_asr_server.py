@@ -0,0 +1,111 @@
+"""
+Local stand-in for a transcription service, for testing the streaming ASR feeder.
+
+Accepts POSTed 16 kHz mono WAV windows on any path, waits a configurable
+processing delay and answers ``{"text": ..., "duration": ...}``. HTTP/1.1
+keep-alive is supported, and the number of distinct connections and the
+highest number of concurrent requests are reported so connection reuse and
+backpressure can be checked.
+
+Usage:
+    python mock_asr_server.py [--port 8765] [--delay 0.2]
+"""
+
+import argparse
+import io
+import json
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockAsrHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            with wave.open(io.BytesIO(body), "rb") as wf:
+                duration = wf.getnframes() / wf.getframerate()
+        except (wave.Error, EOFError):
+            self.send_error(400, "Expected a WAV file")
+            return
+
+        with self.server.lock:
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.active -= 1
+            self.server.requests += 1
+            count = self.server.requests
+
+        payload = json.dumps({"text": f"window {count} ({duration:.2f}s)",
+                              "duration": duration}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        # hang up without announcing it, like a server's idle timeout
+        if self.server.drop_connections:
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def start_mock_server(port=0, delay=0.2, verbose=False, drop_connections=False):
+    """
+    Start the mock server on a background thread
+
+    Args:
+        port: Port to listen on (0 picks a free port)
+        delay: Simulated processing time per request in seconds
+        drop_connections: Close each connection after one response although
+            it was kept alive
+
+    Returns:
+        (server, url): call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockAsrHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.verbose = verbose
+    server.drop_connections = drop_connections
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = 0
+    server.active = 0
+    server.max_active = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/transcribe"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock transcription server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server, url = start_mock_server(args.port, args.delay, verbose=True)
+    print(f"Mock ASR server listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(f"Served {server.requests} requests over {server.connections} connections")
+
+
+if __name__ == "__main__":
+    main()
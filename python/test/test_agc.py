@@ -0,0 +1,73 @@
+"""
+Tests for agc.py
+"""
+
+import numpy as np
+import pytest
+
+from agc import AutomaticGainControl, GainCurve, gain_path
+
+RATE = 16000
+
+
+def quiet_then_burst():
+    """A -43 dBFS tone the AGC raises, a full-scale square burst at 3 s and a loud start"""
+    t = np.arange(6 * RATE) / RATE
+    samples = 0.01 * np.sin(2 * np.pi * 220 * t)
+    burst = slice(3 * RATE, 3 * RATE + RATE // 2)
+    samples[burst] = 0.9 * np.sign(np.sin(2 * np.pi * 220 * t[burst]))
+    samples[:100] = 0.99
+    return samples.astype(np.float32)
+
+
+def run(agc, samples, chunk):
+    return np.concatenate([agc.process(samples[first:first + chunk])
+                           for first in range(0, len(samples), chunk)]
+                          + [agc.flush()])[:, 0]
+
+
+@pytest.mark.parametrize("chunk", [37, 160, 1000, 6 * RATE])
+def test_ceiling_is_never_exceeded(chunk):
+    samples = quiet_then_burst()
+    agc = AutomaticGainControl(RATE)
+    output = run(agc, samples, chunk)
+
+    assert len(output) == len(samples)
+    assert np.abs(output).max() <= agc.ceiling + 1e-6
+    # the quiet tone was raised before the burst arrived
+    assert np.abs(output[2 * RATE:3 * RATE - 2 * agc.block]).max() > 0.05
+    # and the same output comes out however the input is chunked
+    assert np.array_equal(output, run(AutomaticGainControl(RATE), samples, 160))
+
+
+def test_ceiling_after_silence():
+    agc = AutomaticGainControl(RATE)
+    quiet = np.full(RATE, 0.01, dtype=np.float32)
+    loud = np.full(RATE // 10, 0.9, dtype=np.float32)
+
+    output = [agc.process(quiet), agc.add_silence(RATE)]
+    assert agc.gain_db > 6
+    output += [agc.process(loud), agc.flush()]
+    assert np.abs(np.concatenate(output)).max() <= agc.ceiling + 1e-6
+
+
+def test_gain_curve_round_trip(tmp_path):
+    samples = quiet_then_burst()
+    agc = AutomaticGainControl(RATE)
+    output = run(agc, samples, 1000)
+
+    path = agc.curve.save(gain_path(str(tmp_path / "recording.wav")))
+    assert path.endswith("recording.gain.npz")
+    curve = GainCurve.load(path)
+
+    assert curve.rate == RATE
+    for expected, loaded in zip(agc.curve.knots(), curve.knots()):
+        assert np.array_equal(expected, loaded)
+    gains = curve.values(0, len(samples))
+    assert np.array_equal(gains, agc.curve.values(0, len(samples)))
+    # the stored knots reproduce the applied gain
+    assert np.abs(output - samples * gains).max() < 2e-3
+
+
+def test_empty_curve_is_unity():
+    assert np.array_equal(GainCurve(RATE).values(10, 20), np.ones(10, dtype=np.float32))
@@ -0,0 +1,154 @@
+"""
+Tests for asr_stream.py, run against the mock transcription server
+"""
+
+import time
+
+import numpy as np
+import pyaudiowpatch as pyaudio
+import pytest
+
+from asr_stream import HttpTranscriptionBackend, StreamingTranscriber
+from mock_asr_server import start_mock_server
+from vad import EnergyVad, frame_energy_db
+
+RATE = 16000
+
+
+def speech(seconds):
+    """200 ms tone bursts with 100 ms pauses, as 16-bit mono PCM"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    gate = (t % 0.3) < 0.2
+    rng = np.random.default_rng(0)
+    samples = 0.3 * np.sin(2 * np.pi * 220 * t) * gate + 1e-4 * rng.standard_normal(len(t))
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+def silence(seconds):
+    rng = np.random.default_rng(1)
+    return (1e-4 * 32767 * rng.standard_normal(int(seconds * RATE))).astype("<i2").tobytes()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def feed(transcriber, pcm, chunk=0.1):
+    step = int(chunk * RATE) * 2
+    for offset in range(0, len(pcm), step):
+        transcriber.feed(pcm[offset:offset + step])
+
+
+@pytest.fixture
+def server(request):
+    options = getattr(request, "param", {})
+    server, url = start_mock_server(**options)
+    server.url = url
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_transcriber(server, **kwargs):
+    options = dict(window_seconds=2.0, overlap_seconds=0.5, align_seconds=0.5,
+                   ring_seconds=30.0, max_in_flight=1)
+    options.update(kwargs)
+    transcriber = StreamingTranscriber(HttpTranscriptionBackend(server.url), **options)
+    transcriber.start(RATE, 1, pyaudio.paInt16)
+    return transcriber
+
+
+@pytest.mark.parametrize("server", [{"delay": 0.3}], indirect=True)
+def test_ring_overflow_under_backpressure(server):
+    transcriber = make_transcriber(server, ring_seconds=3.0)
+    feed(transcriber, speech(20.0))
+    transcriber.stop()
+
+    stats = transcriber.stats()
+    assert stats["dropped_frames"] > 0
+    assert server.max_active == 1
+    assert stats["errors"] == 0
+    assert stats["windows"] == server.requests
+
+
+@pytest.mark.parametrize("server", [{"delay": 0.01}], indirect=True)
+def test_connection_kept_alive_during_silence(server):
+    transcriber = make_transcriber(server)
+    feed(transcriber, speech(3.0))
+    assert wait_for(lambda: transcriber.transcripts)
+    feed(transcriber, silence(6.0))
+    time.sleep(0.5)
+    feed(transcriber, speech(3.0))
+    transcriber.stop()
+
+    assert transcriber.skipped_windows > 0
+    assert transcriber.errors == 0
+    assert server.requests >= 2
+    assert server.connections == 1
+
+
+@pytest.mark.parametrize("server", [{"delay": 0.01, "drop_connections": True}],
+                         indirect=True)
+def test_reconnects_and_resends_after_hang_up(server):
+    transcriber = make_transcriber(server)
+    feed(transcriber, speech(8.0))
+    transcriber.stop()
+
+    assert transcriber.errors == 0
+    assert len(transcriber.transcripts) == server.requests > 1
+    assert server.connections == server.requests
+
+
+@pytest.mark.parametrize("server", [{"delay": 0.2}], indirect=True)
+def test_stop_drains_outstanding_windows(server):
+    transcriber = make_transcriber(server, max_in_flight=2)
+    feed(transcriber, speech(10.0))
+
+    started = time.monotonic()
+    transcriber.stop()
+    elapsed = time.monotonic() - started
+
+    # every window was answered before stop() returned, up to the tail
+    assert len(transcriber.transcripts) == server.requests
+    assert max(t.end for t in transcriber.transcripts) == pytest.approx(10.0)
+    assert server.max_active == 2
+    windows = len(transcriber.transcripts)
+    assert 0.2 <= elapsed < windows * 0.2 + 1.0
+
+
+def test_vad_matches_recurrence():
+    rng = np.random.default_rng(2)
+    levels = np.repeat(rng.uniform(0.0, 0.3, 300), 160)
+    samples = (levels * rng.standard_normal(len(levels))).astype(np.float32)
+    vad = EnergyVad(RATE)
+    reference = EnergyVad(RATE)
+
+    for chunk in np.split(samples, 10):
+        mask = vad.speech_mask(chunk)
+        energy = frame_energy_db(chunk, reference.frame_size)
+        floor = []
+        current = energy[0] if reference.noise_floor_db is None else reference.noise_floor_db
+        for level in energy:
+            current = min(level, current + reference.floor_rise_db)
+            floor.append(current)
+        reference.noise_floor_db = current
+        expected = (energy > np.array(floor) + reference.margin_db) & \
+            (energy > reference.threshold_db)
+        assert np.array_equal(mask, expected)
+        assert vad.noise_floor_db == pytest.approx(reference.noise_floor_db, abs=1e-3)
+
+
+def test_overlap_does_not_update_noise_floor():
+    rng = np.random.default_rng(3)
+    samples = (0.01 * rng.standard_normal(RATE)).astype(np.float32)
+    vad = EnergyVad(RATE)
+    vad.is_speech(samples)
+    floor = vad.noise_floor_db
+
+    vad.is_speech(samples, new=0)
+    assert vad.noise_floor_db == floor
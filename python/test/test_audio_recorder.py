@@ -0,0 +1,273 @@
+"""
+Tests for audio_recorder.py, run against the fake backend
+"""
+
+import json
+import os
+import threading
+import time
+import wave
+
+import pytest
+
+import channels
+from audio_recorder import AudioRecorder, AudioRecorderException
+from fake_backend import FakePyAudio, FakeStream
+from loudness import LoudnessMeter
+from realtime_hygiene import RealtimeHygiene
+from recording_journal import RecordingJournal, recover
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def backend():
+    return FakePyAudio()
+
+
+@pytest.fixture
+def recorder(backend, tmp_path):
+    recorder = AudioRecorder(recording_dir=str(tmp_path), backend=backend)
+    yield recorder
+    recorder.close()
+
+
+def test_callback_only_publishes(recorder, monkeypatch):
+    threads = set()
+    add_samples = LoudnessMeter.add_samples
+
+    def record_thread(self, samples):
+        threads.add(threading.current_thread().name)
+        add_samples(self, samples)
+
+    monkeypatch.setattr(LoudnessMeter, "add_samples", record_thread)
+    recorder.start_recording()
+    assert wait_for(lambda: recorder.recorded_frames > 20000)
+    recorder.stop_recording()
+    assert threads == {"RecorderPipeline"}
+
+
+def test_silence_is_filled_on_the_timeline(recorder, backend):
+    recorder.start_recording()
+    assert wait_for(lambda: recorder.recorded_frames > 10000)
+    backend.set_silent("Speakers")
+    time.sleep(0.3)
+    backend.set_silent("Speakers", False)
+    assert wait_for(lambda: recorder.gaps and recorder.recorded_frames
+                    > recorder.gaps[0]["frame"] + recorder.gaps[0]["frames"] + 10000)
+    recorder.stop_recording()
+
+    store = recorder.store
+    assert store.timeline_frames == recorder.recorded_frames
+    assert store.silent_frames == sum(gap["frames"] for gap in recorder.gaps)
+    assert recorder.stats()["lost_frames"] == 0
+    assert recorder.loudness.frames == recorder.recorded_frames
+
+
+@pytest.mark.parametrize("policy", [channels.DROP_NEWEST, channels.DROP_OLDEST])
+def test_full_queue_is_recorded_as_lost(backend, tmp_path, policy):
+    recorder = AudioRecorder(backend=backend, queue_limit_bytes=64 * 1024, queue_policy=policy)
+    try:
+        recorder.start_recording()
+        assert wait_for(lambda: recorder.recorded_frames > 48000)
+        recorder.stop_recording()
+        filename = recorder.save_recording(str(tmp_path / "a.wav"))
+    finally:
+        recorder.close()
+
+    with wave.open(filename, "rb") as wf:
+        assert wf.getnframes() == recorder.recorded_frames
+        first = wf.readframes(1024)
+    with open(str(tmp_path / "a.json"), encoding="utf-8") as f:
+        lost = json.load(f)["lost"]
+    assert lost and all(entry["cause"] == "queue" for entry in lost)
+    assert recorder.stats()["lost_frames"] == sum(entry["frames"] for entry in lost)
+    if policy == channels.DROP_OLDEST:
+        # the discarded chunks are the start of the recording
+        assert lost[0]["frame"] == 0
+        assert first == bytes(len(first))
+
+
+def test_queue_is_unbounded_by_default(backend):
+    recorder = AudioRecorder(backend=backend)
+    try:
+        assert recorder.output_queue.max_bytes is None
+        recorder.start_recording()
+        assert wait_for(lambda: recorder.recorded_frames > 48000)
+        recorder.stop_recording()
+    finally:
+        recorder.close()
+    assert recorder.stats()["lost_frames"] == 0
+
+
+def test_gap_after_preroll_is_detected(recorder, backend):
+    recorder.enter_standby()
+    assert wait_for(lambda: recorder.preroll.frames > 10000)
+    backend.set_silent("Speakers")
+    time.sleep(0.1)
+    recorder.start_recording()
+    preroll_frames = recorder.recorded_frames
+    time.sleep(0.3)
+    backend.set_silent("Speakers", False)
+    assert wait_for(lambda: recorder.gaps)
+    recorder.stop_recording()
+
+    assert recorder.gaps[0]["frame"] == preroll_frames
+    assert recorder.gaps[0]["frames"] > 0.3 * recorder.rate
+
+
+def test_lost_stream_switches_device(recorder, backend):
+    recorder.start_recording()
+    assert wait_for(lambda: recorder.recorded_frames > 10000)
+    backend.unplug("Speakers", new_default="Headphones")
+    assert wait_for(lambda: not recorder.stream.is_active())
+
+    assert recorder.check_device()
+    assert recorder.current_device["name"] == "Headphones [Loopback]"
+    assert wait_for(lambda: recorder.discontinuities)
+    recorder.stop_recording()
+    assert recorder.discontinuities[0]["reason"] == "capture stream lost"
+
+
+def test_stalled_stream_is_reopened(recorder, backend):
+    recorder.STALL_SECONDS = 0.2
+    recorder.start_recording()
+    assert wait_for(lambda: recorder.recorded_frames > 10000)
+    backend.set_silent("Speakers")
+    time.sleep(0.3)
+    stream = recorder.stream
+
+    assert recorder.check_device()
+    assert recorder.stream is not stream
+    backend.set_silent("Speakers", False)
+    recorder.stop_recording()
+
+
+def test_default_change_switches_device(recorder, backend):
+    recorder.start_recording()
+    assert wait_for(lambda: recorder.recorded_frames > 10000)
+    assert not recorder.check_device()
+
+    backend.set_default("Headphones")
+    assert recorder.check_device()
+    assert recorder.current_device["name"] == "Headphones [Loopback]"
+    assert wait_for(lambda: recorder.discontinuities)
+    recorder.stop_recording()
+    assert recorder.discontinuities[0]["reason"] == "default device changed"
+
+
+@pytest.mark.parametrize("standby", [False, True])
+def test_hygiene_is_entered_before_capture(backend, tmp_path, monkeypatch, standby):
+    recorder = AudioRecorder(recording_dir=str(tmp_path), backend=backend, realtime=True)
+    entered = []
+    enter = RealtimeHygiene.enter
+
+    def record_state(self):
+        entered.append((recorder.stream, recorder.standby, recorder.recording))
+        enter(self)
+
+    monkeypatch.setattr(RealtimeHygiene, "enter", record_state)
+    try:
+        if standby:
+            recorder.enter_standby()
+            assert wait_for(lambda: recorder.preroll.frames > 0)
+        recorder.start_recording()
+        assert recorder.hygiene.active
+        recorder.stop_recording()
+        assert not recorder.hygiene.active
+    finally:
+        recorder.close()
+
+    stream, on_standby, recording = entered[0]
+    # the callback is not live yet, or still only fills the pre-roll
+    assert (stream is not None) == on_standby == standby
+    assert not recording
+
+
+def test_native_callback_stats_replace_the_estimate(recorder, monkeypatch):
+    gil_wait = {"count": 10, "mean": 0.001, "max": 0.004, "buckets": ()}
+    monkeypatch.setattr(FakeStream, "enable_callback_stats",
+                        lambda self, enabled=True: None, raising=False)
+    monkeypatch.setattr(FakeStream, "get_callback_stats",
+                        lambda self, reset=False: {"enabled": True, "gil_wait": gil_wait},
+                        raising=False)
+    recorder.start_recording()
+    assert wait_for(lambda: recorder.callbacks > 5)
+    recorder.stop_recording()
+
+    stats = recorder.stats()
+    assert stats["gil_wait_max_ms"] == pytest.approx(4.0)
+    assert stats["gil_wait_mean_ms"] == pytest.approx(1.0)
+
+
+def test_journal_recovers_the_timeline(backend, tmp_path):
+    recorder = AudioRecorder(recording_dir=str(tmp_path), journal_dir=str(tmp_path),
+                             backend=backend)
+    try:
+        recorder.start_recording()
+        assert wait_for(lambda: recorder.recorded_frames > 10000)
+        backend.set_silent("Speakers")
+        time.sleep(0.3)
+        backend.set_silent("Speakers", False)
+        assert wait_for(lambda: recorder.gaps and recorder.recorded_frames
+                        > recorder.gaps[0]["frame"] + recorder.gaps[0]["frames"])
+        recorder.stop_recording()
+    finally:
+        recorder.close()
+
+    stats = recover(recorder.journal_path, str(tmp_path / "recovered.wav"))
+    assert stats["silent_frames"] == sum(gap["frames"] for gap in recorder.gaps)
+    assert stats["frames"] == recorder.recorded_frames
+
+
+def test_journal_error_does_not_skip_cleanup(backend, tmp_path, monkeypatch, capsys):
+    close = RecordingJournal.close
+
+    def failing_close(self):
+        close(self)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(RecordingJournal, "close", failing_close)
+    recorder = AudioRecorder(recording_dir=str(tmp_path), journal_dir=str(tmp_path),
+                             backend=backend, agc=True)
+    try:
+        recorder.start_recording()
+        assert wait_for(lambda: recorder.recorded_frames > 10000)
+        recorder.stop_recording()
+        store_path = recorder.store.path
+    finally:
+        recorder.close()
+
+    out = capsys.readouterr().out
+    assert "disk full" in out and "Recording stopped" in out
+    assert recorder.journal is None
+    # the gain curve is saved after the journal is closed
+    assert os.path.exists(os.path.splitext(store_path)[0] + ".gain.npz")
+
+
+def test_failed_start_removes_its_outputs(backend, tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError("device busy")
+
+    monkeypatch.setattr(backend, "open", fail)
+    recorder = AudioRecorder(recording_dir=str(tmp_path / "store"),
+                             journal_dir=str(tmp_path / "journal"), backend=backend,
+                             realtime=True)
+    try:
+        with pytest.raises(AudioRecorderException):
+            recorder.start_recording()
+        assert not recorder.recording
+        assert recorder.store is None and recorder.journal is None
+        assert recorder._pipeline is None
+        assert not recorder.hygiene.active
+    finally:
+        recorder.close()
+    assert os.listdir(str(tmp_path / "store")) == []
+    assert os.listdir(str(tmp_path / "journal")) == []
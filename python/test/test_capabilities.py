@@ -0,0 +1,46 @@
+"""
+Tests for capabilities.py, run against the fake backend
+"""
+
+import pyaudiowpatch as pyaudio
+
+from audio_recorder import AudioRecorder
+from capabilities import CapabilityProber, device_key
+from fake_backend import FakePyAudio
+
+
+def test_choose_picks_the_cheapest_format():
+    backend = FakePyAudio()
+    prober = CapabilityProber(backend)
+    speakers = backend.get_device_info_by_index(0)
+
+    assert prober.choose(speakers) == (44100, 1, pyaudio.paInt16)
+    assert prober.choose(speakers, 16000, 2) == (44100, 2, pyaudio.paInt16)
+    assert prober.choose(speakers, 48000, 2) == (48000, 2, pyaudio.paInt16)
+    assert prober.choose(speakers, 96000) is None
+
+
+def test_cache_is_keyed_by_endpoint(tmp_path):
+    backend = FakePyAudio((("Speakers", 48000, 2), ("Speakers", 48000, 2)))
+    first, second = backend.devices
+    assert device_key(first) != device_key(second)
+
+    cache_path = str(tmp_path / "capabilities.json")
+    CapabilityProber(backend, cache_path).probe(first)
+    cached = CapabilityProber(backend, cache_path)
+    calls = []
+    backend.is_format_supported = lambda *args, **kwargs: calls.append(args) or True
+    cached.probe(first)
+    assert not calls
+    cached.probe(second)
+    assert calls
+
+
+def test_recorder_uses_the_cheapest_rate(tmp_path):
+    backend = FakePyAudio()
+    recorder = AudioRecorder(recording_dir=str(tmp_path), backend=backend,
+                             prober=CapabilityProber(backend))
+    try:
+        assert recorder._choose_format(backend.get_device_info_by_index(0)) == (44100, 2)
+    finally:
+        recorder.close()
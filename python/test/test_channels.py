@@ -0,0 +1,56 @@
+"""
+Tests for channels.py
+"""
+
+import numpy as np
+import pyaudiowpatch as pyaudio
+
+import channels
+
+
+def frames(count, channels_=2):
+    return (np.arange(count * channels_, dtype=np.int16) * 7).tobytes()
+
+
+def test_downsampler_keeps_odd_tail():
+    downsample = channels.make_downsampler(pyaudio.paInt16, 2)
+    data = frames(1025)
+    item = downsample(data)
+    assert len(item.data) == 512 * 4
+    assert item.tail == data[-4:]
+    restored = channels.restore_rate(item, pyaudio.paInt16, 2)
+    assert len(restored) == len(data)
+    assert restored[-4:] == data[-4:]
+
+
+def test_degrade_runs_outside_the_lock():
+    downsample = channels.make_downsampler(pyaudio.paInt16, 2)
+    held = []
+
+    def degrade(data):
+        held.append(channel._lock.locked())
+        return downsample(data)
+
+    channel = channels.BoundedChannel("test", max_bytes=8192, policy=channels.DOWNSAMPLE,
+                                      degrade=degrade)
+    for _ in range(3):
+        channel.put_nowait(frames(1024))
+    assert held == [False, False]
+    assert channel.metrics()["degraded"] == 2
+
+
+def test_evictions_are_reported():
+    channel = channels.BoundedChannel("test", max_bytes=3 * 4096, policy=channels.DROP_OLDEST)
+    chunks = [frames(1024) for _ in range(5)]
+    evicted = []
+    for chunk in chunks:
+        assert channel.put_nowait(chunk, evicted)
+    assert evicted == chunks[:2]
+    assert channel.metrics()["dropped_oldest"] == 2
+
+
+def test_unbounded_channel():
+    channel = channels.BoundedChannel("test")
+    for _ in range(100):
+        assert channel.put_nowait(frames(1024))
+    assert channel.qsize() == 100
@@ -0,0 +1,57 @@
+"""
+Tests for echo_canceller.py
+"""
+
+import numpy as np
+import pytest
+
+from echo_canceller import EchoCanceller
+
+RATE = 16000
+
+
+def echo_pair(seconds=6.0, delay=640, gain=0.5, near_end=None):
+    """White-noise reference and a microphone hearing it `delay` samples later"""
+    rng = np.random.default_rng(0)
+    reference = 0.1 * rng.standard_normal(int(seconds * RATE))
+    echo = gain * np.concatenate((np.zeros(delay), reference[:-delay]))
+    mic = echo + (near_end if near_end is not None else 0.0)
+    return mic, reference, echo
+
+
+def run(canceller, mic, reference, chunk):
+    return np.concatenate([canceller.process(mic[first:first + chunk],
+                                             reference[first:first + chunk])
+                           for first in range(0, len(mic), chunk)])
+
+
+@pytest.mark.parametrize("chunk", [256, 1000])
+def test_delayed_reference_is_cancelled(chunk):
+    mic, reference, echo = echo_pair()
+    canceller = EchoCanceller(RATE)
+    output = run(canceller, mic, reference, chunk)
+
+    last = slice(len(output) - RATE, len(output))
+    residual_db = 10 * np.log10(np.mean(output[last] ** 2) / np.mean(echo[last] ** 2))
+    assert residual_db < -40
+    assert canceller.metrics()["erle_db"] > 25
+    assert len(output) + canceller.latency == len(mic)
+
+
+def test_near_end_is_kept():
+    # double talk throughout: the filter still converges, only more slowly
+    t = np.arange(8 * RATE) / RATE
+    near_end = 0.05 * np.sin(2 * np.pi * 440 * t)
+    mic, reference, echo = echo_pair(8.0, near_end=near_end)
+    output = run(EchoCanceller(RATE), mic, reference, 256)
+
+    last = slice(len(output) - RATE, len(output))
+    residual_db = 10 * np.log10(np.mean((output[last] - near_end[last]) ** 2)
+                                / np.mean(echo[last] ** 2))
+    assert residual_db < -10
+    assert np.corrcoef(output[last], near_end[last])[0, 1] > 0.9
+
+
+def test_mismatched_chunks_are_rejected():
+    with pytest.raises(ValueError):
+        EchoCanceller(RATE).process(np.zeros(256), np.zeros(255))
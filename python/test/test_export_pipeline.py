@@ -0,0 +1,50 @@
+"""
+Tests for export_pipeline.py
+"""
+
+import wave
+
+import numpy as np
+
+import export_pipeline
+from agc import GainCurve, gain_path
+from recording_store import RecordingStore
+
+
+def make_store(path, frames, rate=44100):
+    t = np.arange(frames) / rate
+    samples = (np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16)
+    with RecordingStore(path, 1, rate) as store:
+        store.write(samples.tobytes())
+        store.add_silence(rate // 10)
+    return path
+
+
+def test_asr_copy_covers_the_whole_recording(tmp_path):
+    # 44.1 kHz needs blocks of 441 frames; the length is not a multiple of it
+    path = make_store(str(tmp_path / "a.pcm"), 44100 * 3 + 123)
+    result = export_pipeline.export_recording(path, derivatives=("asr",), chunk_seconds=1,
+                                              max_workers=2)
+    with wave.open(result["outputs"]["asr"], "rb") as wf:
+        frames = wf.getnframes()
+    expected = result["frames"] * export_pipeline.ASR_RATE / 44100
+    assert abs(frames - expected) <= 2
+
+
+def test_gain_curve_is_loaded_once_per_worker(tmp_path, monkeypatch):
+    path = make_store(str(tmp_path / "a.pcm"), 44100 * 2)
+    curve = GainCurve(44100)
+    curve.add(0, 0.5)
+    curve.save(gain_path(path))
+
+    loads = []
+    load = GainCurve.load.__func__
+    monkeypatch.setattr(GainCurve, "load",
+                        classmethod(lambda cls, p: loads.append(p) or load(cls, p)))
+    monkeypatch.setattr(export_pipeline, "_worker", {})
+    for first in range(0, 44100 * 2, 44100):
+        result = export_pipeline._process_chunk(path, first, first + 44100, ("asr",))
+    assert len(loads) == 1
+    # the curve was applied
+    level = np.abs(np.frombuffer(result["asr"], dtype="<i2")).max() / 32768
+    assert abs(level - 0.5 * 8000 / 32768) < 0.01
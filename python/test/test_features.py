@@ -0,0 +1,33 @@
+"""
+Tests for features.py
+"""
+
+import numpy as np
+import pytest
+
+from features import FeatureStore, LogMelFrontend
+
+
+@pytest.mark.parametrize("silence", [100, 1199, 1200, 5000])
+def test_silence_matches_zeros(silence):
+    rng = np.random.default_rng(0)
+    before = rng.standard_normal(7000).astype(np.float32) * 0.1
+    after = rng.standard_normal(3000).astype(np.float32) * 0.1
+
+    whole = LogMelFrontend(48000).process(
+        np.concatenate((before, np.zeros(silence, dtype=np.float32), after)))
+
+    frontend = LogMelFrontend(48000)
+    parts = np.concatenate((frontend.process(before), frontend.process_silence(silence),
+                            frontend.process(after)))
+    np.testing.assert_allclose(parts, whole, rtol=1e-4, atol=1e-4)
+
+
+def test_store_slices_by_time(tmp_path):
+    frontend = LogMelFrontend(16000)
+    features = frontend.process(np.random.default_rng(1).standard_normal(16000) * 0.1)
+    with FeatureStore.for_frontend(str(tmp_path / "a.mel"), frontend) as store:
+        store.append(features)
+    store = FeatureStore.open(str(tmp_path / "a.mel"))
+    assert len(store) == len(features)
+    np.testing.assert_array_equal(store.slice(0.5, 0.6), features[50:60])
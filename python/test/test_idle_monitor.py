@@ -0,0 +1,95 @@
+"""
+Tests for idle_monitor.py, run against the fake backend
+"""
+
+import time
+
+import pytest
+
+from audio_recorder import AudioRecorder
+from fake_backend import FakePyAudio
+from idle_monitor import ARMED, IDLE, IdleMonitor
+from preroll import PrerollBuffer
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def backend():
+    return FakePyAudio()
+
+
+@pytest.fixture
+def recorder(backend, tmp_path):
+    recorder = AudioRecorder(recording_dir=str(tmp_path), backend=backend)
+    yield recorder
+    recorder.close()
+
+
+def make_monitor(recorder, **kwargs):
+    options = dict(arm_seconds=0.2, disarm_seconds=0.3, probe_seconds=0.05)
+    options.update(kwargs)
+    return IdleMonitor(recorder, **options)
+
+
+def test_preroll_read_since():
+    preroll = PrerollBuffer(1.0, 4, 1)
+    data, position = preroll.read_since(None)
+    assert (data, position) == (b"", 0)
+    preroll.write(b"abc")
+    data, position = preroll.read_since(position)
+    assert data == b"abc"
+    preroll.write(b"de")
+    preroll.write(b"fg")
+    data, position = preroll.read_since(position)
+    assert data == b"defg"
+    preroll.write(b"hijkl")  # longer than the ring: only the newest audio is kept
+    assert preroll.read_since(position)[0] == b"ijkl"
+    preroll.clear()
+    preroll.write(b"xy")
+    assert preroll.read_since(position) == (b"xy", 2)
+
+
+def test_standby_stream_is_shared(recorder, backend):
+    recorder.enter_standby()
+    monitor = make_monitor(recorder)
+    monitor.start()
+    try:
+        assert wait_for(lambda: monitor.state == ARMED)
+        assert recorder.recording
+        backend.set_silent("Speakers")
+        assert wait_for(lambda: monitor.state == IDLE and recorder.standby)
+    finally:
+        monitor.stop()
+
+    assert monitor.arm_count == 1
+    assert monitor.probe_callbacks == 0
+    assert backend.opened == 1
+    assert recorder.recorded_frames > 0
+
+
+def test_errors_are_reported_and_monitoring_resumes(recorder, capsys):
+    failures = []
+
+    def on_arm(recorder):
+        if not failures:
+            failures.append(True)
+            raise RuntimeError("on_arm failed")
+
+    monitor = make_monitor(recorder, on_arm=on_arm)
+    monitor.RETRY_SECONDS = 0.05
+    monitor.start()
+    try:
+        assert wait_for(lambda: monitor.arm_count == 2 and monitor.state == ARMED)
+    finally:
+        monitor.stop()
+
+    assert "idle monitor error: on_arm failed" in capsys.readouterr().out
+    assert not recorder.recording
@@ -0,0 +1,69 @@
+"""
+Tests for noise_suppressor.py
+"""
+
+import numpy as np
+import pytest
+
+from noise_suppressor import NoiseSuppressor
+
+RATE = 16000
+
+
+def noisy_speech(seconds=6.0):
+    """Harmonic 'voice' switched on and off every second, in white noise"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    voice = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 25))
+    gate = np.sin(2 * np.pi * 0.5 * t) > 0
+    noise = 0.02 * np.random.default_rng(0).standard_normal(len(t))
+    return (0.1 * voice * gate + noise).astype(np.float32), gate
+
+
+def run(suppressor, samples, chunk):
+    return np.concatenate([suppressor.process(samples[first:first + chunk])
+                           for first in range(0, len(samples), chunk)])
+
+
+def speech_to_noise_db(samples, gate):
+    # skip the first two seconds, while the noise profile is learned
+    settled = np.arange(len(samples)) >= 2 * RATE
+    return 10 * np.log10(np.mean(samples[gate & settled] ** 2)
+                         / np.mean(samples[~gate & settled] ** 2))
+
+
+@pytest.mark.parametrize("chunk", [160, 1024, 16000])
+def test_snr_improves(chunk):
+    samples, gate = noisy_speech()
+    suppressor = NoiseSuppressor(RATE)
+    output = run(suppressor, samples, chunk)[suppressor.latency:]
+
+    before = speech_to_noise_db(samples[:len(output)], gate[:len(output)])
+    after = speech_to_noise_db(output, gate[:len(output)])
+    assert after > before + 12
+    assert suppressor.speech_frames > 0
+
+
+@pytest.mark.parametrize("chunk", [100, 1024, 4801])
+def test_length_and_latency_are_one_hop(chunk):
+    samples, _ = noisy_speech(1.0)
+    suppressor = NoiseSuppressor(RATE)
+    assert suppressor.latency == suppressor.hop
+
+    total = 0
+    for first in range(0, len(samples), chunk):
+        total += len(suppressor.process(samples[first:first + chunk]))
+        fed = min(first + chunk, len(samples))
+        # every whole hop fed so far comes out, delayed by one hop
+        assert total == fed // suppressor.hop * suppressor.hop
+        assert suppressor.latency == suppressor.hop
+
+
+def test_unit_gain_reconstructs_the_delayed_input(monkeypatch):
+    samples, _ = noisy_speech(1.0)
+    suppressor = NoiseSuppressor(RATE)
+    monkeypatch.setattr(suppressor, "_gains", lambda power: np.ones_like(power))
+    output = run(suppressor, samples, 1024)
+
+    delay = suppressor.latency
+    np.testing.assert_allclose(output[:delay], 0, atol=1e-6)
+    np.testing.assert_allclose(output[delay:], samples[:len(output) - delay], atol=1e-6)
@@ -10,7 +10,10 @@ from queue import Queue
 
 # Add the src directory to the path so we can import the AudioRecorder class
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
-from audio_recorder import AudioRecorder, AudioRecorderException
+from audio_recorder import AudioRecorderException, prewarm_recorder
+from idle_monitor import IdleMonitor
+from recording_journal import recover
+from export_pipeline import export_recording
 
 
 def print_header():
@@ -25,10 +28,15 @@ def print_help():
     print("\nAvailable commands:")
     print("  list          - List all audio devices")
     print("  record [idx]  - Start recording (optionally from device with index idx)")
+    print("  standby [sec] - Keep the stream open with a pre-roll of sec seconds (default: 10)")
+    print("  idle [sec]    - Record automatically while audio plays, stop after sec idle seconds")
     print("  pause         - Pause current recording")
     print("  resume        - Resume paused recording")
     print("  stop          - Stop recording and save to file")
+    print("  stats         - Show loudness and length of the current recording")
     print("  auto [sec]    - Automatically record for sec seconds (default: 5)")
+    print("  recover <journal> [out] - Rebuild a WAV/FLAC file from a crash journal")
+    print("  export <store> [dir] - Export a recording store to WAV/FLAC/ASR/peaks in parallel")
     print("  exit/quit     - Exit the application")
     print("  help          - Show this help message")
 
@@ -37,6 +45,9 @@ def run_interactive_test():
     """Run an interactive test of the AudioRecorder class"""
     recorder = None
     current_recording = None
+    monitor = None
+    # PortAudio and the devices are initialized while the menu is shown
+    recorder_future = prewarm_recorder()
     
     print_header()
     print("This test application allows you to test the WASAPI loopback recording")
@@ -44,11 +55,10 @@ def run_interactive_test():
     print_help()
     
     try:
-        recorder = AudioRecorder()
-        
         while True:
             try:
-                command = input("\nEnter command: ").strip().lower().split()
+                raw_command = input("\nEnter command: ").strip()
+                command = raw_command.lower().split()
                 if not command:
                     continue
                 
@@ -59,7 +69,11 @@ def run_interactive_test():
                     print("Exiting...")
                     break
                 
-                elif cmd == "help":
+                if recorder is None and cmd not in ["help", "recover", "export"]:
+                    # a failed initialization is reported for this command only
+                    recorder = recorder_future.result()
+                
+                if cmd == "help":
                     print_help()
                 
                 elif cmd == "list":
@@ -79,6 +93,36 @@ def run_interactive_test():
                         except AudioRecorderException as e:
                             print(f"Recording error: {e}")
                 
+                elif cmd == "standby":
+                    if current_recording:
+                        print("Already recording. Stop the current recording first.")
+                    else:
+                        try:
+                            recorder.enter_standby(preroll_seconds=float(args[0]) if args else 10.0)
+                        except ValueError:
+                            print(f"Invalid pre-roll length: {args[0]}")
+                        except AudioRecorderException as e:
+                            print(f"Standby error: {e}")
+                
+                elif cmd == "idle":
+                    if current_recording:
+                        print("Already recording. Stop the current recording first.")
+                    elif monitor is not None:
+                        monitor.stop()
+                        monitor = None
+                        print("Idle monitor stopped")
+                    else:
+                        try:
+                            monitor = IdleMonitor(
+                                recorder, disarm_seconds=float(args[0]) if args else 60.0,
+                                on_disarm=lambda rec: rec.save_recording())
+                            monitor.start()
+                        except ValueError:
+                            print(f"Invalid idle time: {args[0]}")
+                        except AudioRecorderException as e:
+                            monitor = None
+                            print(f"Idle monitor error: {e}")
+                
                 elif cmd == "pause":
                     if current_recording:
                         recorder.pause_recording()
@@ -101,6 +145,14 @@ def run_interactive_test():
                     else:
                         print("Not currently recording.")
                 
+                elif cmd == "stats":
+                    stats = recorder.stats()
+                    loudness = stats["loudness"] or {}
+                    print(f"Recorded {stats['seconds']:.1f}s, {stats['gaps']} gaps, "
+                          f"{stats['discontinuities']} discontinuities")
+                    for name, value in loudness.items():
+                        print(f"  {name}: {value}")
+                
                 elif cmd == "auto":
                     if current_recording:
                         print("Already recording. Stop the current recording first.")
@@ -128,6 +180,32 @@ def run_interactive_test():
                             print(f"Recording error: {e}")
                             current_recording = None
                 
+                elif cmd == "recover":
+                    if not args:
+                        print("Usage: recover <journal> [out]")
+                    else:
+                        # keep the original case of the paths
+                        paths = raw_command.split()[1:3]
+                        stats = recover(*paths)
+                        print(f"Recovered {stats['frames']} frames "
+                              f"({stats['corrupt_records']} corrupt, "
+                              f"{stats['missing_records']} missing records) "
+                              f"to {stats['output']}")
+                
+                elif cmd == "export":
+                    if not args:
+                        print("Usage: export <store> [dir]")
+                    else:
+                        paths = raw_command.split()[1:3]
+                        result = export_recording(
+                            *paths,
+                            progress=lambda done, total, rate: print(
+                                f"Exported {done * 100 // max(total, 1)}% "
+                                f"({rate / 1e6:.1f} MB/s)", end="\r"))
+                        print()
+                        for name, path in result["outputs"].items():
+                            print(f"  {name}: {path}")
+                
                 else:
                     print(f"Unknown command: {cmd}")
                     print_help()
@@ -156,6 +234,10 @@ def run_interactive_test():
         print(f"Fatal error: {e}")
     
     finally:
+        if monitor is not None:
+            monitor.stop()
+        if recorder is None and recorder_future.done() and not recorder_future.exception():
+            recorder = recorder_future.result()
         if recorder:
             recorder.close()
         print("Test completed.")
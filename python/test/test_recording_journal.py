@@ -0,0 +1,100 @@
+"""
+Tests for recording_journal.py
+"""
+
+import wave
+
+import numpy as np
+import pyaudiowpatch as pyaudio
+import pytest
+
+from recording_journal import RecordingJournal, read_journal, recover
+
+RATE = 16000
+CHUNK = 1024
+
+
+def chunk(value):
+    """One mono paInt16 chunk filled with `value`"""
+    return np.full(CHUNK, value, dtype="<i2").tobytes()
+
+
+def read_wav(path):
+    with wave.open(path, "rb") as wf:
+        return np.frombuffer(wf.readframes(wf.getnframes()), dtype="<i2")
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = RecordingJournal(str(tmp_path / "a.journal"), channels=1, rate=RATE)
+    yield journal
+    journal.close()
+
+
+def test_silence_records_are_recovered(journal):
+    journal.append(chunk(1))
+    journal.append_silence(500)
+    journal.append(chunk(2))
+    journal.close()
+
+    stats = recover(journal.path)
+    samples = read_wav(stats["output"])
+
+    assert stats["records"] == 3
+    assert stats["silent_frames"] == 500
+    assert stats["frames"] == len(samples) == 2 * CHUNK + 500
+    assert np.all(samples[:CHUNK] == 1)
+    assert np.all(samples[CHUNK:CHUNK + 500] == 0)
+    assert np.all(samples[CHUNK + 500:] == 2)
+
+
+def test_dropped_records_keep_the_timeline(journal, monkeypatch):
+    journal.append(chunk(1))
+    with monkeypatch.context() as patch:
+        patch.setattr(journal.write_channel, "put_nowait", lambda item: False)
+        assert not journal.append(chunk(2))
+        assert not journal.append(chunk(3))
+    journal.append(chunk(4))
+    journal.close()
+
+    stats = recover(journal.path)
+    samples = read_wav(stats["output"])
+
+    assert journal.dropped == 2
+    assert stats["missing_records"] == 2
+    assert stats["missing_frames"] == 2 * CHUNK
+    assert len(samples) == 4 * CHUNK
+    assert np.all(samples[CHUNK:3 * CHUNK] == 0)
+    assert np.all(samples[3 * CHUNK:] == 4)
+
+
+def test_corrupt_record_is_replaced_by_silence(journal):
+    for value in (1, 2, 3):
+        journal.append(chunk(value))
+    journal.close()
+    with open(journal.path, "r+b") as f:
+        data = f.read()
+        # damage the payload of the second record
+        f.seek(data.index(chunk(2)) + 10)
+        f.write(b"\xff\xff")
+
+    stats = recover(journal.path)
+    samples = read_wav(stats["output"])
+
+    assert stats["corrupt_records"] == 1
+    assert stats["missing_records"] == 1
+    assert len(samples) == 3 * CHUNK
+    assert np.all(samples[CHUNK:2 * CHUNK] == 0)
+    assert np.all(samples[2 * CHUNK:] == 3)
+
+
+def test_unsigned_8_bit_silence(tmp_path):
+    journal = RecordingJournal(str(tmp_path / "u8.journal"), channels=2, rate=RATE,
+                               sample_format=pyaudio.paUInt8)
+    journal.append_silence(100)
+    journal.close()
+
+    info, records = read_journal(journal.path)
+    assert [(seq, frames, payload) for seq, _, frames, payload in records] == [(0, 100, b"")]
+    with wave.open(recover(journal.path)["output"], "rb") as wf:
+        assert wf.readframes(100) == b"\x80" * 200
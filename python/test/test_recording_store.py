@@ -0,0 +1,79 @@
+"""
+Tests for recording_store.py
+"""
+
+import wave
+
+import numpy as np
+import pyaudiowpatch as pyaudio
+
+from recording_store import RecordingStore
+
+
+def tone(frames, channels=2):
+    t = np.arange(frames) / 48000
+    samples = (np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16)
+    return np.repeat(samples[:, None], channels, axis=1)
+
+
+def test_slices_share_one_mapping(tmp_path):
+    with RecordingStore(str(tmp_path / "a.pcm"), 2, 48000, preallocate_seconds=1) as store:
+        data = tone(4800)
+        store.write(data.tobytes())
+        first = store.frame_slice(0, 100)
+        second = store.frame_slice(100, 4800)
+        assert first.base is second.base
+        np.testing.assert_array_equal(second, data[100:])
+
+
+def test_slices_follow_growth(tmp_path):
+    with RecordingStore(str(tmp_path / "a.pcm"), 2, 48000, preallocate_seconds=0.01) as store:
+        data = tone(48000)
+        for first in range(0, len(data), 1000):
+            store.write(data[first:first + 1000].tobytes())
+            np.testing.assert_array_equal(store.frame_slice(0, store.frames),
+                                          data[:store.frames])
+        assert store.lost_frames == 0
+
+
+def test_failed_growth_records_silence(tmp_path, monkeypatch):
+    store = RecordingStore(str(tmp_path / "a.pcm"), 2, 48000, preallocate_seconds=0.01)
+    store.write(tone(480).tobytes())
+
+    def refuse(size):
+        raise OSError("The requested operation cannot be performed on a mapped file")
+
+    monkeypatch.setattr(store._file, "truncate", refuse)
+    assert store.write(tone(1000).tobytes()) == 0
+    monkeypatch.undo()
+
+    assert store.lost_frames == 1000
+    assert store.frames == 480
+    assert store.timeline_frames == 1480
+    # the mapping survived and the store keeps working
+    store.write(tone(100).tobytes())
+    assert store.timeline_frames == 1580
+    store.close()
+
+
+def test_open_keeps_header_count(tmp_path):
+    path = str(tmp_path / "a.pcm")
+    store = RecordingStore(path, 2, 48000, preallocate_seconds=1)
+    store.write(tone(1000).tobytes())
+    store.flush()
+    # the writer crashed: the zeroed preallocated tail is still in the file
+    reopened = RecordingStore.open(path)
+    assert reopened.frames == 1000
+    store.close()
+
+
+def test_uint8_silence_is_midscale(tmp_path):
+    path = str(tmp_path / "a.pcm")
+    with RecordingStore(path, 1, 8000, sample_format=pyaudio.paUInt8) as store:
+        store.write(bytes([0x90] * 10))
+        store.add_silence(100)
+        store.write(bytes([0x70] * 10))
+        store.export_wav(str(tmp_path / "a.wav"))
+    with wave.open(str(tmp_path / "a.wav"), "rb") as wf:
+        frames = wf.readframes(wf.getnframes())
+    assert frames == bytes([0x90] * 10) + bytes([0x80] * 100) + bytes([0x70] * 10)
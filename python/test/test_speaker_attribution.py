@@ -0,0 +1,89 @@
+"""
+Tests for speaker_attribution.py
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from speaker_attribution import LOCAL, OVERLAP, REMOTE, SpeakerAttributor
+
+RATE = 16000
+
+# (start, end, mic amplitude, loopback amplitude) of the scripted speech
+SCRIPT = [
+    (1.0, 2.0, 0.1, 0.0),      # local
+    (2.1, 2.3, 0.0, 0.0),      # pause within the hangover
+    (2.5, 3.5, 0.0, 0.1),      # remote
+    (4.0, 5.0, 0.1, 0.1),      # overlap
+    (5.5, 6.5, 0.1, 0.01),     # local, remote leaking 20 dB lower
+    (7.0, 7.1, 0.0, 0.1),      # too short, discarded
+]
+
+
+def conversation(seconds=8.0):
+    """Tone bursts on a -80 dBFS noise floor, following SCRIPT"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    rng = np.random.default_rng(0)
+    mic = 1e-4 * rng.standard_normal(len(t))
+    loopback = 1e-4 * rng.standard_normal(len(t))
+    for start, end, mic_level, loopback_level in SCRIPT:
+        span = (t >= start) & (t < end)
+        mic[span] += mic_level * np.sin(2 * np.pi * 220 * t[span])
+        loopback[span] += loopback_level * np.sin(2 * np.pi * 330 * t[span])
+    return mic.astype(np.float32), loopback.astype(np.float32)
+
+
+def attribute(chunk, **kwargs):
+    mic, loopback = conversation()
+    attributor = SpeakerAttributor(RATE, **kwargs)
+    for first in range(0, len(mic), chunk):
+        attributor.feed(mic[first:first + chunk], loopback[first:first + chunk])
+    return attributor
+
+
+@pytest.mark.parametrize("chunk", [160, 1000, 16000])
+def test_segments_follow_the_louder_source(chunk):
+    segments = attribute(chunk).finish()
+    assert segments == [
+        {"start": 1.0, "end": 2.0, "speaker": LOCAL},
+        {"start": 2.5, "end": 3.5, "speaker": REMOTE},
+        {"start": 4.0, "end": 5.0, "speaker": OVERLAP},
+        {"start": 5.5, "end": 6.5, "speaker": LOCAL},
+    ]
+
+
+def test_long_pause_splits_a_segment():
+    rng = np.random.default_rng(1)
+    mic = (1e-4 * rng.standard_normal(4 * RATE)).astype(np.float32)
+    t = np.arange(RATE) / RATE
+    mic[RATE:2 * RATE] += 0.1 * np.sin(2 * np.pi * 220 * t)   # 1.0-2.0 s
+    mic[3 * RATE:] += 0.1 * np.sin(2 * np.pi * 220 * t)       # 3.0-4.0 s
+    loopback = np.zeros_like(mic)
+
+    bridged = SpeakerAttributor(RATE, hangover_seconds=1.0)
+    bridged.feed(mic, loopback)
+    split = SpeakerAttributor(RATE, hangover_seconds=0.3)
+    split.feed(mic, loopback)
+
+    assert bridged.finish() == [{"start": 1.0, "end": 4.0, "speaker": LOCAL}]
+    assert split.finish() == [{"start": 1.0, "end": 2.0, "speaker": LOCAL},
+                              {"start": 3.0, "end": 4.0, "speaker": LOCAL}]
+
+
+def test_manifest(tmp_path):
+    attributor = attribute(RATE)
+    path = attributor.write_manifest(tmp_path / "speakers.json")
+
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert manifest["rate"] == RATE
+    assert len(manifest["segments"]) == 4
+    assert manifest["speakers"] == {LOCAL: 2.0, REMOTE: 1.0, OVERLAP: 1.0}
+
+
+def test_length_mismatch_is_rejected():
+    attributor = SpeakerAttributor(RATE)
+    with pytest.raises(ValueError):
+        attributor.feed(np.zeros(160), np.zeros(161))